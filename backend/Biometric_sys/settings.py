@@ -161,3 +161,108 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Facial recognition
+
+# Seconds a room's embedding gallery stays cached before it is rebuilt from the database
+FACIAL_GALLERY_TTL = int(os.getenv("FACIAL_GALLERY_TTL", 300))
+
+# Nearest-neighbour index over every enrolled student, used to search students by image
+FACIAL_INDEX_PATH = os.getenv(
+    "FACIAL_INDEX_PATH", BASE_DIR / 'index' / 'students.npz')
+# Number of inverted lists visited per search, and the size from which lists are built
+FACIAL_INDEX_NPROBE = int(os.getenv("FACIAL_INDEX_NPROBE", 16))
+FACIAL_INDEX_MIN_TRAIN = int(os.getenv("FACIAL_INDEX_MIN_TRAIN", 1000))
+# Enrollment changes appended next to the saved index before a background task merges them into it
+FACIAL_INDEX_DELTA_MAX = int(os.getenv("FACIAL_INDEX_DELTA_MAX", 500))
+
+# Versioned gallery snapshots memory-mapped by every worker: directory, seconds a refresh waits after
+# a student changes so enrollment bursts export once, and hour of the daily export before exams
+FACIAL_SNAPSHOT_DIR = os.getenv(
+    "FACIAL_SNAPSHOT_DIR", BASE_DIR / 'index' / 'snapshots')
+FACIAL_SNAPSHOT_REFRESH_DELAY = int(os.getenv("FACIAL_SNAPSHOT_REFRESH_DELAY", 60))
+FACIAL_SNAPSHOT_HOUR = int(os.getenv("FACIAL_SNAPSHOT_HOUR", 5))
+
+# Load the facial recognition models when a WSGI worker starts instead of on the first face request
+FACIAL_WARMUP_ON_START = os.getenv("FACIAL_WARMUP_ON_START", "False") == "True"
+
+# Storage type of the embedding vectors written at enrollment ('float32' or 'float16')
+FACIAL_EMBEDDING_DTYPE = os.getenv("FACIAL_EMBEDDING_DTYPE", "float32")
+
+# Micro-batching of concurrent face embeddings: how long a batch waits for more faces (0 disables
+# batching) and the largest batch run in one forward pass
+FACIAL_BATCH_WINDOW_MS = float(os.getenv("FACIAL_BATCH_WINDOW_MS", 10))
+FACIAL_BATCH_MAX_SIZE = int(os.getenv("FACIAL_BATCH_MAX_SIZE", 16))
+
+# Embedding model tier: 'accurate' (FaceNet pretrained on VGGFace2) or 'fast' (a CPU graph written
+# by the export_fast_model command, TorchScript or .onnx, with the model version it was exported as).
+# Every embedding is stored with the version of its model and only embeddings of the configured
+# model are compared. A frozen export of FaceNet keeps its version and the enrolled embeddings,
+# a quantized one has its own version and requires enrolling the students again
+FACIAL_MODEL_TIER = os.getenv("FACIAL_MODEL_TIER", "accurate")
+FACIAL_FAST_MODEL_PATH = os.getenv(
+    "FACIAL_FAST_MODEL_PATH", BASE_DIR / 'models' / 'facenet-fast.pt')
+FACIAL_FAST_MODEL_VERSION = os.getenv("FACIAL_FAST_MODEL_VERSION", "facenet-vggface2")
+
+# CPU budget of every process running face inference. torch and TensorFlow default to one thread per
+# core, so several workers oversubscribe the machine: threads parallelizing one operation and running
+# independent operations (0 keeps the library defaults), and the largest number of detector and model
+# passes run at once, the others queueing for a slot (0 runs them all). Roughly, cores should cover
+# workers x FACIAL_MAX_CONCURRENT_INFERENCES x FACIAL_INTRA_OP_THREADS
+FACIAL_INTRA_OP_THREADS = int(os.getenv("FACIAL_INTRA_OP_THREADS", 0))
+FACIAL_INTER_OP_THREADS = int(os.getenv("FACIAL_INTER_OP_THREADS", 0))
+FACIAL_MAX_CONCURRENT_INFERENCES = int(os.getenv("FACIAL_MAX_CONCURRENT_INFERENCES", 0))
+
+# Shared inference server started with `manage.py run_inference_server`: the address web workers
+# reach it at, 'host:port' or the path of a Unix socket (empty runs inference in every web worker),
+# and the number of processes of the server running face inference, each loading the models once
+FACIAL_INFERENCE_ADDRESS = os.getenv("FACIAL_INFERENCE_ADDRESS", "")
+FACIAL_INFERENCE_WORKERS = int(os.getenv("FACIAL_INFERENCE_WORKERS", 1))
+
+# Cache of extraction results keyed by the digest of the submitted image, so resubmitted photos
+# skip detection and embedding: number of entries (0 disables it) and expiry in seconds (0 never)
+FACIAL_PROBE_CACHE_SIZE = int(os.getenv("FACIAL_PROBE_CACHE_SIZE", 256))
+FACIAL_PROBE_CACHE_TTL = float(os.getenv("FACIAL_PROBE_CACHE_TTL", 600))
+
+# Face detector backend: 'mtcnn' (TensorFlow mtcnn package) or 'torch' (facenet_pytorch MTCNN,
+# which keeps TensorFlow out of the process)
+FACIAL_DETECTOR = os.getenv("FACIAL_DETECTOR", "mtcnn")
+
+# Longest side of the downscaled copy of a photo that faces are detected on (0 detects on the full
+# photo). The face is still cropped from the full resolution photo.
+FACIAL_DETECT_MAX_SIDE = int(os.getenv("FACIAL_DETECT_MAX_SIDE", 1024))
+
+# Shortest side front JPEG photos are decoded at with reduced-resolution draft decoding (0 decodes
+# every pixel). Left and right photos are always decoded near the FaceNet input size.
+FACIAL_DECODE_MIN_SIDE = int(os.getenv("FACIAL_DECODE_MIN_SIDE", 720))
+
+# Quality gate rejecting unusable front captures before FaceNet inference: smallest face box side in
+# pixels, detector confidence, Laplacian variance sharpness and mean brightness range (0-255)
+FACIAL_QUALITY_GATE = os.getenv("FACIAL_QUALITY_GATE", "True") == "True"
+FACIAL_MIN_FACE_SIZE = int(os.getenv("FACIAL_MIN_FACE_SIZE", 80))
+FACIAL_MIN_DETECTION_CONFIDENCE = float(os.getenv("FACIAL_MIN_DETECTION_CONFIDENCE", 0.9))
+FACIAL_MIN_SHARPNESS = float(os.getenv("FACIAL_MIN_SHARPNESS", 40))
+FACIAL_MIN_BRIGHTNESS = float(os.getenv("FACIAL_MIN_BRIGHTNESS", 40))
+FACIAL_MAX_BRIGHTNESS = float(os.getenv("FACIAL_MAX_BRIGHTNESS", 220))
+
+# Burst captures: largest number of frames read from a burst or clip, number of best frames embedded
+# and fused, and the lead over the runner-up student that accepts a match before fusing more frames
+FACIAL_BURST_MAX_FRAMES = int(os.getenv("FACIAL_BURST_MAX_FRAMES", 8))
+FACIAL_BURST_BEST_FRAMES = int(os.getenv("FACIAL_BURST_BEST_FRAMES", 3))
+FACIAL_BURST_MARGIN = float(os.getenv("FACIAL_BURST_MARGIN", 0.05))
+
+# Representation of the templates held by the student index: 'none' (float32), 'float16' or 'int8'
+# (scaled per template). Quantized candidates are scored on the compact form and the best
+# FACIAL_INDEX_RERANK of them are re-scored against their float32 templates
+FACIAL_INDEX_QUANTIZATION = os.getenv("FACIAL_INDEX_QUANTIZATION", "none")
+FACIAL_INDEX_RERANK = int(os.getenv("FACIAL_INDEX_RERANK", 32))
+
+# Admission control of the face endpoints of every worker: requests beyond FACIAL_ADMISSION_MAX_QUEUE
+# running at once, or expected to wait longer than FACIAL_ADMISSION_MAX_WAIT seconds, are answered at
+# once with Retry-After (503 for attendance, 429 for searches, which are shed at half the limits).
+# The queue is counted per process, so it needs threaded workers (gunicorn --threads, or the gthread
+# worker class): a sync worker serves one request at a time and never sees a queue to shed
+FACIAL_ADMISSION_CONTROL = os.getenv("FACIAL_ADMISSION_CONTROL", "True") == "True"
+FACIAL_ADMISSION_MAX_QUEUE = int(os.getenv("FACIAL_ADMISSION_MAX_QUEUE", 16))
+FACIAL_ADMISSION_MAX_WAIT = float(os.getenv("FACIAL_ADMISSION_MAX_WAIT", 8))
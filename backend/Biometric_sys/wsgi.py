@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Biometric_sys.settings')
 
 application = get_wsgi_application()
+
+# Load the facial recognition models and map the gallery snapshot before the worker serves its first request
+from django.conf import settings  # noqa: E402
+
+if settings.FACIAL_WARMUP_ON_START:
+    from facial import warm_up  # noqa: E402
+    from utils.gallery_snapshot import get_snapshot  # noqa: E402
+
+    warm_up()
+    get_snapshot()
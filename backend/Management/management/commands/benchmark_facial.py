@@ -0,0 +1,384 @@
+import os
+import time
+import numpy as np
+from io import BytesIO
+from PIL import Image
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from utils.face_detectors import DETECTORS, create_detector, detect_faces_downscaled
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def time_call(function, repeat: int) -> float:
+    """
+    Time a function call.
+
+    Args:
+        function (callable): The function to call without arguments.
+        repeat (int): The number of timed calls.
+
+    Returns:
+        float: The median duration of a call in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started_at)
+    return 1000 * float(np.median(durations))
+
+
+def box_iou(first: list[int], second: list[int]) -> float:
+    """
+    Compute the intersection over union of two [x, y, width, height] boxes.
+
+    Args:
+        first (list[int]): The first box.
+        second (list[int]): The second box.
+
+    Returns:
+        float: The intersection over union, between 0 and 1.
+    """
+    x1, y1 = max(first[0], second[0]), max(first[1], second[1])
+    x2 = min(first[0] + first[2], second[0] + second[2])
+    y2 = min(first[1] + first[3], second[1] + second[3])
+    intersection = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = first[2] * first[3] + second[2] * second[3] - intersection
+    return intersection / union if union else 0.0
+
+
+class Command(BaseCommand):
+    help = "Benchmark stages of the facial recognition pipeline on sample images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['detectors', 'downscale', 'stages', 'recall', 'preprocess',
+                                              'tiers'],
+                            help="detectors: compare the face detector backends, "
+                                 "downscale: compare detection on downscaled copies with the full photo, "
+                                 "stages: time every stage of the extraction of a front photo, "
+                                 "recall: compare the quantized student index with the float32 one "
+                                 "on the enrolled students, "
+                                 "preprocess: compare the batch buffer preprocessing with torchvision "
+                                 "on synthetic face crops, "
+                                 "tiers: time every embedding model tier on this machine")
+        parser.add_argument('images', nargs='*',
+                            help="Sample image files or directories of sample images")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of timed runs per image")
+        parser.add_argument('--detector', default=settings.FACIAL_DETECTOR, choices=list(DETECTORS),
+                            help="Face detector backend of the downscale and stages suites")
+        parser.add_argument('--max-side', type=int, nargs='+', default=[640, 1024],
+                            help="Longest sides compared by the downscale suite")
+        parser.add_argument('--samples', type=int, default=500,
+                            help="Number of enrolled students queried by the recall suite")
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 16],
+                            help="Numbers of faces preprocessed or embedded together by the "
+                                 "preprocess and tiers suites")
+
+    def handle(self, *args, **options):
+        images = []
+        if options['suite'] not in ('recall', 'preprocess', 'tiers'):
+            images = self.load_images(options['images'])
+            if not images:
+                raise CommandError("No sample images found")
+            self.stdout.write(f"{len(images)} sample images, {options['repeat']} runs each")
+        getattr(self, f"benchmark_{options['suite']}")(images, options)
+
+    def load_images(self, paths):
+        """
+        Read the sample images.
+
+        Args:
+            paths (list[str]): Image files or directories of image files.
+
+        Returns:
+            list[tuple[str, bytes]]: The name and content of every image.
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files += [os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(IMAGE_EXTENSIONS)]
+            else:
+                files.append(path)
+
+        images = []
+        for file_path in files:
+            with open(file_path, 'rb') as image_file:
+                images.append((os.path.basename(file_path), image_file.read()))
+        return images
+
+    def decode(self, images):
+        """
+        Decode the sample images into RGB arrays.
+
+        Args:
+            images (list[tuple[str, bytes]]): The sample images.
+
+        Returns:
+            list[np.ndarray]: The RGB array of every image.
+        """
+        return [np.array(Image.open(BytesIO(content)).convert('RGB'))
+                for _, content in images]
+
+    def benchmark_detectors(self, images, options):
+        """
+        Compare the latency and the boxes of every face detector backend.
+
+        Args:
+            images (list[tuple[str, bytes]]): The sample images.
+            options (dict): The command options.
+        """
+        arrays = self.decode(images)
+        boxes = {}
+
+        self.stdout.write(f"{'backend':<10}{'load s':>10}{'ms/image':>12}{'faces':>8}")
+        for name in DETECTORS:
+            started_at = time.perf_counter()
+            detector = create_detector(name)
+            detector.detect_faces(arrays[0])
+            load_time = time.perf_counter() - started_at
+
+            durations = []
+            boxes[name] = []
+            for array in arrays:
+                durations.append(time_call(
+                    lambda: detector.detect_faces(array), options['repeat']))
+                detections = detector.detect_faces(array)
+                boxes[name].append(detections[0]['box'] if detections else None)
+
+            found = sum(box is not None for box in boxes[name])
+            self.stdout.write(
+                f"{name:<10}{load_time:>10.2f}{np.mean(durations):>12.1f}{found:>8}")
+
+        # Agreement of the first face box of every backend with the TensorFlow reference
+        reference = boxes.pop('mtcnn')
+        for name, candidate in boxes.items():
+            ious = [box_iou(first, second) for first, second in zip(reference, candidate)
+                    if first is not None and second is not None]
+            if ious:
+                self.stdout.write(
+                    f"{name} vs mtcnn: mean box IoU {np.mean(ious):.3f}, "
+                    f"{np.mean(np.array(ious) > 0.5):.0%} of faces with IoU > 0.5")
+
+    def benchmark_downscale(self, images, options):
+        """
+        Compare face detection on downscaled copies of the photos with the full resolution photos.
+
+        Args:
+            images (list[tuple[str, bytes]]): The sample images.
+            options (dict): The command options.
+        """
+        arrays = self.decode(images)
+        megapixels = np.mean([array.shape[0] * array.shape[1] for array in arrays]) / 1e6
+        self.stdout.write(f"Mean photo size {megapixels:.1f} MP, detector '{options['detector']}'")
+
+        detector = create_detector(options['detector'])
+        detector.detect_faces(arrays[0])
+
+        results = {}
+        for max_side in [0, *options['max_side']]:
+            durations = []
+            boxes = []
+            for array in arrays:
+                durations.append(time_call(
+                    lambda: detect_faces_downscaled(detector, array, max_side), options['repeat']))
+                detections = detect_faces_downscaled(detector, array, max_side)
+                boxes.append(detections[0]['box'] if detections else None)
+            results[max_side] = (np.mean(durations), boxes)
+
+        full_duration, full_boxes = results[0]
+        self.stdout.write(
+            f"{'max side':<10}{'ms/image':>12}{'speedup':>10}{'faces':>8}{'box IoU':>10}")
+        for max_side, (duration, boxes) in results.items():
+            ious = [box_iou(first, second) for first, second in zip(full_boxes, boxes)
+                    if first is not None and second is not None]
+            found = sum(box is not None for box in boxes)
+            self.stdout.write(
+                f"{max_side or 'full':<10}{duration:>12.1f}{full_duration / duration:>9.1f}x"
+                f"{found:>8}{np.mean(ious) if ious else 0:>10.3f}")
+
+    def benchmark_stages(self, images, options):
+        """
+        Time every stage of the extraction of a front photo, comparing full and draft decoding.
+
+        Args:
+            images (list[tuple[str, bytes]]): The sample images.
+            options (dict): The command options.
+        """
+        from facial import FacialRecognition
+
+        engine = FacialRecognition(
+            detector=options['detector'],
+            detect_max_side=settings.FACIAL_DETECT_MAX_SIDE,
+            decode_min_side=settings.FACIAL_DECODE_MIN_SIDE)
+        repeat = options['repeat']
+
+        stages = {name: [] for name in
+                  ['decode (full)', 'decode (draft)', 'detect', 'preprocess', 'embed']}
+        for _, content in images:
+            stages['decode (full)'].append(time_call(
+                lambda: np.array(Image.open(BytesIO(content)).convert('RGB')), repeat))
+            stages['decode (draft)'].append(time_call(
+                lambda: np.asarray(engine.decode_image(content, engine.decode_min_side)), repeat))
+
+            array = np.asarray(engine.decode_image(content, engine.decode_min_side))
+            engine.detect_and_align_face(array)
+            stages['detect'].append(time_call(
+                lambda: engine.detect_and_align_face(array), repeat))
+
+            face = engine.detect_and_align_face(array)
+            if face is None:
+                self.stdout.write(self.style.WARNING("No face detected, skipping the later stages"))
+                continue
+            stages['preprocess'].append(time_call(
+                lambda: engine.preprocess_batch([face]), repeat))
+
+            face_tensor = engine.preprocess_batch([face])[0][1].clone()
+            engine.forward_batch([face_tensor])
+            stages['embed'].append(time_call(
+                lambda: engine.forward_batch([face_tensor]), repeat))
+
+        self.stdout.write(
+            f"Decoding front photos at a shortest side of {engine.decode_min_side or 'full'}, "
+            f"detecting at a longest side of {engine.detect_max_side or 'full'}")
+        self.stdout.write(f"{'stage':<16}{'ms/image':>12}")
+        for name, durations in stages.items():
+            if durations:
+                self.stdout.write(f"{name:<16}{np.mean(durations):>12.1f}")
+
+    def benchmark_recall(self, images, options):
+        """
+        Compare the search results of quantized student indexes with the float32 index.
+
+        Every sampled student is searched with its stored front embedding.
+
+        Args:
+            images (list[tuple[str, bytes]]): Unused.
+            options (dict): The command options.
+        """
+        from utils.gallery import load_feature_lists, load_templates
+        from utils.student_index import StudentIndex
+
+        templates = load_templates()
+        if not templates:
+            raise CommandError("No enrolled students")
+        ids = list(templates)
+        matrix = np.stack(list(templates.values())).astype(np.float32)
+        fetch = lambda student_ids: {student_id: templates[student_id] for student_id in student_ids}
+
+        rng = np.random.default_rng(0)
+        sampled = rng.choice(ids, min(options['samples'], len(ids)), replace=False).tolist()
+        fronts = {student_id: next(entry['features'] for entry in entries if entry['side'] == 'front')
+                  for student_id, entries in load_feature_lists(sampled).items()
+                  if any(entry['side'] == 'front' for entry in entries)}
+        self.stdout.write(f"{len(ids)} students, {len(fronts)} queries")
+
+        indexes = {}
+        for quantization in ['none', 'float16', 'int8']:
+            index = StudentIndex(dim=matrix.shape[1], quantization=quantization, fetch_templates=fetch)
+            index.build(ids, matrix)
+            indexes[quantization] = index
+
+        reference = {student_id: [result for result, _ in indexes['none'].search(probe, k=5)]
+                     for student_id, probe in fronts.items()}
+
+        self.stdout.write(f"{'index':<10}{'MB':>8}{'ms/query':>10}{'recall@1':>10}{'recall@5':>10}")
+        for quantization, index in indexes.items():
+            started_at = time.perf_counter()
+            results = {student_id: [result for result, _ in index.search(probe, k=5)]
+                       for student_id, probe in fronts.items()}
+            duration = 1000 * (time.perf_counter() - started_at) / max(len(fronts), 1)
+
+            recall_1 = np.mean([results[student_id][:1] == reference[student_id][:1]
+                                for student_id in fronts])
+            recall_5 = np.mean([len(set(results[student_id]) & set(reference[student_id]))
+                                / max(len(reference[student_id]), 1) for student_id in fronts])
+            memory = (index.templates.nbytes + index.scales.nbytes) / 1e6
+            self.stdout.write(
+                f"{quantization:<10}{memory:>8.1f}{duration:>10.2f}{recall_1:>10.3f}{recall_5:>10.3f}")
+
+    def benchmark_preprocess(self, images, options):
+        """
+        Compare the batch buffer preprocessing with the torchvision Resize, ToTensor and
+        Normalize pipeline it replaced.
+
+        Faces are synthetic crops with the varied sizes of detected face boxes.
+
+        Args:
+            images (list[tuple[str, bytes]]): Unused.
+            options (dict): The command options.
+        """
+        import torch
+        import torchvision.transforms as transforms
+        from facial import FacialRecognition
+        from utils.face_preprocessing import FaceBatchBuffer
+
+        size = FacialRecognition.INPUT_SIZE
+        compose = transforms.Compose([
+            transforms.Resize(size),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5]),
+        ])
+        buffer = FaceBatchBuffer(size, max(options['batch_sizes']))
+        rng = np.random.default_rng(0)
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'faces':<8}{'torchvision ms':>16}{'shapes':>8}{'buffer ms':>12}{'speedup':>9}")
+        for batch_size in options['batch_sizes']:
+            faces = [rng.integers(0, 256, size=(int(height), int(width), 3), dtype=np.uint8)
+                     for height, width in rng.integers(120, 400, size=(batch_size, 2))]
+
+            def torchvision_batch():
+                return [compose(Image.fromarray(face)).unsqueeze(0) for face in faces]
+
+            def buffer_batch():
+                return [torch.from_numpy(batch) for _, batch in buffer.fill(faces)]
+
+            torchvision_batch(), buffer_batch()
+            shapes = len({tuple(tensor.shape) for tensor in torchvision_batch()})
+            torchvision_duration = time_call(torchvision_batch, repeat)
+            buffer_duration = time_call(buffer_batch, repeat)
+            self.stdout.write(
+                f"{batch_size:<8}{torchvision_duration:>16.2f}{shapes:>8}{buffer_duration:>12.2f}"
+                f"{torchvision_duration / buffer_duration:>8.1f}x")
+
+    def benchmark_tiers(self, images, options):
+        """
+        Time the embedding models of every tier, and compare their embeddings with the accurate tier.
+
+        Tiers whose model cannot be loaded are reported and skipped.
+
+        Args:
+            images (list[tuple[str, bytes]]): Unused.
+            options (dict): The command options.
+        """
+        import torch
+        from utils.embedding_models import MODEL_TIERS, create_embedding_model
+
+        torch.manual_seed(0)
+        batches = {batch_size: torch.rand(batch_size, 3, 160, 160) * 2 - 1
+                   for batch_size in options['batch_sizes']}
+        repeat = options['repeat']
+
+        self.stdout.write(f"{torch.get_num_threads()} torch threads")
+        self.stdout.write(f"{'tier':<10}{'version':<28}{'faces':>6}{'ms/batch':>10}{'ms/face':>9}{'cosine':>8}")
+        reference = {}
+        for tier in MODEL_TIERS:
+            try:
+                model = create_embedding_model(tier)
+            except Exception as error:
+                self.stdout.write(self.style.WARNING(f"{tier:<10}skipped: {error}"))
+                continue
+
+            for batch_size, batch in batches.items():
+                embeddings = model(batch)
+                duration = time_call(lambda: model(batch), repeat)
+                embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+                reference.setdefault(batch_size, embeddings)
+                # Agreement with the first tier, 1.0 for identical embeddings
+                cosine = float(np.mean(np.sum(embeddings * reference[batch_size], axis=1)))
+                self.stdout.write(
+                    f"{tier:<10}{model.version:<28}{batch_size:>6}{duration:>10.1f}"
+                    f"{duration / batch_size:>9.2f}{cosine:>8.4f}")
@@ -0,0 +1,325 @@
+import os
+import time
+import pandas as pd
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from Management.models import Student, StudentEmbedding
+from facial import FacialRecognition, engine_settings
+from utils.embedding_models import model_version
+from utils.gallery import invalidate_all
+from utils.gallery_snapshot import export_snapshot
+from utils.inference_pool import InferencePool
+from utils.student_index import rebuild_student_index
+
+SIDES = ['left', 'right', 'front']
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+
+
+class Command(BaseCommand):
+    help = (
+        "Enroll many students at once from a directory tree or a CSV manifest. "
+        "A directory holds one folder per student named <STUDENT_ID> or <STUDENT_ID>_<STUDENT_NAME> "
+        "with left, right and front images. A CSV manifest has the columns student_id, "
+        "student_name, student_batch, left, right and front, image paths being relative to the CSV. "
+        "--reembed also stores embeddings of the current model for students enrolled with another one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Directory tree or CSV manifest of the students to enroll")
+        parser.add_argument('--batch', help="STUDENT_BATCH of the students of a directory tree")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of extraction processes")
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help="Number of students written per bulk insert")
+        parser.add_argument('--checkpoint',
+                            help="Checkpoint file (defaults to <source>.checkpoint)")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Retry students that failed in a previous run")
+        parser.add_argument('--reembed', action='store_true',
+                            help="Embed enrolled students that have no embeddings of the current "
+                                 "model version (checkpoint defaults to <source>.<version>.checkpoint)")
+
+    def handle(self, *args, **options):
+        source = os.path.abspath(options['source'])
+        # Re-embedding has its own checkpoint, the enrollment one lists every student as done
+        suffix = f".{model_version()}.checkpoint" if options['reembed'] else ".checkpoint"
+        checkpoint_path = options['checkpoint'] or f"{source.rstrip(os.sep)}{suffix}"
+
+        if os.path.isdir(source):
+            if not options['batch']:
+                raise CommandError("--batch is required when enrolling from a directory")
+            records = self.read_directory(source, options['batch'])
+        elif source.endswith('.csv'):
+            records = self.read_manifest(source)
+        else:
+            raise CommandError(f"{source} is neither a directory nor a CSV manifest")
+
+        records, duplicates = self.split_duplicates(records)
+        failures = Counter()
+        if duplicates:
+            failures['duplicate_student_id'] += len(duplicates)
+            self.stdout.write(self.style.WARNING(
+                f"Skipping repeated student IDs: {', '.join(sorted(set(duplicates)))}"))
+
+        # Resume: skip students already enrolled or, unless retried, already failed. Re-embedding
+        # only skips the students that have embeddings of the current version.
+        done = self.read_checkpoint(checkpoint_path, options['retry_failed'])
+        existing = set(Student.objects.values_list('STUDENT_ID', flat=True))
+        if options['reembed']:
+            done |= set(StudentEmbedding.objects.filter(
+                MODEL_VERSION=model_version(), SIDE=StudentEmbedding.Side.FUSED,
+            ).values_list('STUDENT_ID', flat=True))
+        else:
+            done |= existing
+        pending = self.pending_records(records, done)
+        self.stdout.write(
+            f"{len(records)} students found, {len(records) - len(pending)} already processed, "
+            f"{len(pending)} to enroll with {options['workers']} workers")
+
+        # Same detector, downscaling and quality gate as the web workers. Every worker gets its
+        # share of the cores instead of one thread per core, and enrollment images are neither
+        # resubmitted nor concurrent within a worker, so there is no probe cache or batching window
+        engine_kwargs = engine_settings()
+        engine_kwargs.update({
+            'batch_window_ms': 0,
+            'cache_size': 0,
+            'intra_op_threads': max((os.cpu_count() or 1) // options['workers'], 1),
+            'inter_op_threads': 1,
+        })
+        pool = InferencePool(options['workers'], engine_kwargs)
+        enrolled = 0
+        images = 0
+        buffer = []
+        started_at = time.monotonic()
+
+        try:
+            with open(checkpoint_path, 'a') as checkpoint:
+                in_flight = {}
+                queued = iter(pending)
+                while True:
+                    # Keep a bounded number of students in flight so images are not all held in memory
+                    while len(in_flight) < 4 * options['workers']:
+                        record = next(queued, None)
+                        if record is None:
+                            break
+                        items, reason = self.read_images(record)
+                        if reason:
+                            failures[reason] += 1
+                            checkpoint.write(f"{record['student_id']}\t{reason}\n")
+                            continue
+                        in_flight[pool.submit('extract_features_batch', items)] = record
+
+                    if not in_flight:
+                        break
+
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record = in_flight.pop(future)
+                        images += len(SIDES)
+                        try:
+                            results = future.result()
+                        except Exception:
+                            results = [(None, 'inference_failed')]
+
+                        reason = next((error for _, error in results if error), None)
+                        if reason:
+                            failures[reason] += 1
+                            checkpoint.write(f"{record['student_id']}\t{reason}\n")
+                            continue
+
+                        buffer.append((record, results))
+                        if len(buffer) >= options['chunk_size']:
+                            enrolled += self.write_chunk(buffer, checkpoint, existing)
+                            buffer = []
+
+                enrolled += self.write_chunk(buffer, checkpoint, existing)
+        finally:
+            pool.shutdown()
+
+        if enrolled:
+            # Bulk inserts bypass the model signals, so the search index and snapshot are rebuilt
+            # once and the room galleries of every worker are dropped
+            rebuild_student_index()
+            export_snapshot()
+            invalidate_all()
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(
+            f"Enrolled {enrolled} students from {images} images in {elapsed:.1f}s "
+            f"({images / elapsed if elapsed else 0:.1f} images/s)"))
+        for reason, count in failures.most_common():
+            self.stdout.write(self.style.WARNING(f"{count} students failed: {reason}"))
+
+    def read_directory(self, source, batch):
+        """
+        List the students of a directory tree.
+
+        Args:
+            source (str): The root directory.
+            batch (str): The STUDENT_BATCH of every student.
+
+        Returns:
+            list[dict]: The student records with the image path of each side.
+        """
+        records = []
+        for folder in sorted(os.listdir(source)):
+            path = os.path.join(source, folder)
+            if not os.path.isdir(path):
+                continue
+            student_id, _, student_name = folder.partition('_')
+            record = {
+                'student_id': student_id,
+                'student_name': student_name.replace('_', ' ') or student_id,
+                'student_batch': batch,
+            }
+            for side in SIDES:
+                record[side] = next(
+                    (os.path.join(path, side + extension) for extension in IMAGE_EXTENSIONS
+                     if os.path.exists(os.path.join(path, side + extension))), None)
+            records.append(record)
+        return records
+
+    def read_manifest(self, source):
+        """
+        List the students of a CSV manifest.
+
+        Args:
+            source (str): The CSV file.
+
+        Returns:
+            list[dict]: The student records with the image path of each side.
+        """
+        data = pd.read_csv(source, dtype=str)
+        required_columns = {'student_id', 'student_name', 'student_batch', *SIDES}
+        if not required_columns.issubset(data.columns):
+            missing_columns = required_columns - set(data.columns)
+            raise CommandError(f"Missing columns: {', '.join(missing_columns)}")
+
+        root = os.path.dirname(source)
+        records = data[list(required_columns)].to_dict('records')
+        for record in records:
+            for side in SIDES:
+                if isinstance(record[side], str):
+                    record[side] = os.path.join(root, record[side])
+                else:
+                    record[side] = None
+        return records
+
+    def split_duplicates(self, records):
+        """
+        Keep the first record of every student ID.
+
+        Args:
+            records (list[dict]): The student records.
+
+        Returns:
+            tuple[list[dict], list[str]]: The records with unique IDs, and the IDs of the
+                repeated records left out.
+        """
+        unique = {}
+        duplicates = []
+        for record in records:
+            if record['student_id'] in unique:
+                duplicates.append(record['student_id'])
+            else:
+                unique[record['student_id']] = record
+        return list(unique.values()), duplicates
+
+    def pending_records(self, records, done):
+        """
+        List the students still to enroll.
+
+        Args:
+            records (list[dict]): The student records.
+            done (set[str]): The IDs of the students to skip.
+
+        Returns:
+            list[dict]: The records of the other students.
+        """
+        return [record for record in records if record['student_id'] not in done]
+
+    def read_checkpoint(self, checkpoint_path, retry_failed):
+        """
+        Read the students processed by previous runs.
+
+        Args:
+            checkpoint_path (str): The checkpoint file.
+            retry_failed (bool): Whether failed students are processed again.
+
+        Returns:
+            set[str]: The IDs of the students to skip.
+        """
+        if not os.path.exists(checkpoint_path):
+            return set()
+        done = set()
+        with open(checkpoint_path) as checkpoint:
+            for line in checkpoint:
+                student_id, _, outcome = line.rstrip('\n').partition('\t')
+                if outcome == 'enrolled' or not retry_failed:
+                    done.add(student_id)
+        return done
+
+    def read_images(self, record):
+        """
+        Read the image of every side of a student.
+
+        Args:
+            record (dict): The student record.
+
+        Returns:
+            tuple[list[tuple[bytes, str]], str]: The (image bytes, side) pairs, and a
+                failure reason if an image is missing.
+        """
+        items = []
+        for side in SIDES:
+            if not record[side] or not os.path.exists(record[side]):
+                return [], 'missing_image'
+            with open(record[side], 'rb') as image_file:
+                items.append((image_file.read(), side))
+        return items, None
+
+    def write_chunk(self, buffer, checkpoint, existing=frozenset()):
+        """
+        Insert a chunk of students and their embeddings, then checkpoint them.
+
+        Args:
+            buffer (list[tuple[dict, list]]): The student records and their extraction results.
+            checkpoint (file): The open checkpoint file.
+            existing (set[str]): The IDs of enrolled students, whose rows are kept and only
+                get embeddings.
+
+        Returns:
+            int: The number of students written.
+        """
+        if not buffer:
+            return 0
+
+        students = []
+        embeddings = []
+        dtype = settings.FACIAL_EMBEDDING_DTYPE
+        for record, results in buffer:
+            student = Student(
+                STUDENT_ID=record['student_id'],
+                STUDENT_NAME=record['student_name'],
+                STUDENT_BATCH=record['student_batch'],
+            )
+            students.append(student)
+            embeddings += StudentEmbedding.build(
+                student,
+                [{'side': side, 'features': features, 'weight': FacialRecognition.side_weight(side)}
+                 for side, (features, _) in zip(SIDES, results)],
+                model_version(), dtype)
+
+        with transaction.atomic():
+            Student.objects.bulk_create(
+                [student for student in students if student.STUDENT_ID not in existing])
+            StudentEmbedding.objects.bulk_create(embeddings)
+
+        for record, _ in buffer:
+            checkpoint.write(f"{record['student_id']}\tenrolled\n")
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+        return len(buffer)
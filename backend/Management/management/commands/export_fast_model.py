@@ -0,0 +1,59 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from utils.embedding_models import FaceNetModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Export FaceNet as the CPU graph of the 'fast' model tier. The TorchScript export is frozen "
+        "and optimized for inference, keeping the FaceNet model version so enrolled students need "
+        "no new embeddings. --quantize also stores the fully connected layers as int8, under its "
+        "own model version. A path ending in .onnx writes an ONNX graph for ONNX Runtime instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.FACIAL_FAST_MODEL_PATH),
+                            help="Destination of the graph (defaults to FACIAL_FAST_MODEL_PATH)")
+        parser.add_argument('--quantize', action='store_true',
+                            help="Quantize the fully connected layers to int8 (TorchScript only)")
+        parser.add_argument('--model-version',
+                            help="Version stored with the embeddings of the graph")
+
+    def handle(self, *args, **options):
+        import torch
+
+        output = options['output']
+        onnx = output.endswith('.onnx')
+        if onnx and options['quantize']:
+            raise CommandError("--quantize is only supported for TorchScript graphs")
+        version = options['model_version'] or (
+            f"{FaceNetModel.version}-int8" if options['quantize'] else FaceNetModel.version)
+
+        model = FaceNetModel().model
+        if options['quantize']:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        example = torch.zeros(1, 3, 160, 160)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with torch.no_grad():
+            if onnx:
+                import onnx as onnx_format
+
+                torch.onnx.export(model, example, output, input_names=['faces'],
+                                  output_names=['embeddings'],
+                                  # Faces keep their aspect ratio, so their height and width vary
+                                  dynamic_axes={'faces': {0: 'batch', 2: 'height', 3: 'width'},
+                                                'embeddings': {0: 'batch'}})
+                graph = onnx_format.load(output)
+                graph.metadata_props.add(key='model_version', value=version)
+                onnx_format.save(graph, output)
+            else:
+                graph = torch.jit.optimize_for_inference(
+                    torch.jit.freeze(torch.jit.trace(model, example)))
+                torch.jit.save(graph, output, _extra_files={'model_version': version})
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {version} to {output}"))
+        self.stdout.write(
+            f"Set FACIAL_MODEL_TIER=fast, FACIAL_FAST_MODEL_PATH={output} and "
+            f"FACIAL_FAST_MODEL_VERSION={version} to use it")
@@ -0,0 +1,20 @@
+import os
+from django.core.management.base import BaseCommand
+from utils.gallery_snapshot import GallerySnapshot, export_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the embeddings of every enrolled student to a versioned gallery snapshot that "
+        "the workers memory-map. Run it before exam sessions to publish a fresh snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=2,
+                            help="Number of snapshots kept on disk, the new one included")
+
+    def handle(self, *args, **options):
+        path = export_snapshot(keep=max(options['keep'], 1))
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {len(GallerySnapshot(path))} students ({size / 1e6:.1f} MB) to {path}"))
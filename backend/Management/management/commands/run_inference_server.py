@@ -0,0 +1,45 @@
+import os
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from facial import engine_settings
+from utils.inference_pool import InferencePool, InferenceServer, parse_address
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the face inference server shared by every web worker of the machine. It starts "
+        "FACIAL_INFERENCE_WORKERS processes that each load the models once, and serves them at "
+        "FACIAL_INFERENCE_ADDRESS, where web workers connect instead of loading their own models."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=settings.FACIAL_INFERENCE_ADDRESS,
+                            help="'host:port' or Unix socket path to listen on "
+                                 "(defaults to FACIAL_INFERENCE_ADDRESS)")
+        parser.add_argument('--workers', type=int, default=settings.FACIAL_INFERENCE_WORKERS,
+                            help="Number of inference processes (defaults to FACIAL_INFERENCE_WORKERS)")
+
+    def handle(self, *args, **options):
+        address = options['address']
+        if not address:
+            raise CommandError("Set FACIAL_INFERENCE_ADDRESS or pass --address")
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        # A socket file left behind by a previous server would make the bind fail
+        if isinstance(parse_address(address), str) and os.path.exists(address):
+            os.unlink(address)
+
+        pool = InferencePool(options['workers'], engine_settings())
+        server = InferenceServer(pool, address, settings.SECRET_KEY.encode())
+        signal.signal(signal.SIGTERM, lambda *_: server.close())
+        try:
+            pool.warm_up()
+            self.stdout.write(self.style.SUCCESS(
+                f"Serving {options['workers']} inference workers at {address}"))
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.close()
+        finally:
+            pool.shutdown()
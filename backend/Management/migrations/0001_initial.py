@@ -0,0 +1,73 @@
+# Generated by Django 5.1 on 2026-10-18 09:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('COURSE_CODE', models.CharField()),
+                ('COURSE_NAME', models.CharField(max_length=100)),
+                ('TERM', models.CharField(default='SPRING', max_length=25)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExaminerMobile',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('EXAMINER_NAME', models.CharField(max_length=100)),
+                ('EXAMINER_PHONE', models.CharField(max_length=13)),
+                ('ACTIVE', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ROOM_NO', models.CharField()),
+                ('EXAM_TIME', models.CharField(choices=[('MORNING', 'Morning'), ('MIDDAY', 'Midday'), ('AFTERNOON', 'Afternoon')], max_length=50)),
+                ('STUDENT_LIST', models.JSONField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Student',
+            fields=[
+                ('STUDENT_ID', models.CharField(primary_key=True, serialize=False, unique=True)),
+                ('STUDENT_NAME', models.CharField(max_length=100)),
+                ('STUDENT_BATCH', models.CharField(max_length=8)),
+                ('STUDENT_EXTRACTED_FEATURES', models.JSONField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Exam',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('EXAM_DATE', models.DateField()),
+                ('EXAM_TIME', models.TimeField()),
+                ('EXAM_DURATION', models.IntegerField()),
+                ('EXAM_TYPE', models.CharField(choices=[('MIDTERM', 'Midterm'), ('FINAL', 'Final')], max_length=50)),
+                ('COURSE_CODE', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exams', to='Management.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Attendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ATTENDANCE_STATUS', models.BooleanField(default=False)),
+                ('EXAM_ID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendances', to='Management.exam')),
+                ('ROOM_NO', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendances', to='Management.room')),
+                ('STUDENT_ID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendances', to='Management.student')),
+            ],
+        ),
+    ]
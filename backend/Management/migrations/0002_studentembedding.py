@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='student',
+            name='STUDENT_EXTRACTED_FEATURES',
+            field=models.JSONField(null=True),
+        ),
+        migrations.CreateModel(
+            name='StudentEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('SIDE', models.CharField(choices=[('front', 'Front'), ('left', 'Left'), ('right', 'Right')], max_length=10)),
+                ('VECTOR', models.BinaryField()),
+                ('DTYPE', models.CharField(default='float32', max_length=10)),
+                ('MODEL_VERSION', models.CharField(max_length=50)),
+                ('STUDENT_ID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='Management.student')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('STUDENT_ID', 'SIDE', 'MODEL_VERSION'), name='unique_student_side_model')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+import json
+import numpy as np
+from django.db import migrations
+
+# Version tag of the embeddings produced before per-model tagging existed
+MODEL_VERSION = 'facenet-vggface2'
+
+
+def features_to_embeddings(apps, schema_editor):
+    Student = apps.get_model('Management', 'Student')
+    StudentEmbedding = apps.get_model('Management', 'StudentEmbedding')
+
+    embeddings = []
+    for student in Student.objects.exclude(STUDENT_EXTRACTED_FEATURES=None).iterator():
+        extracted_features = student.STUDENT_EXTRACTED_FEATURES
+        if isinstance(extracted_features, str):
+            extracted_features = json.loads(extracted_features)
+
+        for entry in extracted_features or []:
+            if not entry.get('features'):
+                continue
+            embeddings.append(StudentEmbedding(
+                STUDENT_ID=student,
+                SIDE=entry['side'],
+                VECTOR=np.asarray(entry['features'], dtype='float32').tobytes(),
+                DTYPE='float32',
+                MODEL_VERSION=MODEL_VERSION,
+            ))
+
+        if len(embeddings) >= 1000:
+            StudentEmbedding.objects.bulk_create(embeddings)
+            embeddings = []
+
+    StudentEmbedding.objects.bulk_create(embeddings)
+
+
+def embeddings_to_features(apps, schema_editor):
+    Student = apps.get_model('Management', 'Student')
+    StudentEmbedding = apps.get_model('Management', 'StudentEmbedding')
+
+    extracted_features = {}
+    for embedding in StudentEmbedding.objects.filter(MODEL_VERSION=MODEL_VERSION).iterator():
+        extracted_features.setdefault(embedding.STUDENT_ID_id, []).append({
+            'side': embedding.SIDE,
+            'features': np.frombuffer(embedding.VECTOR, dtype=embedding.DTYPE).tolist(),
+        })
+
+    for student_id, features in extracted_features.items():
+        Student.objects.filter(STUDENT_ID=student_id).update(
+            STUDENT_EXTRACTED_FEATURES=json.dumps(features))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0002_studentembedding'),
+    ]
+
+    operations = [
+        migrations.RunPython(features_to_embeddings, embeddings_to_features),
+    ]
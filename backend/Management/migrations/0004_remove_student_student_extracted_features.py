@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 09:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0003_convert_extracted_features'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='student',
+            name='STUDENT_EXTRACTED_FEATURES',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0004_remove_student_student_extracted_features'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentembedding',
+            name='WEIGHT',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='studentembedding',
+            name='SIDE',
+            field=models.CharField(choices=[('front', 'Front'), ('left', 'Left'), ('right', 'Right'), ('fused', 'Fused')], max_length=10),
+        ),
+    ]
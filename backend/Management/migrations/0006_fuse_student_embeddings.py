@@ -0,0 +1,58 @@
+import numpy as np
+from django.db import migrations
+
+# Side weights of the weighted average similarity when the fused templates were introduced
+FRONT_WEIGHT = 3
+SIDE_WEIGHT = 0.4
+
+
+def fuse_embeddings(apps, schema_editor):
+    StudentEmbedding = apps.get_model('Management', 'StudentEmbedding')
+
+    sides = {}
+    for embedding in StudentEmbedding.objects.exclude(SIDE='fused').iterator():
+        vector = np.frombuffer(embedding.VECTOR, dtype=embedding.DTYPE).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        embedding.VECTOR = vector.astype(embedding.DTYPE).tobytes()
+        embedding.WEIGHT = FRONT_WEIGHT if embedding.SIDE == 'front' else SIDE_WEIGHT
+        embedding.save(update_fields=['VECTOR', 'WEIGHT'])
+        sides.setdefault((embedding.STUDENT_ID_id, embedding.MODEL_VERSION, embedding.DTYPE), []).append(
+            (vector, embedding.WEIGHT))
+
+    fused = []
+    for (student_id, model_version, dtype), entries in sides.items():
+        weights = np.array([weight for _, weight in entries], dtype=np.float32)
+        template = np.einsum('s,sd->d', weights / weights.sum(),
+                             np.stack([vector for vector, _ in entries]))
+        fused.append(StudentEmbedding(
+            STUDENT_ID_id=student_id,
+            SIDE='fused',
+            VECTOR=template.astype(dtype).tobytes(),
+            DTYPE=dtype,
+            MODEL_VERSION=model_version,
+            WEIGHT=0,
+        ))
+
+        if len(fused) >= 1000:
+            StudentEmbedding.objects.bulk_create(fused)
+            fused = []
+
+    StudentEmbedding.objects.bulk_create(fused)
+
+
+def drop_fused_embeddings(apps, schema_editor):
+    StudentEmbedding = apps.get_model('Management', 'StudentEmbedding')
+    StudentEmbedding.objects.filter(SIDE='fused').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0005_studentembedding_weight_alter_studentembedding_side'),
+    ]
+
+    operations = [
+        migrations.RunPython(fuse_embeddings, drop_fused_embeddings),
+    ]
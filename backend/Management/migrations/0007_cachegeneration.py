@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0006_fuse_student_embeddings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('NAME', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('VALUE', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1 on 2026-10-18 12:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Management', '0007_cachegeneration'),
+    ]
+
+    operations = [
+        # Existing rows count as changed now, so snapshots exported before are not trusted
+        migrations.AddField(
+            model_name='studentembedding',
+            name='UPDATED_AT',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
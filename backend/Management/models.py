@@ -1,18 +1,172 @@
 import uuid
-from django.db import models
+import numpy as np
+from django.db import models, transaction
+from django.db.models import F
+from django.dispatch import Signal
 
 # Create your models here.
 
+# Sent with the `student` argument once the stored embeddings of a student have changed
+student_features_changed = Signal()
+
 
 class Student(models.Model):
     STUDENT_ID = models.CharField(primary_key=True, unique=True)
     STUDENT_NAME = models.CharField(max_length=100)
     STUDENT_BATCH = models.CharField(max_length=8)
-    STUDENT_EXTRACTED_FEATURES = models.JSONField()
 
     def __str__(self):
         return f"{self.STUDENT_NAME}_{self.STUDENT_ID}"
 
+    def store_features(self, extracted_features, model_version, dtype='float32'):
+        """
+        Store or replace the embedding of every given side of the student.
+
+        Side vectors are stored normalized with their weight, and the fused template of
+        every stored side of the model is refreshed.
+
+        Args:
+            extracted_features (list[dict]): The {'side', 'features', 'weight'} entries to store.
+            model_version (str): The version of the model that produced the features.
+            dtype (str): The storage type of the vectors ('float32' or 'float16').
+        """
+        with transaction.atomic():
+            for entry in extracted_features:
+                StudentEmbedding.objects.update_or_create(
+                    STUDENT_ID=self, SIDE=entry["side"], MODEL_VERSION=model_version,
+                    defaults={
+                        "VECTOR": StudentEmbedding.pack(StudentEmbedding.normalize(entry["features"]), dtype),
+                        "DTYPE": dtype,
+                        "WEIGHT": entry["weight"],
+                    })
+
+            sides = self.embeddings.filter(MODEL_VERSION=model_version).exclude(
+                SIDE=StudentEmbedding.Side.FUSED)
+            fused = StudentEmbedding.fuse(
+                [side.as_array() for side in sides], [side.WEIGHT for side in sides])
+            StudentEmbedding.objects.update_or_create(
+                STUDENT_ID=self, SIDE=StudentEmbedding.Side.FUSED, MODEL_VERSION=model_version,
+                defaults={
+                    "VECTOR": StudentEmbedding.pack(fused, dtype),
+                    "DTYPE": dtype,
+                    "WEIGHT": 0,
+                })
+            transaction.on_commit(
+                lambda: student_features_changed.send(sender=Student, student=self))
+
+
+class StudentEmbedding(models.Model):
+    class Side(models.TextChoices):
+        FRONT = 'front', 'Front'
+        LEFT = 'left', 'Left'
+        RIGHT = 'right', 'Right'
+        # Weighted sum of the normalized sides, scoring a student with one dot product
+        FUSED = 'fused', 'Fused'
+
+    STUDENT_ID = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name='embeddings')
+    SIDE = models.CharField(max_length=10, choices=Side.choices)
+    VECTOR = models.BinaryField()
+    DTYPE = models.CharField(max_length=10, default='float32')
+    MODEL_VERSION = models.CharField(max_length=50)
+    WEIGHT = models.FloatField(default=0)
+    # Compared with the export time of gallery snapshots to skip their outdated rows
+    UPDATED_AT = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['STUDENT_ID', 'SIDE', 'MODEL_VERSION'], name='unique_student_side_model'),
+        ]
+
+    def __str__(self):
+        return f"{self.STUDENT_ID_id}_{self.SIDE}_{self.MODEL_VERSION}"
+
+    @staticmethod
+    def normalize(features) -> np.ndarray:
+        """
+        Scale an embedding to unit length.
+
+        Args:
+            features (np.ndarray | list[float]): The embedding.
+
+        Returns:
+            np.ndarray: The float32 unit embedding, or the zero vector unchanged.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        norm = np.linalg.norm(features)
+        return features / norm if norm > 0 else features
+
+    @staticmethod
+    def fuse(vectors, weights) -> np.ndarray:
+        """
+        Fuse the normalized side embeddings of a student into one template.
+
+        The weighted average cosine similarity of a probe against the sides equals the
+        dot product of the normalized probe with this template.
+
+        Args:
+            vectors (list[np.ndarray]): The normalized side embeddings.
+            weights (list[float]): The weight of every side.
+
+        Returns:
+            np.ndarray: The float32 template, the weighted mean of the sides.
+        """
+        weights = np.asarray(weights, dtype=np.float32)
+        if len(vectors) == 0 or weights.sum() <= 0:
+            return np.zeros(len(vectors[0]) if len(vectors) else 0, dtype=np.float32)
+        return np.einsum('s,sd->d', weights / weights.sum(),
+                         np.stack([np.asarray(vector, dtype=np.float32) for vector in vectors]))
+
+    @classmethod
+    def build(cls, student, extracted_features, model_version, dtype='float32') -> list:
+        """
+        Build the unsaved rows of every side of a new student and their fused template.
+
+        Args:
+            student (Student): The student.
+            extracted_features (list[dict]): The {'side', 'features', 'weight'} entries.
+            model_version (str): The version of the model that produced the features.
+            dtype (str): The storage type of the vectors.
+
+        Returns:
+            list[StudentEmbedding]: The side rows followed by the fused row.
+        """
+        vectors = [cls.normalize(entry["features"]) for entry in extracted_features]
+        weights = [entry["weight"] for entry in extracted_features]
+        rows = [
+            cls(STUDENT_ID=student, SIDE=entry["side"], VECTOR=cls.pack(vector, dtype),
+                DTYPE=dtype, MODEL_VERSION=model_version, WEIGHT=entry["weight"])
+            for entry, vector in zip(extracted_features, vectors)
+        ]
+        rows.append(cls(
+            STUDENT_ID=student, SIDE=cls.Side.FUSED, VECTOR=cls.pack(cls.fuse(vectors, weights), dtype),
+            DTYPE=dtype, MODEL_VERSION=model_version, WEIGHT=0))
+        return rows
+
+    @staticmethod
+    def pack(features, dtype='float32') -> bytes:
+        """
+        Pack an embedding into the raw bytes stored in VECTOR.
+
+        Args:
+            features (np.ndarray | list[float]): The embedding.
+            dtype (str): The storage type of the vector.
+
+        Returns:
+            bytes: The packed vector.
+        """
+        return np.ascontiguousarray(features, dtype=dtype).tobytes()
+
+    def as_array(self) -> np.ndarray:
+        """
+        Decode VECTOR without copying it.
+
+        Returns:
+            np.ndarray: A read-only view of the stored embedding.
+        """
+        return np.frombuffer(self.VECTOR, dtype=self.DTYPE)
+
 
 class Course(models.Model):
     COURSE_CODE = models.CharField()
@@ -70,3 +224,40 @@ class ExaminerMobile(models.Model):
     EXAMINER_NAME = models.CharField(max_length=100)
     EXAMINER_PHONE = models.CharField(max_length=13)
     ACTIVE = models.BooleanField(default=True)
+
+
+class CacheGeneration(models.Model):
+    """
+    A counter shared by every worker process, bumped whenever the data behind an in-process
+    cache changes so the other workers know to rebuild their copy.
+    """
+    NAME = models.CharField(primary_key=True, max_length=50)
+    VALUE = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.NAME}_{self.VALUE}"
+
+    @classmethod
+    def current(cls, name: str) -> int:
+        """
+        Read the generation of a cache.
+
+        Args:
+            name (str): The name of the cache.
+
+        Returns:
+            int: The generation, 0 until the cache is first bumped.
+        """
+        return cls.objects.filter(NAME=name).values_list('VALUE', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name: str) -> None:
+        """
+        Move a cache to its next generation.
+
+        Args:
+            name (str): The name of the cache.
+        """
+        cls.objects.get_or_create(NAME=name)
+        # Incremented in the database so concurrent bumps are never lost
+        cls.objects.filter(NAME=name).update(VALUE=F('VALUE') + 1)
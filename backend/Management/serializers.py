@@ -5,8 +5,7 @@ from Management.models import Student, Course, Exam, Room, Attendance, ExaminerM
 class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
-        fields = ['STUDENT_ID', 'STUDENT_NAME',
-                  'STUDENT_BATCH', 'STUDENT_EXTRACTED_FEATURES']
+        fields = ['STUDENT_ID', 'STUDENT_NAME', 'STUDENT_BATCH']
 
 
 class CourseSerializer(serializers.ModelSerializer):
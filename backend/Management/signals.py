@@ -1,9 +1,38 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, post_save, post_delete
 from django.dispatch import receiver
-from .tasks import schedule_clear_rooms_task
+from .models import Room, Student, student_features_changed
+from .tasks import (schedule_clear_rooms_task, schedule_gallery_snapshot_refresh, schedule_gallery_snapshot_task,
+                    schedule_student_index_merge)
+from utils import gallery, student_index
 
 
 @receiver(post_migrate)
 def schedule_tasks(sender, **kwargs):
     if sender.name == 'Management':
         schedule_clear_rooms_task()
+        schedule_gallery_snapshot_task()
+
+
+@receiver([post_save, post_delete], sender=Room)
+def invalidate_room_gallery(sender, instance, **kwargs):
+    gallery.invalidate_room(instance.ROOM_NO, instance.EXAM_TIME)
+
+
+@receiver([post_save, post_delete], sender=Student)
+def invalidate_student_galleries(sender, instance, **kwargs):
+    gallery.invalidate_student(instance.STUDENT_ID)
+
+
+@receiver(student_features_changed, sender=Student)
+def reindex_student_features(sender, student, **kwargs):
+    gallery.invalidate_student(student.STUDENT_ID)
+    if student_index.update_student(student):
+        schedule_student_index_merge()
+    schedule_gallery_snapshot_refresh()
+
+
+@receiver(post_delete, sender=Student)
+def unindex_student(sender, instance, **kwargs):
+    if student_index.remove_student(instance.STUDENT_ID):
+        schedule_student_index_merge()
+    schedule_gallery_snapshot_refresh()
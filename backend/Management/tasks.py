@@ -1,7 +1,10 @@
 from background_task import background
+from django.conf import settings
 from .models import Room
 from datetime import datetime, timedelta
 from background_task.models import Task
+from utils.gallery_snapshot import export_snapshot
+from utils.student_index import merge_student_index
 
 
 @background(schedule=60)  # Initial delay of 60 seconds for the first run
@@ -14,3 +17,39 @@ def schedule_clear_rooms_task():
     next_run = datetime.combine(
         now.date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=6)
     clear_rooms(repeat=Task.DAILY, schedule=next_run)
+
+
+@background(schedule=60)
+def refresh_gallery_snapshot():
+    export_snapshot()
+
+
+def schedule_gallery_snapshot_refresh():
+    # A pending refresh also covers the students changed since it was scheduled, a running one may not
+    if Task.objects.filter(task_name='Management.tasks.refresh_gallery_snapshot', repeat=Task.NEVER,
+                           locked_by__isnull=True).exists():
+        return
+    refresh_gallery_snapshot(schedule=settings.FACIAL_SNAPSHOT_REFRESH_DELAY)
+
+
+def schedule_gallery_snapshot_task():
+    # Export the gallery every day before the exam sessions start, once however often migrate runs
+    if Task.objects.filter(task_name='Management.tasks.refresh_gallery_snapshot', repeat=Task.DAILY).exists():
+        return
+    now = datetime.now()
+    next_run = datetime.combine(
+        now.date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=settings.FACIAL_SNAPSHOT_HOUR)
+    refresh_gallery_snapshot(repeat=Task.DAILY, schedule=next_run)
+
+
+@background(schedule=0)
+def merge_student_index_changes():
+    merge_student_index()
+
+
+def schedule_student_index_merge():
+    # One pending merge covers every change appended before it runs
+    if Task.objects.filter(task_name='Management.tasks.merge_student_index_changes',
+                           locked_by__isnull=True).exists():
+        return
+    merge_student_index_changes()
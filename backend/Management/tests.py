@@ -1,21 +1,51 @@
 from Management.serializers import AttendanceSerializer
 from Management.models import Student, Attendance, Room, Exam, Course
 from rest_framework.test import APITestCase
+import functools
 import json
 import os
+import tempfile
+import threading
+import time
+import types
+import numpy as np
 import pandas as pd
-from io import BytesIO
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
 from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
-from Management.models import Course, Student, Exam, Room, Attendance, ExaminerMobile
+from Management.models import Course, Student, Exam, Room, Attendance, ExaminerMobile, StudentEmbedding
 from Management.serializers import CourseSerializer, AttendanceSerializer
+from Management.views import attendance_views, students_views
+from Management import tasks
+from Management.management.commands import enroll_bulk
+from background_task.models import Task
+import facial
 from facial import FacialRecognition
-from datetime import datetime, timedelta
-
-facial = FacialRecognition()
+from utils.student_index import StudentIndex, fused_templates
+from utils.gallery import RoomGallery, get_room_gallery, invalidate_room, invalidate_student
+from utils.inference_scheduler import InferenceLimiter, MicroBatcher
+from utils.admission import AdmissionController, admission_control
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_models import check_version, model_version
+from utils.face_detectors import TorchMTCNNDetector, detect_faces_downscaled
+from utils.face_preprocessing import FaceBatchBuffer
+from utils.face_quality import REJECTION_MESSAGES, QualityGate, sharpness
+from utils.inference_pool import (
+    FacialRecognitionClient, InferencePool, InferenceServer, InferenceServerClient, parse_address)
+from utils.quantization import dequantize, quantize
+from utils import gallery_snapshot, student_index
+from datetime import datetime, timedelta, timezone
 
 
 class TestCourseViews(APITestCase):
@@ -423,3 +453,1465 @@ class RoomDetailTests(APITestCase):
     def test_delete_room(self):
         response = self.client.delete(self.room_detail_url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class FacialScoringTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.students = [
+            [{"side": side, "features": rng.normal(size=512).tolist()}
+             for side in ['left', 'right', 'front']]
+            for _ in range(4)
+        ]
+        self.probes = rng.normal(size=(3, 512))
+
+    def weighted_average(self, stored_image_features_list, probe):
+        cosine_similarities = []
+        weights = []
+        for stored_image in stored_image_features_list:
+            stored_features = np.array(stored_image['features'])
+            cosine_similarities.append(np.dot(stored_features, probe) / (
+                np.linalg.norm(stored_features) * np.linalg.norm(probe)))
+            weights.append(3 if stored_image['side'] == 'front' else 0.4)
+        return np.dot(np.array(weights) / np.sum(weights), cosine_similarities)
+
+    def test_score_gallery_matches_weighted_average(self):
+        gallery, weights = FacialRecognition.pack_gallery(self.students)
+        scores = FacialRecognition.score_gallery(self.probes, gallery, weights)
+        self.assertEqual(scores.shape, (3, 4))
+        for p, probe in enumerate(self.probes):
+            for n, student in enumerate(self.students):
+                self.assertAlmostEqual(
+                    scores[p, n], self.weighted_average(student, probe), places=5)
+
+    def test_score_gallery_single_probe(self):
+        gallery, weights = FacialRecognition.pack_gallery(self.students)
+        scores = FacialRecognition.score_gallery(
+            self.probes[0], gallery, weights)
+        self.assertEqual(scores.shape, (4,))
+
+    def test_missing_side_has_no_weight(self):
+        students = [self.students[0][:2], self.students[1]]
+        gallery, weights = FacialRecognition.pack_gallery(students)
+        scores = FacialRecognition.score_gallery(
+            self.probes[0], gallery, weights)
+        self.assertEqual(weights[0, 2], 0)
+        self.assertAlmostEqual(
+            scores[0], self.weighted_average(students[0], self.probes[0]), places=5)
+
+
+class StudentIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.students = [
+            [{"side": side, "features": rng.normal(size=512).tolist()}
+             for side in ['left', 'right', 'front']]
+            for _ in range(50)
+        ]
+        self.ids = [f"S{i:03d}" for i in range(50)]
+        self.index = StudentIndex()
+        self.index.build(self.ids, fused_templates(self.students))
+        self.probe = np.array(self.students[7][2]["features"])
+
+    def test_fused_template_scores_match_kernel(self):
+        gallery, weights = FacialRecognition.pack_gallery(self.students)
+        expected = FacialRecognition.score_gallery(
+            self.probe, gallery, weights)
+        results = dict(self.index.search(self.probe, k=50))
+        for n, student_id in enumerate(self.ids):
+            self.assertAlmostEqual(results[student_id], expected[n], places=5)
+
+    def test_search_returns_best_first(self):
+        results = self.index.search(self.probe, k=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][0], "S007")
+        self.assertGreaterEqual(results[0][1], results[1][1])
+
+    def test_upsert_and_remove(self):
+        self.index.upsert("NEW", self.index.templates[7] * 2)
+        self.assertEqual(self.index.search(self.probe, k=1)[0][0], "NEW")
+        self.index.remove("NEW")
+        self.index.remove("S007")
+        self.assertEqual(len(self.index), 49)
+        self.assertNotIn("S007", [student_id for student_id,
+                         _ in self.index.search(self.probe, k=49)])
+
+    def test_upsert_swaps_in_new_arrays(self):
+        templates, scales = self.index.templates, self.index.scales
+        before = templates.copy()
+        self.index.upsert("S003", self.index.templates[7])
+        # A search that already took the old arrays keeps scoring consistent rows
+        np.testing.assert_array_equal(templates, before)
+        self.assertIsNot(self.index.templates, templates)
+        self.assertIsNot(self.index.scales, scales)
+        np.testing.assert_allclose(self.index.templates[3], before[7])
+
+
+class StudentIndexWriterTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(FACIAL_INDEX_PATH=os.path.join(directory.name, "students.npz")))
+        rng = np.random.default_rng(2)
+        self.templates = {f"S{i}": rng.normal(size=512).astype(np.float32) for i in range(4)}
+        # The database holds S0 and S1 when the index is first built
+        self.enrolled = {"S0", "S1"}
+        self.enterContext(mock.patch(
+            "utils.student_index.load_templates",
+            side_effect=lambda ids=None: {student_id: self.templates[student_id] for student_id in
+                                          (ids if ids is not None else sorted(self.enrolled))
+                                          if student_id in self.enrolled}))
+        self.forget_index()
+
+    def forget_index(self):
+        # Start over like a process that never loaded the index
+        for name, value in [("_index", None), ("_index_stamp", None), ("_delta_inode", None),
+                            ("_delta_offset", 0), ("_delta_records", 0)]:
+            self.enterContext(mock.patch.object(student_index, name, value))
+
+    def enroll(self, student_id):
+        self.enrolled.add(student_id)
+        return student_index.update_student(mock.Mock(STUDENT_ID=student_id))
+
+    def test_writers_of_other_processes_are_not_lost(self):
+        student_index.get_student_index()
+        # Another process loaded the index before this one enrolled S2
+        stale = {name: getattr(student_index, name) for name in
+                 ["_index_stamp", "_delta_inode", "_delta_offset", "_delta_records"]}
+        stale_index = StudentIndex.load(student_index._index_path())
+        self.enroll("S2")
+
+        student_index._index = stale_index
+        for name, value in stale.items():
+            setattr(student_index, name, value)
+        self.assertEqual(sorted(student_index.get_student_index().ids.tolist()), ["S0", "S1", "S2"])
+        self.enroll("S3")
+
+        self.forget_index()
+        self.assertEqual(sorted(student_index.get_student_index().ids.tolist()), ["S0", "S1", "S2", "S3"])
+
+    def test_changes_are_appended_without_rewriting_the_index(self):
+        student_index.get_student_index()
+        path = student_index._index_path()
+        stamp = student_index._file_stamp(path)
+        self.enroll("S2")
+        student_index.remove_student("S0")
+        self.assertEqual(student_index._file_stamp(path), stamp)
+        self.assertEqual(sorted(StudentIndex.load(path).ids.tolist()), ["S0", "S1"])
+
+        self.forget_index()
+        self.assertEqual(sorted(student_index.get_student_index().ids.tolist()), ["S1", "S2"])
+
+    def test_record_being_written_is_applied_later(self):
+        student_index.get_student_index()
+        self.enroll("S2")
+        delta_path = student_index._delta_path(student_index._index_path())
+        with open(delta_path, 'rb') as delta:
+            record = delta.read()
+
+        self.forget_index()
+        with open(delta_path, 'wb') as delta:
+            delta.write(record[:-10])
+        self.assertNotIn("S2", student_index.get_student_index().ids.tolist())
+        with open(delta_path, 'ab') as delta:
+            delta.write(record[-10:])
+        self.assertIn("S2", student_index.get_student_index().ids.tolist())
+
+    @override_settings(FACIAL_INDEX_DELTA_MAX=2)
+    def test_merge_is_due_once_the_delta_is_full(self):
+        student_index.get_student_index()
+        self.assertFalse(self.enroll("S2"))
+        self.assertTrue(self.enroll("S3"))
+
+        student_index.merge_student_index()
+        path = student_index._index_path()
+        self.assertEqual(sorted(StudentIndex.load(path).ids.tolist()), ["S0", "S1", "S2", "S3"])
+        self.assertEqual(os.path.getsize(student_index._delta_path(path)), 0)
+        self.assertFalse(student_index.remove_student("S0"))
+
+
+class SearchStudentViewTests(SimpleTestCase):
+    def search(self, candidates, students):
+        index = mock.Mock()
+        index.search.return_value = candidates
+        engine = mock.Mock(threshold=0.7)
+        with mock.patch.object(attendance_views, "get_facial_engine", return_value=engine), \
+                mock.patch.object(attendance_views, "extract_probe", return_value=(np.ones(512), None)), \
+                mock.patch.object(attendance_views, "get_student_index", return_value=index), \
+                mock.patch.object(attendance_views.Student.objects, "filter") as filter_students:
+            filter_students.return_value.first.return_value = students.get(candidates[0][0]) if candidates else None
+            image = SimpleUploadedFile("probe.jpg", b"image", content_type="image/jpeg")
+            return self.client.generic(
+                'GET', reverse('search-student-with-image'),
+                encode_multipart(BOUNDARY, {"input_image": image}), content_type=MULTIPART_CONTENT)
+
+    def test_match_is_returned(self):
+        student = mock.Mock(STUDENT_ID="S1", STUDENT_NAME="Student 1", STUDENT_BATCH="2024")
+        response = self.search([("S1", 0.9)], {"S1": student})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["student_id"], "S1")
+
+    def test_student_deleted_after_indexing_is_not_found(self):
+        response = self.search([("S1", 0.9)], {})
+        self.assertEqual(response.status_code, 404)
+
+    def test_weak_match_is_not_found(self):
+        self.assertEqual(self.search([("S1", 0.2)], {"S1": mock.Mock()}).status_code, 404)
+
+
+class InputFaceViewTests(SimpleTestCase):
+    def search(self, data):
+        engine = mock.Mock(threshold=0.7)
+        engine.extract_cropped_face.return_value = (np.ones(512), None)
+        index = mock.Mock()
+        index.search.return_value = []
+        with mock.patch.object(attendance_views, "get_facial_engine", return_value=engine), \
+                mock.patch.object(attendance_views, "get_student_index", return_value=index):
+            data = {"input_face": SimpleUploadedFile("face.png", b"face", content_type="image/png"), **data}
+            response = self.client.generic(
+                'GET', reverse('search-student-with-image'),
+                encode_multipart(BOUNDARY, data), content_type=MULTIPART_CONTENT)
+        return response, engine
+
+    def test_crop_format_is_required(self):
+        response, engine = self.search({})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["Error"], "crop_format is required with input_face")
+        engine.extract_cropped_face.assert_not_called()
+
+    def test_unknown_crop_format_is_rejected(self):
+        response, engine = self.search({"crop_format": "square-100"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown crop format: square-100", response.json()["Error"])
+        engine.extract_cropped_face.assert_not_called()
+
+    def test_known_crop_format_skips_detection(self):
+        response, engine = self.search({"crop_format": "square-160"})
+        self.assertEqual(response.status_code, 404)
+        engine.extract_cropped_face.assert_called_once_with(b"face", "square-160")
+        engine.extract_features_batch.assert_not_called()
+
+    def test_attendance_requires_crop_format(self):
+        with mock.patch.object(attendance_views.Room.objects, "get"), \
+                mock.patch.object(attendance_views, "get_room_gallery") as get_room_gallery:
+            face = SimpleUploadedFile("face.png", b"face", content_type="image/png")
+            response = self.client.patch(
+                reverse('attendance-list') + "?room_no=101&exam_time=10:00",
+                encode_multipart(BOUNDARY, {"input_face": face}), content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["Error"], "crop_format is required with input_face")
+        get_room_gallery.assert_not_called()
+
+
+class EnrollmentViewTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = mock.Mock(model_version="facenet-vggface2")
+        self.engine.side_weight = FacialRecognition.side_weight
+        self.enterContext(mock.patch.object(students_views, "get_facial_engine", return_value=self.engine))
+        self.enterContext(mock.patch.object(students_views.StudentList, "permission_classes", []))
+        self.enterContext(mock.patch.object(students_views.StudentDetail, "permission_classes", []))
+
+    def images(self, sides):
+        return {f"{side}_image": SimpleUploadedFile(f"{side}.jpg", side.encode(), content_type="image/jpeg")
+                for side in sides}
+
+    def enroll(self, errors):
+        self.engine.extract_features_batch.return_value = [
+            (np.array([]) if error else np.ones(512), error) for error in errors]
+        return self.client.post(
+            reverse('student-list'), {"STUDENT_ID": "S1", **self.images(['left', 'right', 'front'])})
+
+    def test_error_names_the_failing_side(self):
+        cases = [
+            ([None, None, 'no_face'], "No face detected in the front image", 'no_face'),
+            ([None, 'decode_failed', None], "Could not process the right image", 'decode_failed'),
+            ([None, 'inference_failed', None], "Could not process the right image", 'inference_failed'),
+            (['too_dark', None, None], f"The left image was rejected: {REJECTION_MESSAGES['too_dark']}", 'too_dark'),
+        ]
+        for errors, message, reason in cases:
+            with self.subTest(reason=reason):
+                response = self.enroll(errors)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"Error": message, "reason": reason})
+
+    def test_first_failing_side_is_reported(self):
+        response = self.enroll(['face_too_small', 'decode_failed', 'no_face'])
+        self.assertEqual(response.json()["reason"], 'face_too_small')
+        self.assertIn("left image", response.json()["Error"])
+
+    def test_sides_are_extracted_in_one_batch(self):
+        self.enroll([None, None, 'no_face'])
+        self.engine.extract_features_batch.assert_called_once_with(
+            [(b"left", 'left'), (b"right", 'right'), (b"front", 'front')])
+
+    def test_update_reports_the_recaptured_side(self):
+        self.engine.extract_features_batch.return_value = [(np.array([]), 'too_blurry')]
+        with mock.patch.object(students_views.Student.objects, "get") as get_student:
+            response = self.client.patch(
+                reverse('student-detail', args=["S1"]),
+                encode_multipart(BOUNDARY, self.images(['front'])), content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["reason"], 'too_blurry')
+        self.assertIn("front image", response.json()["Error"])
+        get_student.return_value.store_features.assert_not_called()
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_concurrent_items_share_batches(self):
+        batch_sizes = []
+
+        def run_batch(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(run_batch, window_ms=50, max_batch_size=4)
+        results = {}
+        threads = [threading.Thread(target=lambda i=i: results.update({i: batcher.submit(i)}))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: i * 2 for i in range(8)})
+        self.assertLessEqual(max(batch_sizes), 4)
+        self.assertLess(len(batch_sizes), 8)
+        self.assertEqual(batcher.stats()["items"], 8)
+
+    def test_errors_reach_every_caller(self):
+        def run_batch(items):
+            raise ValueError("inference failed")
+
+        batcher = MicroBatcher(run_batch, window_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.submit(1)
+
+
+class InferenceLimiterTests(SimpleTestCase):
+    def test_concurrency_is_bounded(self):
+        limiter = InferenceLimiter(max_concurrent=2)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def infer():
+            with limiter:
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.02)
+                with lock:
+                    running.pop()
+
+        threads = [threading.Thread(target=infer) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = limiter.stats()
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(stats["inferences"], 6)
+        self.assertEqual(stats["running"], 0)
+        self.assertEqual(stats["waiting"], 0)
+        # The last pair waited for the two pairs before it
+        self.assertGreater(stats["longest_queue_wait_ms"], 30)
+
+    def test_unlimited_inferences_never_wait(self):
+        limiter = InferenceLimiter()
+        with limiter:
+            with limiter:
+                self.assertEqual(limiter.stats()["running"], 2)
+        self.assertLess(limiter.stats()["longest_queue_wait_ms"], 5)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def test_hits_and_misses(self):
+        cache = EmbeddingCache(max_entries=2)
+        key = EmbeddingCache.key(b"image", "front")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, (np.ones(3), None))
+        self.assertIsNotNone(cache.get(key))
+        self.assertNotEqual(key, EmbeddingCache.key(b"image", "left"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = EmbeddingCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = EmbeddingCache(max_entries=2, ttl=0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+
+class DownscaledDetectionTests(SimpleTestCase):
+    class RecordingDetector:
+        def __init__(self, box):
+            self.box = box
+            self.shapes = []
+
+        def detect_faces(self, image):
+            self.shapes.append(image.shape)
+            return [{'box': list(self.box), 'confidence': 0.99, 'keypoints': {'nose': (50, 40)}}]
+
+    def test_boxes_are_mapped_back_to_full_resolution(self):
+        detector = self.RecordingDetector([25, 10, 50, 60])
+        image = np.zeros((800, 1000, 3), dtype=np.uint8)
+        detections = detect_faces_downscaled(detector, image, max_side=250)
+        self.assertEqual(detector.shapes, [(200, 250, 3)])
+        self.assertEqual(detections[0]['box'], [100, 40, 200, 240])
+        self.assertEqual(detections[0]['keypoints']['nose'], (200, 160))
+
+    def test_small_images_are_not_resized(self):
+        detector = self.RecordingDetector([0, 0, 10, 10])
+        image = np.zeros((100, 120, 3), dtype=np.uint8)
+        detections = detect_faces_downscaled(detector, image, max_side=250)
+        self.assertEqual(detector.shapes, [(100, 120, 3)])
+        self.assertEqual(detections[0]['box'], [0, 0, 10, 10])
+
+
+class TorchMTCNNDetectorTests(SimpleTestCase):
+    def detector(self, boxes, probabilities, landmarks):
+        # Skip loading the model, only the conversion of its outputs is tested
+        detector = TorchMTCNNDetector.__new__(TorchMTCNNDetector)
+        detector.detector = mock.Mock()
+        detector.detector.detect.return_value = (boxes, probabilities, landmarks)
+        return detector
+
+    def test_detections_use_the_mtcnn_format(self):
+        boxes = np.array([[10.7, 20.2, 110.9, 150.5], [-4.3, -2.8, 40.1, 60.6]], dtype=np.float32)
+        probabilities = np.array([0.99, 0.85], dtype=np.float32)
+        landmarks = np.array([
+            [[30.4, 60.1], [80.9, 61.2], [55.5, 90.7], [35.2, 120.3], [78.8, 121.6]],
+            [[5.1, 15.2], [25.3, 15.9], [15.5, 30.4], [8.2, 45.1], [22.7, 45.8]],
+        ], dtype=np.float32)
+        image = np.zeros((200, 200, 3), dtype=np.uint8)
+        detector = self.detector(boxes, probabilities, landmarks)
+
+        detections = detector.detect_faces(image)
+
+        detector.detector.detect.assert_called_once_with(image, landmarks=True)
+        self.assertEqual(detections[0]['box'], [10, 20, 100, 130])
+        self.assertAlmostEqual(detections[0]['confidence'], 0.99, places=5)
+        self.assertIsInstance(detections[0]['confidence'], float)
+        self.assertEqual(detections[0]['keypoints'], {
+            'left_eye': (30, 60), 'right_eye': (80, 61), 'nose': (55, 90),
+            'mouth_left': (35, 120), 'mouth_right': (78, 121)})
+        # Boxes reaching past the image edge are clipped to it, keeping their far corner
+        self.assertEqual(detections[1]['box'], [0, 0, 40, 60])
+        self.assertEqual(detections[1]['keypoints']['nose'], (15, 30))
+
+    def test_no_face_gives_no_detection(self):
+        detector = self.detector(None, [None], None)
+        self.assertEqual(detector.detect_faces(np.zeros((50, 50, 3), dtype=np.uint8)), [])
+
+
+class DecodeImageTests(SimpleTestCase):
+    def setUp(self):
+        # decode_image needs no model
+        self.facial = FacialRecognition.__new__(FacialRecognition)
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), (120, 80, 40)).save(buffer, format='JPEG')
+        self.jpeg = buffer.getvalue()
+
+    def test_jpeg_is_decoded_at_reduced_resolution(self):
+        image = self.facial.decode_image(self.jpeg, min_side=300)
+        self.assertEqual(image.size, (400, 300))
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_full_resolution_without_min_side(self):
+        self.assertEqual(self.facial.decode_image(self.jpeg).size, (1600, 1200))
+        self.assertEqual(self.facial.decode_image(self.jpeg, min_side=2000).size, (1600, 1200))
+
+    def test_non_rgb_images_are_converted(self):
+        buffer = BytesIO()
+        Image.new('L', (200, 100)).save(buffer, format='PNG')
+        self.assertEqual(self.facial.decode_image(buffer.getvalue(), min_side=50).mode, 'RGB')
+
+    def test_unreadable_bytes(self):
+        self.assertIsNone(self.facial.decode_image(b"not an image"))
+
+
+class FaceBatchBufferTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.faces = [rng.integers(0, 256, size=shape, dtype=np.uint8)
+                      for shape in [(200, 150, 3), (160, 160, 3), (90, 120, 3)]]
+        self.buffer = FaceBatchBuffer(size=160, capacity=4)
+
+    def test_faces_keep_their_aspect_ratio(self):
+        batches = self.buffer.fill(self.faces)
+        # Resize(160) fixes the shortest side and rounds the other one down
+        self.assertEqual([(indices, batch.shape) for indices, batch in batches],
+                         [([0], (1, 3, 213, 160)), ([1], (1, 3, 160, 160)), ([2], (1, 3, 160, 213))])
+        for (indices, batch), (height, width) in zip(batches, [(213, 160), (160, 160), (160, 213)]):
+            self.assertEqual(batch.dtype, np.float32)
+            # ToTensor followed by Normalize(mean=0.5, std=0.5)
+            pixels = np.asarray(Image.fromarray(self.faces[indices[0]]).resize((width, height), Image.BILINEAR))
+            expected = (pixels.transpose(2, 0, 1) / 255 - 0.5) / 0.5
+            np.testing.assert_allclose(batch[0], expected, atol=1e-6)
+
+    def test_faces_of_the_same_shape_share_a_batch(self):
+        batches = self.buffer.fill([self.faces[0], self.faces[1], self.faces[0]])
+        self.assertEqual([(indices, batch.shape[0]) for indices, batch in batches], [([0, 2], 2), ([1], 1)])
+        self.assertFalse(np.shares_memory(batches[0][1], batches[1][1]))
+
+    def test_buffer_is_reused(self):
+        first = self.buffer.fill(self.faces)
+        second = self.buffer.fill(self.faces[:1])
+        self.assertTrue(np.shares_memory(first[0][1], second[0][1]))
+        # Batches larger than the buffer grow it
+        batches = self.buffer.fill(self.faces * 3)
+        self.assertEqual(sum(len(batch) for _, batch in batches), 9)
+
+    def test_threads_fill_their_own_buffers(self):
+        batches = []
+        thread = threading.Thread(target=lambda: batches.append(self.buffer.fill(self.faces[:1])))
+        thread.start()
+        thread.join()
+        self.assertFalse(np.shares_memory(batches[0][0][1], self.buffer.fill(self.faces[:1])[0][1]))
+
+    def test_engine_runs_one_pass_per_shape(self):
+        facial = FacialRecognition.__new__(FacialRecognition)
+        facial.face_buffer = self.buffer
+        facial.limiter = InferenceLimiter()
+        facial.batcher = None
+        # The fake model embeds every face as its (height, width)
+        facial.model = mock.Mock(side_effect=lambda batch: np.array([batch.shape[2:]] * len(batch)))
+        faces = [self.faces[0], self.faces[2], self.faces[0]]
+        embeddings = facial.embed_faces(faces)
+        self.assertEqual([list(features) for features in embeddings], [[213, 160], [160, 213], [213, 160]])
+        self.assertEqual(facial.model.call_count, 2)
+
+
+class QualityGateTests(SimpleTestCase):
+    def setUp(self):
+        self.gate = QualityGate()
+        # A high contrast checkerboard is sharp and well exposed
+        self.face = np.kron((np.indices((20, 20)).sum(axis=0) % 2) * 170 + 40,
+                            np.ones((10, 10))).astype(np.uint8)[:, :, None].repeat(3, axis=2)
+        self.detection = {'box': [0, 0, 200, 200], 'confidence': 0.99}
+
+    def test_usable_face_passes(self):
+        self.assertIsNone(self.gate.check(self.face, self.detection))
+
+    def test_small_and_uncertain_faces_are_rejected(self):
+        self.assertEqual(self.gate.check(self.face, {'box': [0, 0, 40, 40], 'confidence': 0.99}),
+                         'face_too_small')
+        self.assertEqual(self.gate.check(self.face, {'box': [0, 0, 200, 200], 'confidence': 0.5}),
+                         'low_confidence')
+
+    def test_exposure_and_blur_are_rejected(self):
+        self.assertEqual(self.gate.check(self.face // 8, self.detection), 'too_dark')
+        self.assertEqual(self.gate.check(np.full_like(self.face, 250), self.detection), 'too_bright')
+        self.assertEqual(self.gate.check(np.full_like(self.face, 128), self.detection), 'too_blurry')
+
+    def test_sharpness_of_a_flat_image_is_zero(self):
+        self.assertEqual(sharpness(np.full((50, 50), 90, dtype=np.uint8)), 0.0)
+
+
+class CroppedFaceTests(SimpleTestCase):
+    def setUp(self):
+        # Stand-ins for the models, the crop path itself needs none
+        self.facial = FacialRecognition.__new__(FacialRecognition)
+        self.facial.probe_cache = None
+        self.facial.quality_gate = QualityGate()
+        self.facial.embed_faces = mock.Mock(return_value=[np.ones(4, dtype=np.float32)])
+        self.facial.detect_faces = mock.Mock()
+
+    def crop(self, size, pixels=None):
+        rng = np.random.default_rng(4)
+        if pixels is None:
+            pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_crop_is_embedded_without_detection(self):
+        features, error = self.facial.extract_cropped_face(self.crop((160, 160)), 'square-160')
+        self.assertIsNone(error)
+        np.testing.assert_array_equal(features, np.ones(4))
+        self.facial.detect_faces.assert_not_called()
+
+    def test_crop_must_match_its_format(self):
+        self.assertEqual(self.facial.extract_cropped_face(self.crop((160, 120)), 'square-160')[1], 'crop_mismatch')
+        self.assertEqual(self.facial.extract_cropped_face(self.crop((160, 160)), 'square-320')[1], 'crop_mismatch')
+        self.assertEqual(self.facial.extract_cropped_face(b"not an image", 'square-160')[1], 'decode_failed')
+        with self.assertRaises(ValueError):
+            self.facial.extract_cropped_face(self.crop((160, 160)), 'square-100')
+        self.facial.embed_faces.assert_not_called()
+
+    def test_crop_goes_through_the_quality_gate(self):
+        dark = self.crop((160, 160), np.full((160, 160, 3), 10, dtype=np.uint8))
+        self.assertEqual(self.facial.extract_cropped_face(dark, 'square-160')[1], 'too_dark')
+
+
+class GroupAssignmentTests(SimpleTestCase):
+    def setUp(self):
+        # Two students with a single front embedding each, built without the database
+        self.gallery = RoomGallery.__new__(RoomGallery)
+        self.gallery.student_ids = ["S1", "S2"]
+        self.gallery.course_codes = ["C1", "C2"]
+        self.gallery.students = {"S1": "student 1", "S2": "student 2"}
+        self.gallery.templates = fused_templates([
+            [{"side": "front", "features": np.array([1.0, 0.0, 0.0])}],
+            [{"side": "front", "features": np.array([0.8, 0.6, 0.0])}],
+        ])
+
+    def test_students_are_matched_once(self):
+        # Both probes are closest to S1, the weaker one falls back to S2
+        matches = self.gallery.assign(
+            [np.array([0.9, 0.3, 0.0]), np.array([1.0, 0.05, 0.0])], threshold=0.7)
+        self.assertEqual(matches[1][0], "student 1")
+        self.assertEqual(matches[0][0], "student 2")
+        self.assertEqual(matches[0][1], "C2")
+
+    def test_probes_below_threshold_are_unmatched(self):
+        matches = self.gallery.assign(
+            [np.array([1.0, 0.0, 0.0]), np.array([0.0, 0.0, 1.0])], threshold=0.7)
+        self.assertEqual(matches[0][0], "student 1")
+        self.assertIsNone(matches[1])
+        self.assertEqual(self.gallery.assign([], threshold=0.7), [])
+
+
+class RoomGalleryTests(SimpleTestCase):
+    def setUp(self):
+        self.students = {student_id: mock.Mock(STUDENT_ID=student_id) for student_id in ["S1", "S2", "S3"]}
+        self.templates = {"S1": np.array([1.0, 0.0], dtype=np.float32),
+                          "S2": np.array([0.0, 1.0], dtype=np.float32)}
+        self.in_bulk = self.enterContext(mock.patch(
+            "utils.gallery.Student.objects.in_bulk",
+            side_effect=lambda ids: {student_id: self.students[student_id]
+                                     for student_id in ids if student_id in self.students}))
+        self.load_templates = self.enterContext(mock.patch(
+            "utils.gallery.load_templates",
+            side_effect=lambda ids: {student_id: self.templates[student_id]
+                                     for student_id in ids if student_id in self.templates}))
+        self.enterContext(mock.patch("utils.gallery.get_snapshot", return_value=None))
+        self.enterContext(mock.patch("utils.gallery._galleries", {}))
+        # The shared generation lives in the database, bumps are only recorded
+        self.generation = 0
+        self.enterContext(mock.patch(
+            "utils.gallery.CacheGeneration.current", side_effect=lambda name: self.generation))
+        self.bump = self.enterContext(mock.patch("utils.gallery.CacheGeneration.bump"))
+        self.enterContext(mock.patch("utils.gallery.transaction.on_commit", side_effect=lambda callback: callback()))
+        self.room = self.make_room(1, [{"course_code": "C1", "students": ["S1", "S9"]},
+                                       {"course_code": "C2", "students": ["S2", "S3"]}])
+
+    def make_room(self, pk, student_list):
+        return mock.Mock(pk=pk, ROOM_NO="101", EXAM_TIME="09:00", STUDENT_LIST=student_list)
+
+    def test_roster_is_packed_in_order(self):
+        with self.assertLogs("utils.gallery", "WARNING") as logs:
+            room_gallery = RoomGallery(self.room)
+        self.assertEqual(room_gallery.student_ids, ["S1", "S2", "S3"])
+        self.assertEqual(room_gallery.course_codes, ["C1", "C2", "C2"])
+        self.assertEqual(room_gallery.missing, ["S9"])
+        self.assertIn("S9", logs.output[0])
+        # S3 has no embeddings and can never match
+        np.testing.assert_array_equal(room_gallery.templates, [[1, 0], [0, 1], [0, 0]])
+        self.assertEqual(room_gallery.match(np.array([0.1, 1.0]), 0.7)[1], "C2")
+
+    def test_snapshot_templates_skip_the_database(self):
+        snapshot = mock.Mock()
+        snapshot.templates_of.return_value = {"S1": np.array([0.6, 0.8], dtype=np.float32)}
+        with mock.patch("utils.gallery.get_snapshot", return_value=snapshot):
+            room_gallery = RoomGallery(self.room)
+        np.testing.assert_allclose(room_gallery.templates[0], [0.6, 0.8])
+        self.load_templates.assert_called_once_with(["S2", "S3"])
+
+    def test_galleries_are_cached_per_room(self):
+        with self.assertLogs("utils.gallery", "WARNING"):
+            first = get_room_gallery(self.room)
+        self.assertIs(get_room_gallery(self.room), first)
+        self.assertEqual(self.in_bulk.call_count, 1)
+
+        # A room recreated under the same number and time gets a new gallery
+        recreated = self.make_room(2, [{"course_code": "C1", "students": ["S1"]}])
+        self.assertEqual(get_room_gallery(recreated).student_ids, ["S1"])
+
+        with override_settings(FACIAL_GALLERY_TTL=0):
+            self.assertIsNot(get_room_gallery(recreated), get_room_gallery(recreated))
+
+    def test_invalidation(self):
+        with self.assertLogs("utils.gallery", "WARNING"):
+            first = get_room_gallery(self.room)
+        invalidate_student("S7")
+        self.assertIs(get_room_gallery(self.room), first)
+
+        # A student enrolled under a missing roster ID invalidates the gallery too
+        invalidate_student("S9")
+        with self.assertLogs("utils.gallery", "WARNING"):
+            second = get_room_gallery(self.room)
+        self.assertIsNot(second, first)
+
+        invalidate_room("101", "09:00")
+        with self.assertLogs("utils.gallery", "WARNING"):
+            self.assertIsNot(get_room_gallery(self.room), second)
+        # Every invalidation is shared with the other workers once committed
+        self.assertEqual(self.bump.call_count, 3)
+
+    def test_change_in_another_worker_rebuilds_the_gallery(self):
+        with self.assertLogs("utils.gallery", "WARNING"):
+            first = get_room_gallery(self.room)
+        self.assertEqual(first.generation, 0)
+        # Another worker stored new embeddings and bumped the generation
+        self.generation = 1
+        with self.assertLogs("utils.gallery", "WARNING"):
+            second = get_room_gallery(self.room)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.generation, 1)
+        self.assertIs(get_room_gallery(self.room), second)
+
+
+class AttendancePatchViewTests(SimpleTestCase):
+    def setUp(self):
+        self.student = mock.Mock(STUDENT_ID="S1", STUDENT_NAME="Student 1", STUDENT_BATCH="2024")
+        room_gallery = RoomGallery.__new__(RoomGallery)
+        room_gallery.student_ids = ["S1"]
+        room_gallery.course_codes = ["C1"]
+        room_gallery.students = {"S1": self.student}
+        # S9 is on the roster but was never enrolled
+        room_gallery.missing = ["S9"]
+        room_gallery.templates = np.array([[1.0, 0.0]], dtype=np.float32)
+        self.room = mock.Mock(ROOM_NO="101", EXAM_TIME="09:00")
+        self.attendances = mock.Mock()
+
+        self.enterContext(mock.patch.object(attendance_views.Room.objects, "get", return_value=self.room))
+        self.enterContext(mock.patch.object(attendance_views, "get_room_gallery", return_value=room_gallery))
+        self.enterContext(mock.patch.object(
+            attendance_views, "get_facial_engine", return_value=mock.Mock(threshold=0.7)))
+        self.extract_probe = self.enterContext(mock.patch.object(attendance_views, "extract_probe"))
+        self.enterContext(mock.patch.object(attendance_views.Course.objects, "get"))
+        exam = mock.Mock()
+        exam.COURSE_CODE.COURSE_NAME, exam.COURSE_CODE.COURSE_CODE = "Algorithms", "C1"
+        self.enterContext(mock.patch.object(attendance_views.Exam.objects, "get", return_value=exam))
+        self.enterContext(mock.patch.object(
+            attendance_views.Attendance.objects, "filter", return_value=self.attendances))
+
+    def patch(self):
+        image = SimpleUploadedFile("probe.jpg", b"image", content_type="image/jpeg")
+        return self.client.patch(
+            reverse('attendance-list') + "?room_no=101&exam_time=09:00",
+            encode_multipart(BOUNDARY, {"input_image": image}), content_type=MULTIPART_CONTENT)
+
+    def test_missing_roster_students_do_not_block_matching(self):
+        self.extract_probe.return_value = (np.array([0.9, 0.1]), None)
+        response = self.patch()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["student_id"], "S1")
+        self.attendances.update.assert_called_once_with(ATTENDANCE_STATUS=True)
+
+    def test_unmatched_probe(self):
+        self.extract_probe.return_value = (np.array([0.0, 1.0]), None)
+        response = self.patch()
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.json()["success"])
+        self.attendances.update.assert_not_called()
+
+
+class GroupAttendanceViewTests(SimpleTestCase):
+    def setUp(self):
+        self.students = {student_id: mock.Mock(STUDENT_ID=student_id, STUDENT_NAME=f"Student {student_id}",
+                                               STUDENT_BATCH="2024") for student_id in ["S1", "S2"]}
+        room_gallery = RoomGallery.__new__(RoomGallery)
+        room_gallery.student_ids = ["S1", "S2"]
+        room_gallery.course_codes = ["C1", "C2"]
+        room_gallery.students = self.students
+        room_gallery.templates = np.eye(3, dtype=np.float32)[:2]
+        self.room = mock.Mock(ROOM_NO="101", EXAM_TIME="09:00")
+        self.engine = mock.Mock(threshold=0.7)
+        # Only C1 has an exam today
+        self.exam = mock.Mock()
+        self.exam.COURSE_CODE.COURSE_CODE, self.exam.COURSE_CODE.COURSE_NAME = "C1", "Algorithms"
+
+        self.enterContext(mock.patch.object(attendance_views.Room.objects, "get", return_value=self.room))
+        self.enterContext(mock.patch.object(attendance_views, "get_room_gallery", return_value=room_gallery))
+        self.enterContext(mock.patch.object(attendance_views, "get_facial_engine", return_value=self.engine))
+        self.enterContext(mock.patch.object(attendance_views.Exam.objects, "filter")
+                          ).return_value.select_related.return_value = [self.exam]
+        self.atomic = self.enterContext(mock.patch.object(attendance_views.transaction, "atomic"))
+        self.in_transaction = False
+        self.atomic.return_value.__enter__.side_effect = lambda: setattr(self, "in_transaction", True)
+        self.atomic.return_value.__exit__.side_effect = lambda *args: setattr(self, "in_transaction", False)
+        self.attendances = self.enterContext(mock.patch.object(attendance_views.Attendance.objects, "filter"))
+        self.attendances.return_value.update.side_effect = lambda **kwargs: self.assertTrue(self.in_transaction)
+
+    def face(self, features=None, error=None):
+        return {"box": [0, 0, 10, 10], "confidence": 0.99, "error": error,
+                "features": np.array(features, dtype=np.float32) if features is not None else None}
+
+    def patch(self):
+        image = SimpleUploadedFile("row.jpg", b"image", content_type="image/jpeg")
+        return self.client.patch(
+            reverse('group-attendance') + "?room_no=101&exam_time=09:00",
+            encode_multipart(BOUNDARY, {"input_image": image}), content_type=MULTIPART_CONTENT)
+
+    def test_outcome_of_every_face(self):
+        self.engine.extract_faces.return_value = ([
+            self.face(error='too_blurry'),
+            self.face([1.0, 0.1, 0.0]),
+            self.face([0.0, 1.0, 0.1]),
+            self.face([0.0, 0.0, 1.0]),
+        ], None)
+        response = self.patch()
+        self.assertEqual(response.status_code, 202)
+        faces = response.json()["faces"]
+        self.assertEqual([face["outcome"] for face in faces], ["rejected", "marked", "exam_not_found", "no_match"])
+        self.assertEqual(faces[0]["reason"], 'too_blurry')
+        self.assertEqual(faces[1]["student_id"], "S1")
+        self.assertEqual(faces[1]["exam"], "Algorithms")
+        self.assertEqual(faces[2]["student_id"], "S2")
+        self.assertEqual(response.json()["marked"], 1)
+        self.assertTrue(response.json()["success"])
+
+        # The marked students are updated inside one transaction
+        self.atomic.assert_called_once()
+        self.attendances.assert_called_once_with(
+            STUDENT_ID__in=[self.students["S1"]], EXAM_ID=self.exam, ROOM_NO=self.room)
+        self.attendances.return_value.update.assert_called_once_with(ATTENDANCE_STATUS=True)
+
+    def test_photo_without_faces_is_rejected(self):
+        self.engine.extract_faces.return_value = ([], 'no_face')
+        response = self.patch()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["reason"], 'no_face')
+        self.attendances.assert_not_called()
+
+
+class BurstFusionTests(SimpleTestCase):
+    def test_fused_probe_is_the_normalized_mean(self):
+        fused = FacialRecognition.fuse_embeddings([np.array([2.0, 0.0]), np.array([0.0, 0.5])])
+        np.testing.assert_allclose(fused, np.array([1.0, 1.0]) / np.sqrt(2), rtol=1e-6)
+
+    def test_match_requires_margin_over_runner_up(self):
+        gallery = RoomGallery.__new__(RoomGallery)
+        gallery.student_ids = ["S1", "S2"]
+        gallery.course_codes = ["C1", "C1"]
+        gallery.students = {"S1": "student 1", "S2": "student 2"}
+        gallery.templates = fused_templates([
+            [{"side": "front", "features": np.array([1.0, 0.0])}],
+            [{"side": "front", "features": np.array([0.95, 0.31])}],
+        ])
+        probe = np.array([1.0, 0.05])
+        self.assertEqual(gallery.match(probe, threshold=0.7)[0], "student 1")
+        self.assertIsNone(gallery.match(probe, threshold=0.7, margin=0.2))
+
+
+class BurstExtractionTests(SimpleTestCase):
+    def setUp(self):
+        # A fake detector finding one face per frame and a model embedding the frame marker
+        self.facial = FacialRecognition.__new__(FacialRecognition)
+        self.facial.decode_min_side = 0
+        self.facial.quality_gate = None
+        self.facial.probe_cache = None
+        self.confidences = {}
+        self.facial.detect_faces = mock.Mock(side_effect=lambda pixels: [
+            {"box": [0, 0, pixels.shape[1], pixels.shape[0]],
+             "confidence": self.confidences.get(int(pixels[0, 0, 2]), 1.0)}]
+            if pixels[0, 0, 2] != 255 else [])
+        self.facial.embed_faces = mock.Mock(
+            side_effect=lambda faces: [np.array([float(np.asarray(face)[0, 0, 2])]) for face in faces])
+
+    def frame(self, marker, texture, brightness=128, size=64):
+        # The blue channel holds the marker of the frame, the others its texture
+        rng = np.random.default_rng(marker)
+        pixels = np.full((size, size, 3), brightness, dtype=np.uint8)
+        noise = rng.integers(-texture, texture + 1, size=(size, size, 2)) if texture else 0
+        pixels[..., :2] = np.clip(brightness + noise, 0, 255)
+        pixels[..., 2] = marker
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_sharpest_confident_frames_are_embedded_best_first(self):
+        # Frame 20 is as sharp as frame 30 but its detection is less confident
+        self.confidences = {20: 0.3}
+        frames = [self.frame(10, 0), self.frame(20, 60), self.frame(30, 60), b"not an image"]
+        embeddings, reports, error = self.facial.extract_burst(frames, best=2)
+        self.assertIsNone(error)
+        self.assertEqual([float(features[0]) for features in embeddings], [30.0, 20.0])
+        self.assertEqual(reports[3]["error"], 'decode_failed')
+        self.assertEqual(reports[0]["quality"], 0.0)
+        self.assertGreater(reports[2]["quality"], reports[1]["quality"])
+        self.facial.embed_faces.assert_called_once()
+
+    def test_most_common_frame_error_is_reported(self):
+        frames = [b"not an image", self.frame(255, 30), self.frame(255, 30)]
+        embeddings, reports, error = self.facial.extract_burst(frames)
+        self.assertEqual((embeddings, error), ([], 'no_face'))
+        self.assertEqual([report["error"] for report in reports], ['decode_failed', 'no_face', 'no_face'])
+
+        self.facial.quality_gate = QualityGate()
+        frames = [self.frame(10, 3, brightness=5, size=200), self.frame(20, 3, brightness=5, size=200)]
+        self.assertEqual(self.facial.extract_burst(frames)[2], 'too_dark')
+        self.facial.embed_faces.assert_not_called()
+
+    def test_inference_failure_keeps_the_reports(self):
+        self.facial.embed_faces.side_effect = RuntimeError("out of memory")
+        embeddings, reports, error = self.facial.extract_burst([self.frame(10, 30), self.frame(20, 30)])
+        self.assertEqual((embeddings, error), ([], 'inference_failed'))
+        self.assertEqual(len(reports), 2)
+
+
+class FeatureBatchTests(SimpleTestCase):
+    # Same fake detector and model as the burst tests
+    setUp = BurstExtractionTests.setUp
+    frame = BurstExtractionTests.frame
+
+    def test_failures_keep_their_position(self):
+        items = [(self.frame(10, 0), 'left'), (b"not an image", 'right'),
+                 (self.frame(255, 0), 'front'), (self.frame(30, 0), 'front')]
+        results = self.facial.extract_features_batch(items)
+        self.assertEqual([error for _, error in results], [None, 'decode_failed', 'no_face', None])
+        self.assertEqual([features.tolist() for features, _ in results], [[10.0], [], [], [30.0]])
+        # The faces that were found share one forward pass
+        self.assertEqual(len(self.facial.embed_faces.call_args.args[0]), 2)
+
+    def test_inference_failure_only_marks_embedded_faces(self):
+        self.facial.embed_faces.side_effect = RuntimeError("out of memory")
+        items = [(self.frame(10, 0), 'left'), (b"not an image", 'right'), (self.frame(30, 0), 'front')]
+        results = self.facial.extract_features_batch(items)
+        self.assertEqual([error for _, error in results], ['inference_failed', 'decode_failed', 'inference_failed'])
+
+
+class MatchBurstTests(SimpleTestCase):
+    def setUp(self):
+        self.gallery = RoomGallery.__new__(RoomGallery)
+        self.gallery.student_ids = ["S1", "S2"]
+        self.gallery.course_codes = ["C1", "C1"]
+        self.gallery.students = {"S1": "student 1", "S2": "student 2"}
+        self.gallery.templates = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        self.enterContext(override_settings(FACIAL_BURST_MARGIN=0.3))
+
+    def test_stops_at_the_first_confident_fusion(self):
+        # The first frame alone is ambiguous, fused with the second it clearly is S1
+        embeddings = [np.array([0.75, 0.66]), np.array([1.0, 0.0]), np.array([0.0, 1.0])]
+        match, count = attendance_views.match_burst(self.gallery, embeddings, 0.7)
+        self.assertEqual((match[0], count), ("student 1", 2))
+
+    def test_falls_back_to_the_threshold_over_every_frame(self):
+        embeddings = [np.array([0.75, 0.66]), np.array([0.72, 0.69])]
+        match, count = attendance_views.match_burst(self.gallery, embeddings, 0.7)
+        self.assertEqual((match[0], count), ("student 1", 2))
+        self.assertEqual(attendance_views.match_burst(self.gallery, embeddings, 0.9), (None, 2))
+
+
+class FusedTemplateTests(SimpleTestCase):
+    def test_fused_template_scores_like_the_weighted_sides(self):
+        rng = np.random.default_rng(0)
+        sides = [("left", rng.normal(size=16)), ("right", rng.normal(size=16)),
+                 ("front", rng.normal(size=16))]
+        probe = rng.normal(size=16)
+
+        vectors = [StudentEmbedding.normalize(features) for _, features in sides]
+        template = StudentEmbedding.fuse(
+            vectors, [FacialRecognition.side_weight(side) for side, _ in sides])
+
+        gallery, weights = FacialRecognition.pack_gallery(
+            [[{"side": side, "features": features} for side, features in sides]])
+        expected = FacialRecognition.score_gallery(probe, gallery, weights)
+        np.testing.assert_allclose(
+            FacialRecognition.score_templates(probe, template[None]), expected, rtol=1e-5)
+
+    def test_build_adds_a_fused_row(self):
+        student = Student(STUDENT_ID="S1")
+        rows = StudentEmbedding.build(
+            student, [{"side": "front", "features": np.array([3.0, 4.0]), "weight": 3}], "v1")
+        self.assertEqual([row.SIDE for row in rows], ["front", "fused"])
+        np.testing.assert_allclose(rows[0].as_array(), [0.6, 0.8])
+        np.testing.assert_allclose(rows[1].as_array(), [0.6, 0.8])
+
+
+class QuantizedIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.students = [
+            [{"side": side, "features": rng.normal(size=128)} for side in ['left', 'right', 'front']]
+            for _ in range(300)
+        ]
+        self.ids = [f"S{i:03d}" for i in range(300)]
+        self.templates = fused_templates(self.students)
+        exact = dict(zip(self.ids, self.templates))
+        self.fetch = lambda ids: {student_id: exact[student_id] for student_id in ids}
+        self.reference = StudentIndex(dim=128)
+        self.reference.build(self.ids, self.templates)
+        # Noisy captures of the front side of the first students
+        self.probes = [np.asarray(student[2]["features"]) + rng.normal(scale=0.5, size=128)
+                       for student in self.students[:100]]
+
+    def test_codes_decode_close_to_the_vectors(self):
+        for quantization in ['float16', 'int8']:
+            codes, scales = quantize(self.templates, quantization)
+            np.testing.assert_allclose(dequantize(codes, scales), self.templates, atol=0.01)
+        self.assertEqual(quantize(self.templates, 'int8')[0].nbytes * 4, self.templates.nbytes)
+
+    def test_recall_matches_full_precision(self):
+        for quantization in ['float16', 'int8']:
+            index = StudentIndex(dim=128, quantization=quantization, fetch_templates=self.fetch)
+            index.build(self.ids, self.templates)
+            for probe in self.probes:
+                expected = self.reference.search(probe, k=5)
+                results = index.search(probe, k=5, rerank=16)
+                self.assertEqual([student_id for student_id, _ in results],
+                                 [student_id for student_id, _ in expected])
+                # Re-ranked scores are the exact float32 scores
+                self.assertAlmostEqual(results[0][1], expected[0][1], places=5)
+
+    def test_quantization_is_saved(self):
+        index = StudentIndex(dim=128, quantization='int8', fetch_templates=self.fetch)
+        index.build(self.ids, self.templates)
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'index.npz')
+        index.save(path)
+        loaded = StudentIndex.load(path, fetch_templates=self.fetch)
+        self.assertEqual(loaded.quantization, 'int8')
+        self.assertEqual(loaded.model_version, index.model_version)
+        self.assertEqual(loaded.templates.dtype, np.int8)
+        self.assertEqual(loaded.search(self.probes[3], k=1), index.search(self.probes[3], k=1))
+
+
+class GallerySnapshotTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.ids = [f"S{i:03d}" for i in range(20)]
+        feature_lists = {
+            student_id: [{"side": side, "features": StudentEmbedding.normalize(rng.normal(size=64)),
+                          "weight": FacialRecognition.side_weight(side)}
+                         for side in ['left', 'right', 'front']]
+            for student_id in self.ids
+        }
+        self.templates = {
+            student_id: StudentEmbedding.fuse([entry["features"] for entry in entries],
+                                              [entry["weight"] for entry in entries])
+            for student_id, entries in feature_lists.items()
+        }
+        self.enterContext(override_settings(
+            FACIAL_SNAPSHOT_DIR=self.enterContext(tempfile.TemporaryDirectory())))
+        self.enterContext(mock.patch("utils.gallery.load_templates", return_value=self.templates))
+        # No student changed since the export unless a test says otherwise
+        self.read_changed_students = gallery_snapshot.changed_students
+        self.changed_students = self.enterContext(
+            mock.patch.object(gallery_snapshot, "changed_students", return_value=set()))
+        self.enterContext(mock.patch.object(gallery_snapshot, "_snapshot", None))
+
+    def test_snapshot_is_memory_mapped(self):
+        path = gallery_snapshot.export_snapshot()
+        snapshot = gallery_snapshot.get_snapshot()
+        self.assertEqual(snapshot.version, os.path.basename(path))
+        self.assertEqual(len(snapshot), 20)
+        self.assertIsInstance(snapshot.templates, np.memmap)
+        self.assertEqual(sorted(os.listdir(path)), ['ids.npy', 'meta.json', 'templates.npy'])
+        found = snapshot.templates_of(["S004", "S019", "unknown"])
+        self.assertEqual(set(found), {"S004", "S019"})
+        np.testing.assert_allclose(found["S004"], self.templates["S004"], rtol=1e-6)
+
+    def test_newer_snapshot_replaces_the_current_one(self):
+        first = gallery_snapshot.export_snapshot(keep=1)
+        self.assertIs(gallery_snapshot.get_snapshot(), gallery_snapshot.get_snapshot())
+        with mock.patch("time.time", return_value=time.time() + 5):
+            second = gallery_snapshot.export_snapshot(keep=1)
+        self.assertEqual(gallery_snapshot.get_snapshot().version, os.path.basename(second))
+        self.assertFalse(os.path.exists(first))
+
+    def test_changed_students_are_skipped(self):
+        gallery_snapshot.export_snapshot()
+        snapshot = gallery_snapshot.get_snapshot()
+        # Another worker stored new embeddings for S004 after the export
+        self.changed_students.return_value = {"S004"}
+        self.assertEqual(set(snapshot.templates_of(["S004", "S005", "unknown"])), {"S005"})
+        self.changed_students.assert_called_once_with(["S004", "S005"], snapshot.model_version, snapshot.created_at)
+
+    def test_changes_are_read_from_the_embedding_timestamps(self):
+        with mock.patch.object(StudentEmbedding.objects, "filter") as filter_embeddings:
+            filter_embeddings.return_value.values_list.return_value = ["S004"]
+            changed = self.read_changed_students(["S004", "S005"], "facenet-vggface2", 1_700_000_000.5)
+        self.assertEqual(changed, {"S004"})
+        filter_embeddings.assert_called_once_with(
+            STUDENT_ID__in=["S004", "S005"], MODEL_VERSION="facenet-vggface2", SIDE=StudentEmbedding.Side.FUSED,
+            UPDATED_AT__gte=datetime(2023, 11, 14, 22, 13, 20, 500000, tzinfo=timezone.utc))
+
+    def test_snapshot_of_another_model_is_ignored(self):
+        gallery_snapshot.export_snapshot()
+        with mock.patch.object(gallery_snapshot, "model_version", return_value="other"):
+            self.assertIsNone(gallery_snapshot.get_snapshot())
+
+
+class GallerySnapshotTaskTests(SimpleTestCase):
+    def setUp(self):
+        self.tasks = self.enterContext(mock.patch("Management.tasks.Task.objects.filter"))
+        self.refresh = self.enterContext(mock.patch("Management.tasks.refresh_gallery_snapshot"))
+
+    def test_daily_export_is_scheduled_once(self):
+        self.tasks.return_value.exists.return_value = True
+        tasks.schedule_gallery_snapshot_task()
+        self.refresh.assert_not_called()
+        self.assertEqual(self.tasks.call_args.kwargs["repeat"], Task.DAILY)
+
+        self.tasks.return_value.exists.return_value = False
+        tasks.schedule_gallery_snapshot_task()
+        self.assertEqual(self.refresh.call_args.kwargs["repeat"], Task.DAILY)
+
+    def test_running_refresh_does_not_cover_new_changes(self):
+        self.tasks.return_value.exists.return_value = False
+        tasks.schedule_gallery_snapshot_refresh()
+        self.assertEqual(self.tasks.call_args.kwargs,
+                         {"task_name": 'Management.tasks.refresh_gallery_snapshot',
+                          "repeat": Task.NEVER, "locked_by__isnull": True})
+        self.refresh.assert_called_once()
+
+    def test_index_merge_is_scheduled_once(self):
+        with mock.patch("Management.tasks.merge_student_index_changes") as merge:
+            self.tasks.return_value.exists.return_value = True
+            tasks.schedule_student_index_merge()
+            merge.assert_not_called()
+
+            self.tasks.return_value.exists.return_value = False
+            tasks.schedule_student_index_merge()
+            merge.assert_called_once_with()
+
+
+class EnrollBulkTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.command = enroll_bulk.Command()
+        self.manifest = os.path.join(self.root, "students.csv")
+        rows = ["student_id,student_name,student_batch,left,right,front"]
+        for student_id in ["S1", "S2", "S1", "S3"]:
+            rows.append(f"{student_id},Student {student_id},2024,{student_id}/left.jpg,"
+                        f"{student_id}/right.jpg,{student_id}/front.jpg")
+        with open(self.manifest, 'w') as manifest:
+            manifest.write("\n".join(rows) + "\n")
+        for student_id in ["S1", "S2", "S3"]:
+            os.makedirs(os.path.join(self.root, student_id))
+            for side in enroll_bulk.SIDES:
+                with open(os.path.join(self.root, student_id, f"{side}.jpg"), 'wb') as image:
+                    image.write(f"{student_id}/{side}".encode())
+
+    def test_manifest_paths_are_relative_to_the_csv(self):
+        records = self.command.read_manifest(self.manifest)
+        self.assertEqual([record['student_id'] for record in records], ["S1", "S2", "S1", "S3"])
+        self.assertEqual(records[0]['left'], os.path.join(self.root, "S1/left.jpg"))
+        items, reason = self.command.read_images(records[0])
+        self.assertIsNone(reason)
+        self.assertEqual([side for _, side in items], enroll_bulk.SIDES)
+
+    def test_missing_manifest_columns_are_reported(self):
+        with open(self.manifest, 'w') as manifest:
+            manifest.write("student_id,left\nS1,left.jpg\n")
+        with self.assertRaises(CommandError):
+            self.command.read_manifest(self.manifest)
+
+    def test_repeated_student_ids_are_split_out(self):
+        records, duplicates = self.command.split_duplicates(self.command.read_manifest(self.manifest))
+        self.assertEqual([record['student_id'] for record in records], ["S1", "S2", "S3"])
+        self.assertEqual(duplicates, ["S1"])
+
+    def test_checkpoint_skips_failures_unless_retried(self):
+        checkpoint = os.path.join(self.root, "students.checkpoint")
+        with open(checkpoint, 'w') as checkpoint_file:
+            checkpoint_file.write("S1\tenrolled\nS2\tno_face\n")
+        self.assertEqual(self.command.read_checkpoint(checkpoint, retry_failed=False), {"S1", "S2"})
+        self.assertEqual(self.command.read_checkpoint(checkpoint, retry_failed=True), {"S1"})
+        self.assertEqual(self.command.read_checkpoint(os.path.join(self.root, "none"), False), set())
+
+        records = self.command.read_manifest(self.manifest)
+        self.assertEqual([record['student_id'] for record in self.command.pending_records(records, {"S1"})],
+                         ["S2", "S3"])
+
+    def run_command(self, enrolled, failing, *args, embedded=()):
+        def submit(name, items):
+            # Students listed in `failing` have no face in their front image
+            future = Future()
+            future.set_result([(None, 'no_face') if image.decode().split('/')[0] in failing
+                               and side == 'front' else (np.ones(4), None) for image, side in items])
+            return future
+
+        def write_chunk(buffer, checkpoint, existing):
+            self.assertEqual(existing, set(enrolled))
+            written.extend(record['student_id'] for record, _ in buffer)
+            checkpoint.writelines(f"{record['student_id']}\tenrolled\n" for record, _ in buffer)
+            return len(buffer)
+
+        written = []
+        with mock.patch.object(enroll_bulk, "InferencePool") as pool, \
+                mock.patch.object(enroll_bulk, "engine_settings", return_value={'detector': 'haar'}), \
+                mock.patch.object(enroll_bulk.Student.objects, "values_list", return_value=enrolled), \
+                mock.patch.object(enroll_bulk.StudentEmbedding.objects, "filter") as embeddings, \
+                mock.patch.object(enroll_bulk.Command, "write_chunk", side_effect=write_chunk), \
+                mock.patch.object(enroll_bulk, "rebuild_student_index"), \
+                mock.patch.object(enroll_bulk, "export_snapshot"), \
+                mock.patch.object(enroll_bulk, "invalidate_all"):
+            pool.return_value.submit.side_effect = submit
+            embeddings.return_value.values_list.return_value = embedded
+            output = StringIO()
+            call_command('enroll_bulk', self.manifest, '--workers', '1', *args, stdout=output)
+        return written, pool, output.getvalue()
+
+    def test_resume_after_failures(self):
+        written, pool, output = self.run_command([], {"S2"})
+        self.assertCountEqual(written, ["S1", "S3"])
+        self.assertIn("1 students failed: no_face", output)
+        self.assertIn("1 students failed: duplicate_student_id", output)
+        # The workers get the engine settings of the web workers
+        engine_kwargs = pool.call_args.args[1]
+        self.assertEqual(engine_kwargs['detector'], 'haar')
+        self.assertEqual(engine_kwargs['inter_op_threads'], 1)
+
+        # Enrolled and failed students are skipped by the next run
+        written, pool, _ = self.run_command(["S1", "S3"], set())
+        self.assertEqual(written, [])
+        pool.return_value.submit.assert_not_called()
+
+        written, _, _ = self.run_command(["S1", "S3"], set(), '--retry-failed')
+        self.assertEqual(written, ["S2"])
+
+    def test_reembed_students_without_current_embeddings(self):
+        self.run_command([], set())
+        # S3 already has embeddings of the current version, the others only older ones
+        written, _, _ = self.run_command(["S1", "S2", "S3"], set(), '--reembed', embedded=["S3"])
+        self.assertCountEqual(written, ["S1", "S2"])
+        self.assertTrue(os.path.exists(os.path.join(self.root, f"students.csv.{model_version()}.checkpoint")))
+
+
+class FacialReadinessTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = mock.Mock()
+        warmed_up = threading.Event()
+        self.engine.pool.warm_up.side_effect = lambda: warmed_up.wait(5)
+        self.warmed_up = warmed_up
+        self.enterContext(mock.patch.object(facial, "get_facial_engine", return_value=self.engine))
+        self.enterContext(mock.patch.object(facial, "_ready", threading.Event()))
+        self.examiner = APIClient()
+        self.examiner.force_authenticate(user=User(username="examiner"))
+
+    def test_anonymous_probe_only_gets_the_ready_flag(self):
+        response = self.client.get(reverse('facial-readiness'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"READY": False})
+        # Only authenticated callers may start the warm-up
+        self.engine.pool.warm_up.assert_not_called()
+
+        facial._ready.set()
+        response = self.client.get(reverse('facial-readiness'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"READY": True})
+
+    def test_not_ready_until_warmed_up(self):
+        response = self.examiner.get(reverse('facial-readiness'))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["READY"])
+
+        # Probes during the warm-up do not start another one
+        self.examiner.get(reverse('facial-readiness'))
+        self.warmed_up.set()
+        facial._warm_up_thread.join(5)
+        self.engine.pool.warm_up.assert_called_once()
+
+        response = self.examiner.get(reverse('facial-readiness'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["READY"])
+        self.assertIn("ADMISSION", response.json())
+
+    def test_failed_warm_up_is_reported_and_retried(self):
+        self.engine.pool.warm_up.side_effect = RuntimeError("model weights missing")
+        self.examiner.get(reverse('facial-readiness'))
+        facial._warm_up_thread.join(5)
+
+        response = self.examiner.get(reverse('facial-readiness'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["Error"], "model weights missing")
+        facial._warm_up_thread.join(5)
+        self.assertEqual(self.engine.pool.warm_up.call_count, 2)
+
+
+class ModelTierTests(SimpleTestCase):
+    def test_version_of_every_tier(self):
+        with override_settings(FACIAL_MODEL_TIER='accurate', FACIAL_FAST_MODEL_VERSION='facenet-vggface2-int8'):
+            self.assertEqual(model_version(), 'facenet-vggface2')
+            self.assertEqual(model_version('fast'), 'facenet-vggface2-int8')
+        with self.assertRaises(ValueError):
+            model_version('tiny')
+
+    def test_exported_version_must_match_the_setting(self):
+        self.assertEqual(check_version('fast.pt', b'facenet-vggface2-int8', 'facenet-vggface2-int8'),
+                         'facenet-vggface2-int8')
+        with self.assertRaises(ImproperlyConfigured):
+            check_version('fast.pt', b'facenet-vggface2-int8', 'facenet-vggface2')
+
+
+class AdmissionControlTests(SimpleTestCase):
+    def test_search_is_shed_before_attendance(self):
+        controller = AdmissionController(max_queue=4, max_wait=60)
+        self.assertIsNone(controller.admit('search'))
+        self.assertIsNone(controller.admit('search'))
+        # Searches may only use half of the queue, attendance keeps the rest
+        self.assertGreaterEqual(controller.admit('search'), 1)
+        self.assertIsNone(controller.admit('attendance'))
+        self.assertIsNone(controller.admit('attendance'))
+        self.assertIsNotNone(controller.admit('attendance'))
+
+        controller.release()
+        self.assertIsNone(controller.admit('attendance'))
+        stats = controller.stats()
+        self.assertEqual(stats["depth"], 4)
+        self.assertEqual(stats["rejected"], {'attendance': 1, 'search': 1})
+
+    def test_estimated_wait_follows_the_completion_rate(self):
+        controller = AdmissionController(max_queue=100, max_wait=2, window=10)
+        for _ in range(10):
+            controller.admit('attendance')
+            controller.release()
+        # 1 request per second: 2 running requests are 2 seconds of wait
+        for _ in range(2):
+            self.assertIsNone(controller.admit('attendance'))
+        self.assertAlmostEqual(controller.estimated_wait(), 2.0)
+        self.assertIsNone(controller.admit('attendance'))
+        self.assertEqual(controller.admit('attendance'), 1.0)
+        # Searches are turned away at half the wait
+        self.assertGreaterEqual(controller.admit('search'), 1.5)
+
+    def test_rejected_requests_get_retry_after(self):
+        controller = AdmissionController(max_queue=2, max_wait=60)
+        controller.admit('attendance')
+        controller.admit('attendance')
+        view = mock.Mock()
+
+        @admission_control('attendance')
+        def attend(view, request):
+            return "served"
+
+        @admission_control('search')
+        def search(view, request):
+            return "served"
+
+        with mock.patch("utils.admission.get_admission_controller", return_value=controller):
+            response = attend(view, None)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], "1")
+            self.assertEqual(search(view, None).status_code, 429)
+
+            controller.release()
+            self.assertEqual(attend(view, None), "served")
+            self.assertEqual(controller.stats()["depth"], 1)
+
+
+class FacialRecognitionClientTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = mock.Mock()
+        self.client_engine = FacialRecognitionClient(self.pool)
+
+    def test_methods_run_in_the_pool(self):
+        self.pool.call.return_value = [(np.ones(512), None)]
+        results = self.client_engine.extract_features_batch([(b"image", 'front')])
+        self.pool.call.assert_called_once_with('extract_features_batch', [(b"image", 'front')])
+        self.assertEqual(results, [(self.pool.call.return_value[0][0], None)])
+
+    def test_static_methods_and_constants_stay_local(self):
+        self.assertEqual(self.client_engine.side_weight('front'), FacialRecognition.side_weight('front'))
+        self.assertEqual(self.client_engine.CROP_FORMATS, FacialRecognition.CROP_FORMATS)
+        self.pool.call.assert_not_called()
+
+    def test_instance_attributes_are_fetched_once(self):
+        self.pool.call.return_value = 0.7
+        self.assertEqual(self.client_engine.threshold, 0.7)
+        self.assertEqual(self.client_engine.threshold, 0.7)
+        self.pool.call.assert_called_once_with('threshold')
+
+
+class InferencePoolTests(SimpleTestCase):
+    def setUp(self):
+        # Worker engines expose the pid of their process and a way to kill it
+        self.pool = InferencePool(2, {'threshold': 0.7, 'pid': os.getpid, 'exit': os._exit},
+                                  engine_factory=types.SimpleNamespace)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_calls_run_in_worker_processes(self):
+        self.assertEqual(self.pool.call('threshold'), 0.7)
+        self.assertNotEqual(self.pool.call('pid'), os.getpid())
+        with self.assertRaises(AttributeError):
+            self.pool.call('missing')
+
+    def test_warm_up_runs_once_in_every_worker(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        # Every warm-up leaves a file behind
+        warm_up = functools.partial(tempfile.mkstemp, dir=directory)
+        pool = InferencePool(3, {'threshold': 0.7, 'warm_up': warm_up}, engine_factory=types.SimpleNamespace)
+        self.addCleanup(pool.shutdown)
+        pool.warm_up()
+        self.assertEqual(len(os.listdir(directory)), 3)
+        # Warming up again starts no new worker
+        pool.warm_up()
+        self.assertEqual(pool.call('threshold'), 0.7)
+        self.assertEqual(len(os.listdir(directory)), 3)
+
+    def test_dead_worker_restarts_the_pool(self):
+        with self.assertRaises(Exception):
+            self.pool.call('exit', 1)
+        # The calls after the crash are served by fresh workers
+        self.assertEqual(self.pool.call('threshold'), 0.7)
+        self.assertEqual(self.pool.restarts, 1)
+
+
+class InferenceServerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.address = os.path.join(directory.name, "inference.sock")
+        self.pool = mock.Mock()
+        self.server = InferenceServer(self.pool, self.address, b"secret")
+        self.addCleanup(self.server.close)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("127.0.0.1:7000"), ("127.0.0.1", 7000))
+        self.assertEqual(parse_address("/run/facial.sock"), "/run/facial.sock")
+
+    def test_calls_are_forwarded_to_the_pool(self):
+        self.pool.call.return_value = [(None, 'no_face')]
+        remote = InferenceServerClient(self.address, b"secret")
+        self.assertEqual(remote.call('extract_features_batch', [(b"image", 'front')]), [(None, 'no_face')])
+        self.pool.call.assert_called_once_with('extract_features_batch', [(b"image", 'front')])
+
+        remote.warm_up()
+        self.pool.warm_up.assert_called_once_with()
+
+    def test_errors_are_raised_in_the_client(self):
+        self.pool.call.side_effect = ValueError("Invalid image")
+        remote = InferenceServerClient(self.address, b"secret")
+        with self.assertRaisesRegex(ValueError, "Invalid image"):
+            remote.call('extract_faces', b"image")
+        # The connection is reused after an error
+        self.pool.call.side_effect = None
+        self.pool.call.return_value = 0.7
+        self.assertEqual(remote.call('threshold'), 0.7)
+
+    def test_concurrent_clients_share_the_server(self):
+        self.pool.call.side_effect = lambda name, value: value
+        remote = InferenceServerClient(self.address, b"secret")
+        results = [None] * 8
+
+        def call(i):
+            results[i] = remote.call('echo', i)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, list(range(8)))
+
+    def test_wrong_key_is_rejected(self):
+        with self.assertRaises(Exception):
+            InferenceServerClient(self.address, b"guess").call('threshold')
+        self.pool.call.assert_not_called()
@@ -3,8 +3,8 @@ from Management.views.students_views import StudentList, StudentDetail
 from Management.views.course_views import CourseList, CourseDetail
 from Management.views.exam_views import ExamList, ExamDetail
 from Management.views.room_views import RoomList, RoomDetail
-from Management.views.attendance_views import AttendanceList, AttendanceDetail, NoImageAttendance, GenerateAttendanceReport, SearchStudentWithImage
-from Management.views.mobile_views import ExaminerList, ExaminerDetail, ExaminerActiveCheck
+from Management.views.attendance_views import AttendanceList, AttendanceDetail, NoImageAttendance, GenerateAttendanceReport, SearchStudentWithImage, GroupAttendance
+from Management.views.mobile_views import ExaminerList, ExaminerDetail, ExaminerActiveCheck, FacialReadinessCheck
 
 urlpatterns = [
     path('students/', StudentList.as_view(), name='student-list'),
@@ -22,10 +22,13 @@ urlpatterns = [
          name='attendance-detail'),
     path('attendances/no-image/', NoImageAttendance.as_view(),
          name='no-image-attendance'),
+    path('attendances/group/', GroupAttendance.as_view(),
+         name='group-attendance'),
     path('attendances/generate-report/',
          GenerateAttendanceReport.as_view(), name='generate-attendance-report'),
     path('examiners/', ExaminerList.as_view(), name='examiner-list'),
     path('examiners/<str:uuid>/', ExaminerDetail.as_view(), name='examiner-detail'),
     path('check/<str:uuid>/', ExaminerActiveCheck.as_view(),
          name='examiner-active-check'),
+    path('ready/', FacialReadinessCheck.as_view(), name='facial-readiness'),
 ]
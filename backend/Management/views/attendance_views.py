@@ -1,19 +1,73 @@
 import json
 import os
 from django.shortcuts import get_list_or_404
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from Management.models import Room, Student, Course, Exam, Attendance
 from Management.serializers import RoomSerializer, StudentSerializer, CourseSerializer, ExamSerializer, AttendanceSerializer
 from django.http import FileResponse, Http404
+from django.conf import settings
+from django.db import transaction
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from facial import FacialRecognition
+from facial import FacialRecognition, get_facial_engine
 from utils.report_generation import ReportGenerator
+from utils.gallery import get_room_gallery
+from utils.student_index import get_student_index
+from utils.face_quality import REJECTION_MESSAGES
+from utils.admission import admission_control
 
-facial = FacialRecognition()
+
+def extract_probe(facial, image_bytes, crop_format=None):
+    """
+    Extract the features of a captured front photo, or of a face already cropped on the device.
+
+    Args:
+        facial (FacialRecognition): The engine used for extraction.
+        image_bytes (bytes): The content of the photo or face crop.
+        crop_format (str): The declared format of a face crop, or None for a full photo.
+
+    Returns:
+        tuple[np.ndarray, Response]: The features, and an error response with the
+            machine-readable reason the photo was rejected (or None).
+    """
+    if crop_format is None:
+        features, error = facial.extract_features_batch([(image_bytes, 'front')])[0]
+    elif crop_format not in FacialRecognition.CROP_FORMATS:
+        return np.array([]), Response(data={"Error": f"Unknown crop format: {crop_format}, expected one of {', '.join(FacialRecognition.CROP_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        # Device crops skip face detection
+        features, error = facial.extract_cropped_face(image_bytes, crop_format)
+    if error:
+        return features, Response(data={"Error": REJECTION_MESSAGES[error], "reason": error}, status=status.HTTP_400_BAD_REQUEST)
+    return features, None
+
+
+def match_burst(gallery, embeddings, threshold):
+    """
+    Match the embeddings of a burst against a room, stopping at the first confident match.
+
+    The best frames are fused one at a time, and a fused probe is accepted early once its
+    best student leads the runner-up by FACIAL_BURST_MARGIN. Otherwise the fusion of every
+    frame is matched on the threshold alone.
+
+    Args:
+        gallery (RoomGallery): The gallery of the room.
+        embeddings (list[np.ndarray]): The embeddings of the burst, best frame first.
+        threshold (float): The minimum weighted similarity of a match.
+
+    Returns:
+        tuple[tuple[Student, str, float] | None, int]: The match, and the number of frames fused.
+    """
+    for count in range(1, len(embeddings) + 1):
+        probe = FacialRecognition.fuse_embeddings(embeddings[:count])
+        match = gallery.match(probe, threshold, margin=settings.FACIAL_BURST_MARGIN)
+        if match is not None:
+            return match, count
+    return gallery.match(probe, threshold), len(embeddings)
 
 
 class AttendanceList(APIView):
@@ -57,76 +111,176 @@ class AttendanceList(APIView):
         serializer = AttendanceSerializer(attendances, many=True)
         return Response(serializer.data)
 
+    # Answer at once with Retry-After instead of queueing past the client timeout
+    @admission_control('attendance')
     def patch(self, request):
         room_no = request.query_params.get("room_no")
         exam_time = request.query_params.get("exam_time")
-        input_image = request.FILES.get("input_image")
+        # Several input_image files or an input_clip video form a burst of the same student
+        input_images = request.FILES.getlist("input_image")
+        input_clip = request.FILES.get("input_clip")
+        # Or an input_face cropped on the device, in the declared crop_format
+        input_face = request.FILES.get("input_face")
+        crop_format = request.data.get("crop_format")
 
         try:
             room = Room.objects.get(ROOM_NO=room_no, EXAM_TIME=exam_time)
         except Room.DoesNotExist:
             return Response(data={"Error": f"Room number: {room_no} not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Flatten the list of student IDs
-        student_ids = [
-            (student_id, student["course_code"])
-            for student in room.STUDENT_LIST
-            for student_id in student.get("students", [])
-        ]
-
-        for id, course_code in student_ids:
-            try:
-                student = Student.objects.get(STUDENT_ID=id)
-            except Student.DoesNotExist:
-                return Response(data={"Error": f"Student with an ID: {id} not found"}, status=status.HTTP_404_NOT_FOUND)
-
-            student_data = json.loads(StudentSerializer(
-                student).data["STUDENT_EXTRACTED_FEATURES"])
+        if not input_images and not input_clip and not input_face:
+            return Response(data={"Error": "Image not found"}, status=status.HTTP_404_NOT_FOUND)
+        if input_face and not crop_format:
+            return Response(data={"Error": "crop_format is required with input_face"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Load the embeddings of every student seated in the room once. Roster entries of
+        # unknown students are logged when the gallery is built and left out of the matching.
+        gallery = get_room_gallery(room)
+
+        facial = get_facial_engine()
+        frames_used = 1
+        if input_face:
+            input_image_feature, error = extract_probe(facial, input_face.read(), crop_format)
+            if error:
+                return error
+            match = gallery.match(input_image_feature, facial.threshold)
+        elif input_clip or len(input_images) > 1:
+            # Embed the best frames of the burst in one batch and fuse them
+            embeddings, _, error = facial.extract_burst(
+                frames=[image.read() for image in input_images[:settings.FACIAL_BURST_MAX_FRAMES]],
+                clip=input_clip.read() if input_clip else None,
+                best=settings.FACIAL_BURST_BEST_FRAMES,
+                max_frames=settings.FACIAL_BURST_MAX_FRAMES)
+            if error:
+                return Response(data={"Error": REJECTION_MESSAGES[error], "reason": error}, status=status.HTTP_400_BAD_REQUEST)
+            match, frames_used = match_burst(gallery, embeddings, facial.threshold)
+        else:
+            # Embed the input image once and score it against the whole room
+            input_image_feature, error = extract_probe(facial, input_images[0].read())
+            if error:
+                return error
+            match = gallery.match(input_image_feature, facial.threshold)
+
+        if match is None:
+            return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+
+        student, course_code, _ = match
+        data = {}
+        data.update({"student_id": student.STUDENT_ID})
+        data.update({"student_name": student.STUDENT_NAME})
+        data.update({"student_batch": student.STUDENT_BATCH})
 
-            # Extract features from the student's image
-            features = facial.compare_images(
-                stored_image_features_list=student_data, input_image_path=input_image.read())
+        today = datetime.today().date()
 
-            data = {}
+        # Save the attendance
+        try:
+            course = Course.objects.get(COURSE_CODE=course_code)
+        except Course.DoesNotExist:
+            return Response(data={"Error": f"Course with code: {course_code} not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            if features:
-                data.update({"student_id": student.STUDENT_ID})
-                data.update({"student_name": student.STUDENT_NAME})
-                data.update({"student_batch": student.STUDENT_BATCH})
+        try:
+            exam = Exam.objects.get(
+                COURSE_CODE=course, EXAM_DATE=today)
+        except Exam.DoesNotExist:
+            return Response(data={"Error": f"Exam for {course} not found"}, status=status.HTTP_404_NOT_FOUND)
 
-                today = datetime.today().date()
+        # Update the attendance record
+        attendance = Attendance.objects.filter(
+            STUDENT_ID=student, EXAM_ID=exam, ROOM_NO=room)
 
-                # Save the attendance
-                try:
-                    course = Course.objects.get(COURSE_CODE=course_code)
-                except Course.DoesNotExist:
-                    return Response(data={"Error": f"Course with code: {course_code} not found"}, status=status.HTTP_404_NOT_FOUND)
+        attendance.update(ATTENDANCE_STATUS=True)
+        data.update({"exam": exam.COURSE_CODE.COURSE_NAME})
+        data.update({"course_code": exam.COURSE_CODE.COURSE_CODE})
+        data.update({"exam_time": room.EXAM_TIME})
+        data.update({"room_no": room.ROOM_NO})
+        data.update({"frames_used": frames_used})
+        data.update({"success": True})
+        return Response(data=data, status=status.HTTP_202_ACCEPTED)
 
-                try:
-                    exam = Exam.objects.get(
-                        COURSE_CODE=course, EXAM_DATE=today)
-                except Exam.DoesNotExist:
-                    return Response(data={"Error": f"Exam for {course} not found"}, status=status.HTTP_404_NOT_FOUND)
 
-                # Update the attendance record
-                attendance = Attendance.objects.filter(
-                    STUDENT_ID=student, EXAM_ID=exam, ROOM_NO=room)
+class GroupAttendance(APIView):
+    """
+    Mark the attendance of every student recognized in one photo of a seated row.
+    """
 
-                attendance.update(ATTENDANCE_STATUS=True)
-                data.update({"exam": exam.COURSE_CODE.COURSE_NAME})
-                data.update({"course_code": exam.COURSE_CODE.COURSE_CODE})
-                data.update({"exam_time": room.EXAM_TIME})
-                data.update({"room_no": room.ROOM_NO})
-                data.update({"success": True})
-                return Response(data=data, status=status.HTTP_202_ACCEPTED)
+    @admission_control('attendance')
+    def patch(self, request):
+        room_no = request.query_params.get("room_no")
+        exam_time = request.query_params.get("exam_time")
+        input_image = request.FILES.get("input_image")
 
-            if not features:
-                data.update({"success": False})
+        try:
+            room = Room.objects.get(ROOM_NO=room_no, EXAM_TIME=exam_time)
+        except Room.DoesNotExist:
+            return Response(data={"Error": f"Room number: {room_no} not found"}, status=status.HTTP_404_NOT_FOUND)
 
-                return Response(data=data, status=status.HTTP_404_NOT_FOUND)
+        if not input_image:
+            return Response(data={"Error": "Image not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            if features == "No valid features extracted from the input image.":
-                return Response(data={"Error: No face detected in the image, please retake it again."}, status=status.HTTP_400_BAD_REQUEST)
+        gallery = get_room_gallery(room)
+
+        # Detect and embed every face of the photo in one batch
+        facial = get_facial_engine()
+        faces, error = facial.extract_faces(input_image.read())
+        if error:
+            return Response(data={"Error": REJECTION_MESSAGES[error], "reason": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        embedded = [i for i, face in enumerate(faces) if face["error"] is None]
+        matches = gallery.assign(
+            [faces[i]["features"] for i in embedded], facial.threshold)
+
+        # Today's exam of every course sat in the room, fetched at once
+        course_codes = {match[1] for match in matches if match is not None}
+        exams = {
+            exam.COURSE_CODE.COURSE_CODE: exam
+            for exam in Exam.objects.filter(
+                COURSE_CODE__COURSE_CODE__in=course_codes,
+                EXAM_DATE=datetime.today().date()).select_related("COURSE_CODE")
+        }
+
+        results = []
+        marked = {}
+        for face in faces:
+            result = {"box": face["box"], "confidence": face["confidence"]}
+            if face["error"] is not None:
+                result.update({"outcome": "rejected", "reason": face["error"]})
+            results.append(result)
+
+        for i, match in zip(embedded, matches):
+            result = results[i]
+            if match is None:
+                result.update({"outcome": "no_match"})
+                continue
+
+            student, course_code, score = match
+            result.update({
+                "student_id": student.STUDENT_ID,
+                "student_name": student.STUDENT_NAME,
+                "student_batch": student.STUDENT_BATCH,
+                "course_code": course_code,
+                "score": score,
+            })
+            exam = exams.get(course_code)
+            if exam is None:
+                result.update({"outcome": "exam_not_found"})
+                continue
+            result.update({"outcome": "marked", "exam": exam.COURSE_CODE.COURSE_NAME})
+            marked.setdefault(exam, []).append(student)
+
+        # Mark every recognized student together, or none of them
+        with transaction.atomic():
+            for exam, students in marked.items():
+                Attendance.objects.filter(
+                    STUDENT_ID__in=students, EXAM_ID=exam, ROOM_NO=room).update(ATTENDANCE_STATUS=True)
+
+        data = {
+            "room_no": room.ROOM_NO,
+            "exam_time": room.EXAM_TIME,
+            "faces": results,
+            "marked": sum(len(students) for students in marked.values()),
+            "success": bool(marked),
+        }
+        return Response(data=data, status=status.HTTP_202_ACCEPTED)
 
 
 class AttendanceDetail(APIView):
@@ -193,32 +347,44 @@ class NoImageAttendance(APIView):
 
 
 class SearchStudentWithImage(APIView):
+    # Searches are shed before attendance when the worker is saturated
+    @admission_control('search')
     def get(self, request):
         input_image = request.FILES.get("input_image")
+        # A face cropped on the device is sent as input_face with its crop_format
+        input_face = request.FILES.get("input_face")
+        crop_format = request.data.get("crop_format")
 
         print(input_image)
 
-        if not input_image:
+        if not input_image and not input_face:
             return Response(data={"Error": "Image not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        # Filter students based on some criteria if possible
-        students = Student.objects.all()
-
-        for student in students:
-            student_data = json.loads(StudentSerializer(
-                student).data["STUDENT_EXTRACTED_FEATURES"])
-
-            is_student = facial.compare_images(
-                stored_image_features_list=student_data, input_image_path=input_image.read())
-
-            if is_student:
-                data = {
-                    'student_id': student.STUDENT_ID,
-                    'student_name': student.STUDENT_NAME,
-                    'student_batch': student.STUDENT_BATCH
-                }
-
-                return Response(data=data, status=status.HTTP_202_ACCEPTED)
+        if input_face and not crop_format:
+            return Response(data={"Error": "crop_format is required with input_face"}, status=status.HTTP_400_BAD_REQUEST)
+
+        facial = get_facial_engine()
+        if input_face:
+            input_image_feature, error = extract_probe(facial, input_face.read(), crop_format)
+        else:
+            input_image_feature, error = extract_probe(facial, input_image.read())
+        if error:
+            return error
+
+        # Only the best candidates of the nearest lists are scored exactly
+        candidates = get_student_index().search(input_image_feature, k=1)
+
+        # The index may still hold a student deleted by another worker
+        student = None
+        if candidates and candidates[0][1] >= facial.threshold:
+            student = Student.objects.filter(STUDENT_ID=candidates[0][0]).first()
+        if student is not None:
+            data = {
+                'student_id': student.STUDENT_ID,
+                'student_name': student.STUDENT_NAME,
+                'student_batch': student.STUDENT_BATCH
+            }
+
+            return Response(data=data, status=status.HTTP_202_ACCEPTED)
 
         return Response(data={"Error": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
 
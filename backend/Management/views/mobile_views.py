@@ -3,13 +3,12 @@ import json
 from Management.models import Attendance, ExaminerMobile, Student
 from Management.serializers import AttendanceSerializer, MobileSerializer, StudentSerializer
 from django.http import Http404
+from facial import inference_stats, readiness, start_warm_up
+from utils.admission import get_admission_controller
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from facial import FacialRecognition
-
-facial = FacialRecognition()
 
 
 class ExaminerList(APIView):
@@ -106,3 +105,30 @@ class ExaminerActiveCheck(APIView):
 
         is_active = examiner.ACTIVE
         return Response({"EXAMINER_MOBILE": uuid, "ACTIVE": is_active}, status=status.HTTP_200_OK)
+
+
+class FacialReadinessCheck(APIView):
+    """
+    Report whether this worker's face recognition models are warmed up, so the load balancer
+    only routes traffic to warm workers.
+
+    Anonymous probes only get the ready flag. Authenticated callers also get the warm-up error
+    and the inference stats, and their probe of a cold worker starts its warm-up.
+    """
+
+    def get(self, request):
+        ready, error = readiness()
+        authenticated = IsAuthenticated().has_permission(request, self)
+        if not ready:
+            if not authenticated:
+                return Response({"READY": False}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            start_warm_up()
+            return Response({"READY": False, "Error": error}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        if not authenticated:
+            return Response({"READY": True}, status=status.HTTP_200_OK)
+
+        # Queue waits of the admission controller and inference limiter show when the worker is saturated
+        controller = get_admission_controller()
+        return Response({"READY": True, "INFERENCE": inference_stats(),
+                         "ADMISSION": controller.stats() if controller is not None else None}, status=status.HTTP_200_OK)
@@ -1,5 +1,5 @@
-import json
-import numpy as np
+from django.conf import settings
+from django.db import transaction
 from Management.models import Student, Attendance
 from Management.serializers import StudentSerializer, AttendanceSerializer
 from django.http import Http404
@@ -7,9 +7,8 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from facial import FacialRecognition
-
-facial = FacialRecognition()
+from facial import get_facial_engine
+from utils.face_quality import REJECTION_MESSAGES
 
 
 class StudentList(APIView):
@@ -43,41 +42,63 @@ class StudentList(APIView):
         return Response(serializer.data)
 
     def post(self, request):
-        extracted_features = []
+        facial = get_facial_engine()
+        images = []
         for side in ['left', 'right', 'front']:
             image_file = request.FILES.get(f'{side}_image')
             if image_file:
-                features = facial.extract_features(
-                    image_file.read(), side=side)
-                if isinstance(features, str) and features == "No face detected":
-                    return Response(data={"Error": f"No face detected in the {side} image"}, status=status.HTTP_400_BAD_REQUEST)
-
-                # Convert NumPy array to list if necessary
-                if isinstance(features, np.ndarray):
-                    features = features.tolist()
-
-                extracted_features.append({"side": side, "features": features})
+                images.append((image_file.read(), side))
             else:
                 return Response(data={"Error": f"{side} image not found"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            extracted_features_json = json.dumps(extracted_features)
-        except (TypeError, ValueError) as e:
-            return Response(data={"Error": "Invalid features data"}, status=status.HTTP_400_BAD_REQUEST)
+        # Embed the three sides in one batch
+        extracted_features, error = self.extract_sides(facial, images)
+        if error:
+            return error
 
         data = {
             "STUDENT_ID": request.data.get("STUDENT_ID"),
             "STUDENT_NAME": request.data.get("STUDENT_NAME"),
             "STUDENT_BATCH": request.data.get("STUDENT_BATCH"),
-            "STUDENT_EXTRACTED_FEATURES": extracted_features_json
         }
 
         serializer = StudentSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                student = serializer.save()
+                student.store_features(
+                    extracted_features, facial.model_version, settings.FACIAL_EMBEDDING_DTYPE)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def extract_sides(facial, images):
+        """
+        Extract the features of every captured side in one batch.
+
+        Args:
+            facial (FacialRecognition): The engine used for extraction.
+            images (list[tuple[bytes, str]]): (image bytes, side) pairs.
+
+        Returns:
+            tuple[list[dict], Response]: The {'side', 'features', 'weight'} entries, and an error
+                response with the machine-readable reason of the first side that could
+                not be processed (or None).
+        """
+        extracted_features = []
+        results = facial.extract_features_batch(images)
+        for (_, side), (features, error) in zip(images, results):
+            if error == 'no_face':
+                return [], Response(data={"Error": f"No face detected in the {side} image", "reason": error}, status=status.HTTP_400_BAD_REQUEST)
+            if error in ('decode_failed', 'inference_failed'):
+                return [], Response(data={"Error": f"Could not process the {side} image", "reason": error}, status=status.HTTP_400_BAD_REQUEST)
+            if error:
+                return [], Response(data={"Error": f"The {side} image was rejected: {REJECTION_MESSAGES[error]}", "reason": error}, status=status.HTTP_400_BAD_REQUEST)
+
+            extracted_features.append(
+                {"side": side, "features": features, "weight": facial.side_weight(side)})
+        return extracted_features, None
+
 
 class StudentDetail(APIView):
     """
@@ -98,37 +119,33 @@ class StudentDetail(APIView):
 
     def patch(self, request, id):
         student = self.get_object(id)
+        images = []
 
         for key in request.data:
             if key.endswith('image'):
-                side = key[:-6]  # Remove the last 5 characters ('image')
-                extracted_features = json.loads(
-                    student.STUDENT_EXTRACTED_FEATURES)
-                extracted_features = [
-                    item for item in extracted_features if item['side'] != side]
+                side = key[:-6]  # Remove the last 6 characters ('_image')
                 image_file = request.FILES.get(f'{side}_image')
                 if image_file:
-                    features = facial.extract_features(
-                        image_file.read(), side=side)
-                    if isinstance(features, str) and features == "No face detected":
-                        return Response(data={"Error": f"No face detected in the {side} image"}, status=status.HTTP_400_BAD_REQUEST)
-
-                    # Convert NumPy array to list if necessary
-                    if isinstance(features, np.ndarray):
-                        features = features.tolist()
-
-                    extracted_features.append(
-                        {"side": side, "features": features})
-
-                    # Save the updated JSON data back to the EXTRACTED_FEATURES attribute
-                    student.EXTRACTED_FEATURES = json.dumps(extracted_features)
-
+                    images.append((image_file.read(), side))
                 else:
                     return Response(data={"Error": f"{side} image not found"}, status=status.HTTP_400_BAD_REQUEST)
+
+        extracted_features = []
+        if images:
+            extracted_features, error = StudentList.extract_sides(
+                get_facial_engine(), images)
+            if error:
+                return error
+
         serializer = StudentSerializer(
             student, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                # Replace the stored embeddings of the re-captured sides only
+                if extracted_features:
+                    student.store_features(
+                        extracted_features, get_facial_engine().model_version, settings.FACIAL_EMBEDDING_DTYPE)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1,36 +1,131 @@
 import os
+import tempfile
+import threading
+import time
+from collections import Counter
 import torch
 import numpy as np
-import torchvision.transforms as transforms
 from PIL import Image
 from io import BytesIO
-from mtcnn import MTCNN
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 # Use FaceNet for better facial embeddings
-from facenet_pytorch import InceptionResnetV1
+from utils.inference_scheduler import InferenceLimiter, MicroBatcher, configure_threads
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_models import create_embedding_model
+from utils.face_detectors import create_detector, detect_faces_downscaled
+from utils.face_preprocessing import FaceBatchBuffer
+from utils.face_quality import QualityGate, grayscale, sharpness
 
 # Suppress TensorFlow logging
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 
 class FacialRecognition:
-    def __init__(self) -> None:
+    # Default weights of the stored sides in the weighted average similarity
+    FRONT_WEIGHT = 3
+    SIDE_WEIGHT = 0.4
+
+    # Side of the faces given to FaceNet, in pixels
+    INPUT_SIZE = 160
+
+    # (width, height) of the face crops a device may send instead of a full photo: square
+    # crops of the detected face box, at the FaceNet input size or twice it
+    CROP_FORMATS = {
+        'square-160': (160, 160),
+        'square-320': (320, 320),
+    }
+
+    def __init__(self, batch_window_ms: float = 0, max_batch_size: int = 16,
+                 cache_size: int = 0, cache_ttl: float = 0, detector: str = 'mtcnn',
+                 detect_max_side: int = 0, decode_min_side: int = 0,
+                 quality_gate: QualityGate = None, model_tier: str = 'accurate',
+                 intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 max_concurrent_inferences: int = 0) -> None:
         """
         Initialize the FacialRecognition class.
-        Sets up the FaceNet model with pre-trained weights,
-        defines the preprocessing pipeline, and initializes the face detector (MTCNN).
-        """
-        # Initialize FaceNet model for facial embeddings
-        self.model = InceptionResnetV1(pretrained='vggface2').eval()
-
-        # Define the preprocessing pipeline
-        self.preprocess = transforms.Compose([
-            transforms.Resize(160),  # Resizing to 160x160 for FaceNet
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5],
-                                 std=[0.5, 0.5, 0.5]),
-        ])
+        Sets up the embedding model of the requested tier,
+        the preprocessing batch buffer, and initializes the face detector (MTCNN).
+
+        Args:
+            batch_window_ms (float): How long concurrent embedding requests are collected
+                into one forward pass, in milliseconds. 0 runs every request on its own.
+            max_batch_size (int): The largest number of faces embedded in one forward pass.
+            cache_size (int): The number of extraction results kept in the probe cache. 0 disables it.
+            cache_ttl (float): Seconds after which a cached result expires. 0 keeps it until evicted.
+            detector (str): The face detector backend, 'mtcnn' (TensorFlow) or 'torch'.
+            detect_max_side (int): The longest side of the downscaled copy faces are detected on.
+                Faces are still cropped from the full resolution image. 0 detects on the full image.
+            decode_min_side (int): The shortest side 'front' JPEG photos are decoded at, using
+                reduced-resolution draft decoding. 0 decodes every pixel.
+            quality_gate (QualityGate): The checks 'front' faces must pass before being embedded,
+                or None to embed every detected face.
+            model_tier (str): The embedding model, 'accurate' (FaceNet pretrained on VGGFace2) or
+                'fast' (the exported CPU graph of FACIAL_FAST_MODEL_PATH).
+            intra_op_threads (int): The threads torch and TensorFlow parallelize one operation
+                with in this process. 0 keeps one per core.
+            inter_op_threads (int): The threads running independent operations concurrently.
+                0 keeps the library default.
+            max_concurrent_inferences (int): The largest number of detector and model passes
+                run at once by this engine, the others wait for a slot. 0 runs them all.
+        """
+        # Threads must be set before the models are loaded
+        configure_threads(intra_op_threads, inter_op_threads, tensorflow=detector == 'mtcnn')
+        self.limiter = InferenceLimiter(max_concurrent_inferences)
+
+        # Initialize the embedding model; its version is stored with every embedding
+        # so vectors of different models are never compared
+        self.model = create_embedding_model(model_tier)
+        self.model_version = self.model.version
+
+        # Faces are resized to a shortest side of 160 and normalized into a reusable batch buffer
+        self.face_buffer = FaceBatchBuffer(self.INPUT_SIZE, max_batch_size)
         self.threshold = 0.70
-        self.face_detector = MTCNN()
+        self.face_detector = create_detector(detector)
+        self.detect_max_side = detect_max_side
+        self.decode_min_side = decode_min_side
+        self.quality_gate = quality_gate
+
+        # Share forward passes between concurrent requests
+        self.batcher = None
+        if batch_window_ms > 0:
+            self.batcher = MicroBatcher(
+                self.forward_batch, batch_window_ms, max_batch_size)
+
+        # Repeated submissions of the same photo skip detection and embedding
+        self.probe_cache = None
+        if cache_size > 0:
+            self.probe_cache = EmbeddingCache(cache_size, cache_ttl)
+
+    def detect_faces(self, image: np.ndarray) -> list[dict]:
+        """
+        Detect every face in the given image.
+
+        Args:
+            image (np.ndarray): The RGB image of shape (H, W, 3).
+
+        Returns:
+            list[dict]: A {'box', 'confidence', 'keypoints'} dictionary per face, in the
+                        coordinates of the given image.
+        """
+        with self.limiter:
+            return detect_faces_downscaled(self.face_detector, image, self.detect_max_side)
+
+    @staticmethod
+    def crop_face(image: np.ndarray, detection: dict) -> np.ndarray:
+        """
+        Crop a detected face out of an image.
+
+        Args:
+            image (np.ndarray): The RGB image of shape (H, W, 3).
+            detection (dict): The detection of the face.
+
+        Returns:
+            np.ndarray: The face as a view of the image.
+        """
+        x, y, width, height = detection['box']
+        x, y = max(x, 0), max(y, 0)
+        return image[y:y + height, x:x + width]
 
     def detect_and_align_face(self, image: np.ndarray) -> np.ndarray:
         """
@@ -43,16 +138,145 @@ class FacialRecognition:
             np.ndarray: The aligned face as a numpy array.
         """
         # Detect face in the image using MTCNN
-        detections = self.face_detector.detect_faces(image)
+        detections = self.detect_faces(image)
 
-        if detections is None or len(detections) == 0:
+        if len(detections) == 0:
             return None
 
         # Extract the bounding box of the first detected face
-        x, y, width, height = detections[0]['box']
-        aligned_face = image[y:y + height, x:x + width]
+        return self.crop_face(image, detections[0])
+
+    def decode_image(self, image_path: bytes, min_side: int = 0) -> Image.Image:
+        """
+        Decode raw image bytes into an RGB image.
+
+        JPEG photos are decoded at a reduced resolution (1/2, 1/4 or 1/8) by scaling the DCT,
+        as long as their shortest side stays at least `min_side`.
+
+        Args:
+            image_path (bytes): The content of the image file.
+            min_side (int): The smallest acceptable shortest side of the decoded image.
+                0 decodes the image at full resolution.
+
+        Returns:
+            Image.Image: The decoded RGB image, or None if the bytes are not a readable image.
+        """
+        try:
+            # Open the image from the file path
+            image = Image.open(BytesIO(image_path))
+            if min_side:
+                width, height = image.size
+                scale = min_side / min(width, height)
+                if scale < 1:
+                    # Only JPEG supports draft decoding, other formats ignore it
+                    image.draft('RGB', (int(np.ceil(width * scale)), int(np.ceil(height * scale))))
+            image.load()
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            return image
+        except IOError:
+            return None
+
+    def decode_clip(self, clip: bytes, max_frames: int = 8) -> list[np.ndarray]:
+        """
+        Decode frames spread evenly over a short video clip.
+
+        Args:
+            clip (bytes): The content of the video file.
+            max_frames (int): The largest number of frames returned.
+
+        Returns:
+            list[np.ndarray]: The RGB frames of shape (H, W, 3), empty if the clip is unreadable.
+        """
+        import cv2
+
+        # OpenCV only reads videos from files
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as clip_file:
+            clip_file.write(clip)
+            clip_file.flush()
+            capture = cv2.VideoCapture(clip_file.name)
+            total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or max_frames
+            step = max(total // max_frames, 1)
+
+            frames = []
+            index = 0
+            while len(frames) < max_frames:
+                grabbed = capture.grab()
+                if not grabbed:
+                    break
+                if index % step == 0:
+                    retrieved, frame = capture.retrieve()
+                    if retrieved:
+                        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                index += 1
+            capture.release()
+
+        return frames
+
+    def extract_burst(self, frames: list[bytes] = (), clip: bytes = None, best: int = 3,
+                      max_frames: int = 8) -> tuple[list[np.ndarray], list[dict], str]:
+        """
+        Extract the features of the best frames of a burst with one batched FaceNet forward pass.
+
+        Every frame goes through detection and the quality gate, the usable frames are
+        ranked by the sharpness of the face weighted by the detector confidence, and only
+        the best ones are embedded.
+
+        Args:
+            frames (list[bytes]): The content of every captured image.
+            clip (bytes): The content of a short video clip, used instead of the images.
+            best (int): The largest number of frames embedded.
+            max_frames (int): The largest number of frames decoded from the clip.
+
+        Returns:
+            tuple[list[np.ndarray], list[dict], str]: The features of the embedded frames,
+                best first, a {'frame', 'quality', 'error'} report per frame, and the most
+                common frame error if no frame could be embedded (or None).
+        """
+        if clip is not None:
+            images = self.decode_clip(clip, max_frames)
+        elif len(frames) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(frames), os.cpu_count() or 1)) as pool:
+                images = list(pool.map(self.decode_image, frames,
+                                       [self.decode_min_side] * len(frames)))
+        else:
+            images = [self.decode_image(frame, self.decode_min_side) for frame in frames]
+
+        reports = []
+        candidates = []
+        for i, image in enumerate(images):
+            report = {'frame': i, 'quality': 0.0, 'error': None}
+            reports.append(report)
+            if image is None:
+                report['error'] = 'decode_failed'
+                continue
 
-        return aligned_face
+            pixels = np.asarray(image)
+            detections = self.detect_faces(pixels)
+            if len(detections) == 0:
+                report['error'] = 'no_face'
+                continue
+
+            face = self.crop_face(pixels, detections[0])
+            if self.quality_gate is not None:
+                report['error'] = self.quality_gate.check(
+                    face, detections[0], self.INPUT_SIZE)
+            if report['error'] is None:
+                report['quality'] = sharpness(grayscale(face, self.INPUT_SIZE)) * float(
+                    detections[0].get('confidence', 1.0))
+                candidates.append((report['quality'], i, face))
+
+        if not candidates:
+            errors = Counter(report['error'] for report in reports)
+            return [], reports, errors.most_common(1)[0][0] if errors else 'no_face'
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        try:
+            embeddings = self.embed_faces([face for _, _, face in candidates[:best]])
+        except Exception:
+            return [], reports, 'inference_failed'
+
+        return [features.flatten() for features in embeddings], reports, None
 
     def extract_features(self, image_path: str, side: str) -> np.ndarray:
         """
@@ -66,39 +290,444 @@ class FacialRecognition:
             np.ndarray: The extracted features as a flattened numpy array.
                         Returns an empty array if extraction fails.
         """
-        try:
-            # Open the image from the file path
-            image = Image.open(BytesIO(image_path))
-        except IOError:
-            return np.array([])  # Return an empty array on failure
+        features, _ = self.extract_features_batch([(image_path, side)])[0]
+        return features
+
+    def extract_features_batch(self, items: list[tuple[bytes, str]]) -> list[tuple[np.ndarray, str]]:
+        """
+        Extract features from many images with one batched FaceNet forward pass.
+
+        Images are decoded in parallel threads, faces are only detected on 'front'
+        images, and a failing image does not abort the rest of the batch. Images whose
+        bytes were extracted before are answered from the probe cache.
+
+        Args:
+            items (list[tuple[bytes, str]]): (image bytes, side) pairs.
 
-        image = image.convert('RGB')
-        image_array = np.array(image)
+        Returns:
+            list[tuple[np.ndarray, str]]: A (features, error) pair per item, in input order.
+                The error is None on success, or one of 'decode_failed', 'no_face',
+                'inference_failed' and the QualityGate reasons, in which case the features
+                are an empty array.
+        """
+        if self.probe_cache is None:
+            return self._extract_features_batch(items)
+
+        keys = [EmbeddingCache.key(image_path, side)
+                for image_path, side in items]
+        results = [self.probe_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        if missing:
+            extracted = self._extract_features_batch([items[i] for i in missing])
+            for i, result in zip(missing, extracted):
+                results[i] = result
+                # Inference errors may be transient, everything else is a property of the image
+                if result[1] != 'inference_failed':
+                    result[0].setflags(write=False)
+                    self.probe_cache.put(keys[i], result)
 
-        # Only detect and align the face if the side is 'front'
-        if side == 'front':
-            aligned_face = self.detect_and_align_face(image_array)
-            if aligned_face is None:
-                return np.array([])
+        return results
 
-            # Convert the aligned face (numpy array) back to PIL image
-            aligned_face_pil = Image.fromarray(aligned_face)
+    def _extract_features_batch(self, items: list[tuple[bytes, str]]) -> list[tuple[np.ndarray, str]]:
+        results = [(np.array([]), None)] * len(items)
+
+        # Front photos keep enough pixels to detect the face, other sides are only resized
+        paths = [image_path for image_path, _ in items]
+        min_sides = [self.decode_min_side if side == 'front' else self.INPUT_SIZE
+                     for _, side in items]
+        if len(items) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(items), os.cpu_count() or 1)) as pool:
+                images = list(pool.map(self.decode_image, paths, min_sides))
         else:
-            # If the side is not 'front', use the original image without alignment
-            aligned_face_pil = image
+            images = [self.decode_image(paths[0], min_sides[0])]
+
+        faces = {}
+        for i, (image, (_, side)) in enumerate(zip(images, items)):
+            if image is None:
+                results[i] = (np.array([]), 'decode_failed')
+                continue
+
+            # Only detect and align the face if the side is 'front'
+            if side == 'front':
+                # The detector only reads the pixels, so the decoded buffer is not copied again
+                pixels = np.asarray(image)
+                detections = self.detect_faces(pixels)
+                if len(detections) == 0:
+                    results[i] = (np.array([]), 'no_face')
+                    continue
+                aligned_face = self.crop_face(pixels, detections[0])
 
-        # Preprocess the aligned face or original image
-        face_tensor = self.preprocess(aligned_face_pil)
-        face_tensor = face_tensor.unsqueeze(0)
+                # Reject unusable captures before paying for FaceNet
+                if self.quality_gate is not None:
+                    reason = self.quality_gate.check(
+                        aligned_face, detections[0], self.INPUT_SIZE)
+                    if reason:
+                        results[i] = (np.array([]), reason)
+                        continue
+
+                faces[i] = aligned_face
+            else:
+                # If the side is not 'front', use the original image without alignment
+                faces[i] = image
+
+        if not faces:
+            return results
 
         try:
             # Extract features using FaceNet
-            with torch.no_grad():
-                features = self.model(face_tensor)
-        except Exception as e:
-            return np.array([])
+            embeddings = self.embed_faces(list(faces.values()))
+        except Exception:
+            for i in faces:
+                results[i] = (np.array([]), 'inference_failed')
+            return results
+
+        for i, features in zip(faces, embeddings):
+            results[i] = (features.flatten(), None)
+
+        return results
+
+    def extract_faces(self, image_path: bytes) -> tuple[list[dict], str]:
+        """
+        Extract the features of every face of a group photo with one batched FaceNet forward pass.
+
+        The photo is decoded at full resolution so the faces of a whole row keep enough
+        pixels, and every face goes through the quality gate on its own.
+
+        Args:
+            image_path (bytes): The content of the image file.
+
+        Returns:
+            tuple[list[dict], str]: A {'box', 'confidence', 'features', 'error'} entry per
+                detected face, and the error of the whole photo ('decode_failed' or 'no_face')
+                or None. The error of a face is None or the reason it was not embedded, in
+                which case its features are an empty array.
+        """
+        image = self.decode_image(image_path)
+        if image is None:
+            return [], 'decode_failed'
+
+        pixels = np.asarray(image)
+        detections = self.detect_faces(pixels)
+        if len(detections) == 0:
+            return [], 'no_face'
+
+        faces = []
+        crops = {}
+        for i, detection in enumerate(detections):
+            face = self.crop_face(pixels, detection)
+            error = None
+            if self.quality_gate is not None:
+                error = self.quality_gate.check(face, detection, self.INPUT_SIZE)
+            faces.append({
+                'box': [int(value) for value in detection['box']],
+                'confidence': float(detection.get('confidence', 1.0)),
+                'features': np.array([]),
+                'error': error,
+            })
+            if error is None:
+                crops[i] = face
+
+        if not crops:
+            return faces, None
+
+        try:
+            embeddings = self.embed_faces(list(crops.values()))
+        except Exception:
+            for i in crops:
+                faces[i]['error'] = 'inference_failed'
+            return faces, None
+
+        for i, features in zip(crops, embeddings):
+            faces[i]['features'] = features.flatten()
+
+        return faces, None
+
+    def extract_cropped_face(self, image_path: bytes, crop_format: str) -> tuple[np.ndarray, str]:
+        """
+        Extract the features of a face cropped on the device, without detecting it again.
+
+        The crop must have the exact size of its declared format. It still goes through the
+        quality gate, with the whole crop as the face box.
+
+        Args:
+            image_path (bytes): The content of the face crop file.
+            crop_format (str): The declared format, one of CROP_FORMATS.
+
+        Returns:
+            tuple[np.ndarray, str]: The features, and None or the reason the crop was not embedded
+                ('decode_failed', 'crop_mismatch', 'inference_failed' or a QualityGate reason),
+                in which case the features are an empty array.
+        """
+        if crop_format not in self.CROP_FORMATS:
+            raise ValueError(
+                f"Unknown crop format '{crop_format}', expected one of {', '.join(self.CROP_FORMATS)}")
+
+        key = None
+        if self.probe_cache is not None:
+            key = EmbeddingCache.key(image_path, f"crop:{crop_format}")
+            result = self.probe_cache.get(key)
+            if result is not None:
+                return result
+
+        result = self._extract_cropped_face(image_path, crop_format)
+        # Inference errors may be transient, everything else is a property of the crop
+        if key is not None and result[1] != 'inference_failed':
+            result[0].setflags(write=False)
+            self.probe_cache.put(key, result)
+        return result
+
+    def _extract_cropped_face(self, image_path: bytes, crop_format: str) -> tuple[np.ndarray, str]:
+        image = self.decode_image(image_path)
+        if image is None:
+            return np.array([]), 'decode_failed'
+        if image.size != self.CROP_FORMATS[crop_format]:
+            return np.array([]), 'crop_mismatch'
+
+        if self.quality_gate is not None:
+            width, height = image.size
+            reason = self.quality_gate.check(
+                np.asarray(image), {'box': [0, 0, width, height], 'confidence': 1.0}, self.INPUT_SIZE)
+            if reason:
+                return np.array([]), reason
+
+        try:
+            features = self.embed_faces([image])[0]
+        except Exception:
+            return np.array([]), 'inference_failed'
+        return features.flatten(), None
+
+    def preprocess_batch(self, faces: list) -> list[tuple[list[int], torch.Tensor]]:
+        """
+        Resize and normalize faces into the batch buffer of the calling thread.
+
+        Args:
+            faces (list[np.ndarray | Image.Image]): The RGB faces.
+
+        Returns:
+            list[tuple[list[int], torch.Tensor]]: For every resized shape, the indices of its faces
+                and their batch of shape (len(indices), 3, H, W), sharing the memory of the buffer,
+                which the next call from the same thread overwrites.
+        """
+        return [(indices, torch.from_numpy(batch)) for indices, batch in self.face_buffer.fill(faces)]
+
+    def embed_faces(self, faces: list) -> list[np.ndarray]:
+        """
+        Compute the FaceNet embeddings of faces with one forward pass per resized shape.
 
-        return features.numpy().flatten()
+        A single face joins the forward pass of concurrent requests when micro-batching is enabled.
+
+        Args:
+            faces (list[np.ndarray | Image.Image]): The RGB faces.
+
+        Returns:
+            list[np.ndarray]: The embedding of every face, in input order.
+        """
+        batches = self.preprocess_batch(faces)
+        if len(faces) == 1:
+            return [self.embed(batches[0][1])]
+
+        embeddings = [None] * len(faces)
+        for indices, batch in batches:
+            with self.limiter:
+                features = self.model(batch)
+            for i, feature in zip(indices, features):
+                embeddings[i] = feature
+        return embeddings
+
+    def embed(self, face_tensor: torch.Tensor) -> np.ndarray:
+        """
+        Compute the FaceNet embedding of one preprocessed face.
+
+        When micro-batching is enabled the face joins the forward pass of concurrent requests.
+
+        Args:
+            face_tensor (torch.Tensor): The preprocessed face of shape (1, 3, H, W).
+
+        Returns:
+            np.ndarray: The embedding of the face.
+        """
+        if self.batcher is not None:
+            return self.batcher.submit(face_tensor)
+        return self.forward_batch([face_tensor])[0]
+
+    def forward_batch(self, face_tensors: list[torch.Tensor]) -> list[np.ndarray]:
+        """
+        Embed many preprocessed faces with as few forward passes as possible.
+
+        Faces of the same size are stacked into one batch.
+
+        Args:
+            face_tensors (list[torch.Tensor]): Preprocessed faces of shape (1, 3, H, W).
+
+        Returns:
+            list[np.ndarray]: The embedding of every face, in input order.
+        """
+        groups = {}
+        for i, face_tensor in enumerate(face_tensors):
+            groups.setdefault(tuple(face_tensor.shape[1:]), []).append(i)
+
+        embeddings = [None] * len(face_tensors)
+        for indices in groups.values():
+            batch = torch.cat([face_tensors[i] for i in indices])
+            with self.limiter:
+                features = self.model(batch)
+            for i, feature in zip(indices, features):
+                embeddings[i] = feature
+
+        return embeddings
+
+    def warm_up(self, image_size: tuple[int, int] = (480, 640)) -> float:
+        """
+        Run dummy detection and embedding passes so the first real request does not pay for
+        graph construction and kernel selection.
+
+        Args:
+            image_size (tuple[int, int]): The (height, width) of the dummy photo detected on.
+
+        Returns:
+            float: The time the warm-up took, in seconds.
+        """
+        started_at = time.monotonic()
+        rng = np.random.default_rng(0)
+        photo = rng.integers(0, 256, size=(*image_size, 3), dtype=np.uint8)
+        self.detect_faces(photo)
+
+        face = photo[:self.INPUT_SIZE, :self.INPUT_SIZE]
+        self.embed_faces([face])
+        if self.batcher is not None:
+            # Micro-batched requests also run full batches
+            self.embed_faces([face] * self.batcher.max_batch_size)
+        return time.monotonic() - started_at
+
+    def inference_stats(self) -> dict:
+        """
+        Report the concurrency limiter and micro-batching counters of this engine.
+
+        Returns:
+            dict: The 'limiter' counters, and the 'batcher' counters or None without micro-batching.
+        """
+        return {
+            'limiter': self.limiter.stats(),
+            'batcher': self.batcher.stats() if self.batcher is not None else None,
+        }
+
+    @staticmethod
+    def side_weight(side: str) -> float:
+        """
+        Return the weight of a stored side in the weighted average similarity.
+
+        Args:
+            side (str): The side of the face ('front', 'right' or 'left').
+
+        Returns:
+            float: The weight of the side.
+        """
+        return FacialRecognition.FRONT_WEIGHT if side == 'front' else FacialRecognition.SIDE_WEIGHT
+
+    @staticmethod
+    def fuse_embeddings(embeddings: list[np.ndarray]) -> np.ndarray:
+        """
+        Fuse the embeddings of several captures of the same face into one probe.
+
+        Args:
+            embeddings (list[np.ndarray]): The embeddings to fuse.
+
+        Returns:
+            np.ndarray: The L2-normalized mean of the normalized embeddings.
+        """
+        stacked = np.stack([np.asarray(features, dtype=np.float32) for features in embeddings])
+        stacked /= np.linalg.norm(stacked, axis=1, keepdims=True)
+        fused = stacked.mean(axis=0)
+        return fused / np.linalg.norm(fused)
+
+    @staticmethod
+    def pack_gallery(stored_image_features_lists: list[list[dict]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Pack the stored features of many students into one normalized gallery.
+
+        Args:
+            stored_image_features_lists (list[list[dict]]): The {'side', 'features'} entries
+                of each student, optionally carrying a 'weight'.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The L2-normalized float32 side embeddings of shape
+                (students, sides, dim) and the per-side weights of shape (students, sides).
+                Missing sides are zero vectors with zero weight.
+        """
+        sides = max((len(features)
+                    for features in stored_image_features_lists), default=0)
+        dim = next((len(stored_image['features'])
+                    for features in stored_image_features_lists
+                    for stored_image in features), 0)
+        gallery = np.zeros(
+            (len(stored_image_features_lists), sides, dim), dtype=np.float32)
+        weights = np.zeros(
+            (len(stored_image_features_lists), sides), dtype=np.float32)
+
+        for row, features in enumerate(stored_image_features_lists):
+            for column, stored_image in enumerate(features):
+                stored_features = np.asarray(
+                    stored_image['features'], dtype=np.float32)
+                norm = np.linalg.norm(stored_features)
+                if norm == 0:
+                    continue
+                gallery[row, column] = stored_features / norm
+
+                weights[row, column] = stored_image.get(
+                    'weight', FacialRecognition.side_weight(stored_image['side']))
+
+        return gallery, weights
+
+    @staticmethod
+    def score_gallery(probe: np.ndarray, gallery: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        Compute the weighted average cosine similarity of probes against a packed gallery.
+
+        Args:
+            probe (np.ndarray): One probe embedding of shape (dim,) or several of shape (probes, dim).
+            gallery (np.ndarray): The normalized side embeddings of shape (students, sides, dim).
+            weights (np.ndarray): The side weights of shape (students, sides) or (sides,).
+
+        Returns:
+            np.ndarray: The weighted similarity of shape (students,) for one probe,
+                        or (probes, students) for several.
+        """
+        probes = np.atleast_2d(np.asarray(probe, dtype=np.float32))
+        probes = probes / np.linalg.norm(probes, axis=1, keepdims=True)
+
+        count, sides, dim = gallery.shape
+        weights = np.broadcast_to(
+            np.asarray(weights, dtype=np.float32), (count, sides))
+        totals = weights.sum(axis=1, keepdims=True)
+        normalized_weights = np.divide(
+            weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+        # One matrix product for every (student, side, probe) cosine similarity
+        cosine_similarities = (gallery.reshape(count * sides, dim) @ probes.T).reshape(
+            count, sides, len(probes))
+        scores = np.einsum('nsp,ns->pn', cosine_similarities,
+                           normalized_weights)
+
+        return scores[0] if np.ndim(probe) == 1 else scores
+
+    @staticmethod
+    def score_templates(probe: np.ndarray, templates: np.ndarray) -> np.ndarray:
+        """
+        Compute the weighted average cosine similarity of probes against fused templates.
+
+        Args:
+            probe (np.ndarray): One probe embedding of shape (dim,) or several of shape (probes, dim).
+            templates (np.ndarray): The fused templates of shape (students, dim).
+
+        Returns:
+            np.ndarray: The weighted similarity of shape (students,) for one probe,
+                        or (probes, students) for several.
+        """
+        probes = np.atleast_2d(np.asarray(probe, dtype=np.float32))
+        probes = probes / np.linalg.norm(probes, axis=1, keepdims=True)
+        scores = probes @ np.asarray(templates, dtype=np.float32).T
+        return scores[0] if np.ndim(probe) == 1 else scores
 
     def compare_images(self, stored_image_features_list: list[np.ndarray], input_image_path: str) -> bool:
         """
@@ -118,33 +747,129 @@ class FacialRecognition:
         if input_image_feature.size == 0:
             return "No valid features extracted from the input image."
 
-        cosine_similarities = []
-        weights = []
+        gallery, weights = self.pack_gallery([stored_image_features_list])
 
-        # Compare features with stored images
-        for stored_image in stored_image_features_list:
-            stored_features = np.array(stored_image['features'])
+        # Weighted average of cosine similarities
+        weighted_avg_similarity = self.score_gallery(
+            input_image_feature, gallery, weights)[0]
 
-            # Compute cosine similarity between stored and input features
-            cosine_similarity = np.dot(stored_features, input_image_feature) / (
-                np.linalg.norm(stored_features) *
-                np.linalg.norm(input_image_feature)
-            )
-            cosine_similarities.append(cosine_similarity)
+        # Return True if similarity exceeds threshold, else False
+        return weighted_avg_similarity >= self.threshold
 
-            if stored_image['side'] == 'front':
-                weight = stored_image.get('weight', 3)
-                weights.append(weight)
-            else:
-                weight = stored_image.get('weight', 0.4)
-                weights.append(weight)
 
-        # Normalize weights
-        normalized_weights = np.array(weights) / np.sum(weights)
+def engine_settings() -> dict:
+    """
+    Return the keyword arguments of FacialRecognition configured in the settings.
 
-        # Weighted average of cosine similarities
-        weighted_avg_similarity = np.dot(
-            normalized_weights, cosine_similarities)
+    Returns:
+        dict: The arguments, shared by the in-process engine and the engines of worker processes.
+    """
+    return {
+        'batch_window_ms': settings.FACIAL_BATCH_WINDOW_MS,
+        'max_batch_size': settings.FACIAL_BATCH_MAX_SIZE,
+        'cache_size': settings.FACIAL_PROBE_CACHE_SIZE,
+        'cache_ttl': settings.FACIAL_PROBE_CACHE_TTL,
+        'detector': settings.FACIAL_DETECTOR,
+        'detect_max_side': settings.FACIAL_DETECT_MAX_SIDE,
+        'decode_min_side': settings.FACIAL_DECODE_MIN_SIDE,
+        'quality_gate': QualityGate.from_settings(),
+        'model_tier': settings.FACIAL_MODEL_TIER,
+        'intra_op_threads': settings.FACIAL_INTRA_OP_THREADS,
+        'inter_op_threads': settings.FACIAL_INTER_OP_THREADS,
+        'max_concurrent_inferences': settings.FACIAL_MAX_CONCURRENT_INFERENCES,
+    }
 
-        # Return True if similarity exceeds threshold, else False
-        return weighted_avg_similarity >= self.threshold
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_facial_engine() -> FacialRecognition:
+    """
+    Return the FacialRecognition engine shared by the whole process.
+
+    The models are loaded on the first call, so processes that never handle a face
+    request never pay for them. When FACIAL_INFERENCE_ADDRESS is set, inference runs in
+    the inference server listening there (see the run_inference_server command), shared by
+    every web worker, and a client with the same API is returned.
+
+    Returns:
+        FacialRecognition: The shared engine.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if settings.FACIAL_INFERENCE_ADDRESS:
+                    from utils.inference_pool import InferenceServerClient, FacialRecognitionClient
+                    _engine = FacialRecognitionClient(InferenceServerClient(
+                        settings.FACIAL_INFERENCE_ADDRESS, settings.SECRET_KEY.encode()))
+                else:
+                    _engine = FacialRecognition(**engine_settings())
+    return _engine
+
+
+# Set once the shared engine has run its warm-up passes
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+_warm_up_error = None
+
+
+def warm_up() -> FacialRecognition:
+    """
+    Load the shared engine and run its warm-up passes ahead of the first face request.
+
+    Returns:
+        FacialRecognition: The shared engine.
+    """
+    engine = get_facial_engine()
+    if isinstance(engine, FacialRecognition):
+        engine.warm_up()
+    else:
+        engine.pool.warm_up()
+    _ready.set()
+    return engine
+
+
+def _run_warm_up() -> None:
+    global _warm_up_error
+    try:
+        warm_up()
+        _warm_up_error = None
+    except Exception as error:
+        _warm_up_error = str(error)
+
+
+def start_warm_up() -> None:
+    """
+    Warm up the shared engine in a background thread, unless it is ready or warming up.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _ready.is_set() or (_warm_up_thread is not None and _warm_up_thread.is_alive()):
+            return
+        _warm_up_thread = threading.Thread(
+            target=_run_warm_up, name='facial-warm-up', daemon=True)
+        _warm_up_thread.start()
+
+
+def readiness() -> tuple[bool, str]:
+    """
+    Report whether the shared engine has finished warming up.
+
+    Returns:
+        tuple[bool, str]: Whether it is ready, and the error of the last failed warm-up or None.
+    """
+    return _ready.is_set(), _warm_up_error
+
+
+def inference_stats() -> dict:
+    """
+    Report the inference counters of the shared engine without loading it.
+
+    Returns:
+        dict: The counters of `FacialRecognition.inference_stats`, or None before the engine is loaded.
+    """
+    engine = _engine
+    return engine.inference_stats() if engine is not None else None
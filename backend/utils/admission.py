@@ -0,0 +1,178 @@
+import functools
+import math
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+# Share of the queue and wait limits every class of face request may use. Attendance can fill
+# the whole queue, searches are turned away once it is half full so attendance keeps headroom.
+PRIORITIES = {
+    'attendance': 1.0,
+    'search': 0.5,
+}
+
+
+class AdmissionController:
+    """
+    Admit face requests while the worker can serve them in time, and turn the others away early.
+
+    The queue depth is the number of admitted requests still running. The estimated wait of a
+    new request is that depth divided by the recent completion rate, so it already reflects the
+    concurrency the worker achieves.
+
+    The depth is counted in the process, across the threads serving requests. Workers must
+    therefore run several threads: a sync worker only ever holds the request it is serving.
+
+    Attributes:
+        max_queue (int): The largest number of requests running at once.
+        max_wait (float): The longest estimated wait of an admitted request, in seconds.
+        window (float): The period the completion rate is measured over, in seconds.
+    """
+
+    def __init__(self, max_queue: int = 16, max_wait: float = 8, window: float = 10) -> None:
+        """
+        Args:
+            max_queue (int): The largest number of requests running at once.
+            max_wait (float): The longest estimated wait of an admitted request, in seconds.
+            window (float): The period the completion rate is measured over, in seconds.
+        """
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.window = window
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._completions = deque()
+        self._admitted = {priority: 0 for priority in PRIORITIES}
+        self._rejected = {priority: 0 for priority in PRIORITIES}
+
+    def _throughput(self, now: float) -> float:
+        while self._completions and self._completions[0] < now - self.window:
+            self._completions.popleft()
+        return len(self._completions) / self.window
+
+    def estimated_wait(self) -> float:
+        """
+        Estimate how long a new request waits for the requests ahead of it.
+
+        Returns:
+            float: The estimated wait in seconds, 0 before any request completed.
+        """
+        with self._lock:
+            throughput = self._throughput(time.monotonic())
+            return self._depth / throughput if throughput else 0.0
+
+    def admit(self, priority: str) -> float | None:
+        """
+        Admit a request unless its class already uses its share of the queue or wait limits.
+
+        Args:
+            priority (str): The class of the request, one of PRIORITIES.
+
+        Returns:
+            float | None: None if the request is admitted, otherwise the seconds after which to retry.
+        """
+        share = PRIORITIES[priority]
+        with self._lock:
+            throughput = self._throughput(time.monotonic())
+            wait = self._depth / throughput if throughput else 0.0
+            if self._depth < self.max_queue * share and wait <= self.max_wait * share:
+                self._depth += 1
+                self._admitted[priority] += 1
+                return None
+
+            self._rejected[priority] += 1
+            # Time for the queue to drain back under the limit of this class
+            excess = self._depth - self.max_queue * share + 1
+            return max(wait - self.max_wait * share, excess / throughput if throughput else 1.0, 1.0)
+
+    def release(self) -> None:
+        """Record that an admitted request finished."""
+        with self._lock:
+            self._depth -= 1
+            self._completions.append(time.monotonic())
+
+    def stats(self) -> dict:
+        """
+        Report the queue and admission counters.
+
+        Returns:
+            dict: The queue depth, the estimated wait in seconds, and the number of admitted and
+                  rejected requests per priority.
+        """
+        wait = self.estimated_wait()
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "estimated_wait": wait,
+                "admitted": dict(self._admitted),
+                "rejected": dict(self._rejected),
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Return the admission controller of this worker process.
+
+    Returns:
+        AdmissionController: The controller, or None when FACIAL_ADMISSION_CONTROL is off.
+    """
+    global _controller
+    if not settings.FACIAL_ADMISSION_CONTROL:
+        return None
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(
+                    settings.FACIAL_ADMISSION_MAX_QUEUE, settings.FACIAL_ADMISSION_MAX_WAIT)
+    return _controller
+
+
+def admission_control(priority: str):
+    """
+    Guard a view method running face inference with the admission controller.
+
+    Rejected requests are answered at once with a Retry-After header: 503 when even the highest
+    priority is turned away, 429 when only lower priority requests are shed.
+
+    Args:
+        priority (str): The class of the requests, one of PRIORITIES.
+
+    Returns:
+        callable: The decorator.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(PRIORITIES)}")
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            controller = get_admission_controller()
+            if controller is None:
+                return handler(view, request, *args, **kwargs)
+
+            retry_after = controller.admit(priority)
+            if retry_after is not None:
+                retry_after = math.ceil(retry_after)
+                overloaded = PRIORITIES[priority] == max(PRIORITIES.values())
+                response = Response(
+                    data={"Error": "The server is busy, please retry in a few seconds.",
+                          "reason": "overloaded", "retry_after": retry_after},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE if overloaded else status.HTTP_429_TOO_MANY_REQUESTS)
+                response['Retry-After'] = str(retry_after)
+                return response
+
+            try:
+                return handler(view, request, *args, **kwargs)
+            finally:
+                controller.release()
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of extraction results keyed by a digest of the image bytes.
+
+    Attributes:
+        max_entries (int): The largest number of cached results.
+        ttl (float): Seconds after which a result expires, or 0 to keep results until evicted.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 0) -> None:
+        """
+        Args:
+            max_entries (int): The largest number of cached results.
+            ttl (float): Seconds after which a result expires, or 0 to keep results until evicted.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(image_bytes: bytes, side: str) -> str:
+        """
+        Build the cache key of an image.
+
+        Args:
+            image_bytes (bytes): The content of the image file.
+            side (str): The side the image is extracted as.
+
+        Returns:
+            str: The digest of the image bytes combined with the side.
+        """
+        return f"{hashlib.blake2b(image_bytes, digest_size=16).hexdigest()}:{side}"
+
+    def get(self, key: str):
+        """
+        Look up a cached result.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            The cached result, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: str, value) -> None:
+        """
+        Cache a result, evicting the least recently used one when full.
+
+        Args:
+            key (str): The cache key.
+            value: The result to cache.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Report the cache counters.
+
+        Returns:
+            dict: The hits, misses, evictions, current size and hit rate of the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._entries),
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
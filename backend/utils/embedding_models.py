@@ -0,0 +1,131 @@
+import numpy as np
+import torch
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Tiers of embedding models, from the most accurate to the fastest on CPU
+MODEL_TIERS = ('accurate', 'fast')
+
+
+class FaceNetModel:
+    """
+    The accurate tier: InceptionResnetV1 pretrained on VGGFace2.
+    """
+    version = 'facenet-vggface2'
+
+    def __init__(self) -> None:
+        from facenet_pytorch import InceptionResnetV1
+        self.model = InceptionResnetV1(pretrained='vggface2').eval()
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        """
+        Embed a batch of preprocessed faces.
+
+        Args:
+            batch (torch.Tensor): The faces of shape (N, 3, 160, 160).
+
+        Returns:
+            np.ndarray: The embeddings of shape (N, 512).
+        """
+        with torch.no_grad():
+            return self.model(batch).numpy()
+
+
+class TorchScriptModel:
+    """
+    The fast tier as a frozen TorchScript CPU graph written by the export_fast_model command.
+    """
+
+    def __init__(self, path: str, version: str) -> None:
+        """
+        Args:
+            path (str): The TorchScript archive.
+            version (str): The model version the archive must declare.
+        """
+        extra_files = {'model_version': ''}
+        self.model = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        self.version = check_version(path, extra_files['model_version'], version)
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            return self.model(batch).numpy()
+
+
+class ONNXModel:
+    """
+    The fast tier as an ONNX graph run by ONNX Runtime on the CPU.
+    """
+
+    def __init__(self, path: str, version: str) -> None:
+        """
+        Args:
+            path (str): The ONNX model file.
+            version (str): The model version the file must declare in its metadata.
+        """
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.version = check_version(
+            path, self.session.get_modelmeta().custom_metadata_map.get('model_version', ''), version)
+
+    def __call__(self, batch: torch.Tensor) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch.numpy()})[0]
+
+
+def check_version(path: str, declared, expected: str) -> str:
+    """
+    Check that an exported model declares the configured model version.
+
+    Args:
+        path (str): The exported model file.
+        declared (str | bytes): The version stored in the file.
+        expected (str): The configured version.
+
+    Returns:
+        str: The version.
+    """
+    if isinstance(declared, bytes):
+        declared = declared.decode()
+    if declared != expected:
+        raise ImproperlyConfigured(
+            f"{path} was exported as model version '{declared}' but FACIAL_FAST_MODEL_VERSION "
+            f"is '{expected}', embeddings of different models must not be compared")
+    return declared
+
+
+def create_embedding_model(tier: str):
+    """
+    Load the embedding model of a tier.
+
+    Args:
+        tier (str): The tier ('accurate' or 'fast').
+
+    Returns:
+        The model, called with a batch of preprocessed faces and exposing its `version`.
+    """
+    if tier == 'accurate':
+        return FaceNetModel()
+    if tier == 'fast':
+        path = str(settings.FACIAL_FAST_MODEL_PATH)
+        if path.endswith('.onnx'):
+            return ONNXModel(path, settings.FACIAL_FAST_MODEL_VERSION)
+        return TorchScriptModel(path, settings.FACIAL_FAST_MODEL_VERSION)
+    raise ValueError(f"Unknown model tier '{tier}', expected one of {', '.join(MODEL_TIERS)}")
+
+
+def model_version(tier: str = None) -> str:
+    """
+    Return the version embeddings of a tier are stored with, without loading the model.
+
+    Args:
+        tier (str): The tier, FACIAL_MODEL_TIER by default.
+
+    Returns:
+        str: The model version.
+    """
+    tier = tier or settings.FACIAL_MODEL_TIER
+    if tier == 'accurate':
+        return FaceNetModel.version
+    if tier == 'fast':
+        return settings.FACIAL_FAST_MODEL_VERSION
+    raise ValueError(f"Unknown model tier '{tier}', expected one of {', '.join(MODEL_TIERS)}")
@@ -0,0 +1,122 @@
+import numpy as np
+from PIL import Image
+
+
+class MTCNNDetector:
+    """
+    Face detector backed by the `mtcnn` package, which runs on TensorFlow.
+    """
+    name = 'mtcnn'
+
+    def __init__(self) -> None:
+        # Imported here so TensorFlow is only loaded when this backend is selected
+        from mtcnn import MTCNN
+        self.detector = MTCNN()
+
+    def detect_faces(self, image: np.ndarray) -> list[dict]:
+        """
+        Detect every face in an image.
+
+        Args:
+            image (np.ndarray): The RGB image of shape (H, W, 3).
+
+        Returns:
+            list[dict]: A {'box', 'confidence', 'keypoints'} dictionary per face, the box
+                        being [x, y, width, height] in pixels.
+        """
+        return self.detector.detect_faces(image) or []
+
+
+class TorchMTCNNDetector:
+    """
+    Face detector backed by the PyTorch MTCNN of facenet_pytorch, which avoids TensorFlow.
+    """
+    name = 'torch'
+
+    KEYPOINTS = ['left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right']
+
+    def __init__(self) -> None:
+        from facenet_pytorch import MTCNN
+        self.detector = MTCNN(keep_all=True, device='cpu')
+
+    def detect_faces(self, image: np.ndarray) -> list[dict]:
+        """
+        Detect every face in an image.
+
+        Args:
+            image (np.ndarray): The RGB image of shape (H, W, 3).
+
+        Returns:
+            list[dict]: A {'box', 'confidence', 'keypoints'} dictionary per face, in the
+                        same format as the `mtcnn` package.
+        """
+        boxes, probabilities, landmarks = self.detector.detect(image, landmarks=True)
+        if boxes is None:
+            return []
+
+        detections = []
+        for box, probability, points in zip(boxes, probabilities, landmarks):
+            x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+            detections.append({
+                'box': [x1, y1, int(box[2]) - x1, int(box[3]) - y1],
+                'confidence': float(probability),
+                'keypoints': {name: (int(x), int(y)) for name, (x, y) in zip(self.KEYPOINTS, points)},
+            })
+        return detections
+
+
+DETECTORS = {
+    MTCNNDetector.name: MTCNNDetector,
+    TorchMTCNNDetector.name: TorchMTCNNDetector,
+}
+
+
+def create_detector(name: str):
+    """
+    Create the face detector of a backend.
+
+    Args:
+        name (str): The backend name ('mtcnn' or 'torch').
+
+    Returns:
+        The detector, exposing `detect_faces(image)`.
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}', expected one of {', '.join(DETECTORS)}")
+    return DETECTORS[name]()
+
+
+def detect_faces_downscaled(detector, image: np.ndarray, max_side: int) -> list[dict]:
+    """
+    Detect faces on a copy of the image bounded to a longest side, in full resolution coordinates.
+
+    Detection cost grows with the pixel count while faces in phone captures are large,
+    so the boxes found on the small copy are scaled back to crop from the original image.
+
+    Args:
+        detector: The face detector, exposing `detect_faces(image)`.
+        image (np.ndarray): The RGB image of shape (H, W, 3).
+        max_side (int): The longest side of the copy given to the detector. 0 detects on
+            the original image.
+
+    Returns:
+        list[dict]: The detections of `detector.detect_faces`, with boxes and keypoints
+                    in the coordinates of the original image.
+    """
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return detector.detect_faces(image)
+
+    scale = max_side / max(height, width)
+    small = np.asarray(Image.fromarray(image).resize(
+        (max(round(width * scale), 1), max(round(height * scale), 1)), Image.BILINEAR, reducing_gap=2.0))
+
+    detections = detector.detect_faces(small)
+    for detection in detections:
+        x, y, box_width, box_height = (value / scale for value in detection['box'])
+        x1, y1 = max(int(x), 0), max(int(y), 0)
+        x2, y2 = min(int(round(x + box_width)), width), min(int(round(y + box_height)), height)
+        detection['box'] = [x1, y1, x2 - x1, y2 - y1]
+        detection['keypoints'] = {name: (int(px / scale), int(py / scale))
+                                  for name, (px, py) in detection.get('keypoints', {}).items()}
+    return detections
@@ -0,0 +1,106 @@
+import threading
+import numpy as np
+from PIL import Image
+
+
+class FaceBatchBuffer:
+    """
+    A reusable float32 buffer that faces are resized and normalized into for FaceNet.
+
+    Every face is resized so its shortest side is `size`, keeping its aspect ratio like the
+    Resize(160) the enrolled embeddings were made with, and scaled from [0, 255] to [-1, 1]
+    in place, in channel-first order, which is what ToTensor followed by Normalize(0.5, 0.5)
+    produces. Faces of the same resized shape share a batch. Each thread fills its own buffer,
+    and a fill overwrites the previous batches of the same thread, so they must be consumed
+    before the thread fills the next ones.
+
+    Attributes:
+        size (int): The shortest side of the faces in the batches, in pixels.
+        capacity (int): The number of square faces the buffers are first allocated for.
+    """
+
+    def __init__(self, size: int = 160, capacity: int = 16) -> None:
+        """
+        Args:
+            size (int): The shortest side of the faces in the batches, in pixels.
+            capacity (int): The number of square faces the buffers are first allocated for.
+                Larger batches grow the buffer of their thread.
+        """
+        self.size = size
+        self.capacity = capacity
+        self._local = threading.local()
+
+    def _buffer(self, count: int) -> np.ndarray:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < count:
+            buffer = np.empty(max(count, self.capacity * 3 * self.size * self.size), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer
+
+    def shape(self, height: int, width: int) -> tuple[int, int]:
+        """
+        Return the shape a face is resized to.
+
+        Args:
+            height (int): The height of the face, in pixels.
+            width (int): The width of the face, in pixels.
+
+        Returns:
+            tuple[int, int]: The (height, width) with the shortest side at `size`, rounded down
+                like torchvision's Resize.
+        """
+        if width <= height:
+            return int(self.size * height / width), self.size
+        return self.size, int(self.size * width / height)
+
+    def resize(self, face) -> np.ndarray:
+        """
+        Resize a face so its shortest side is the batch size.
+
+        Args:
+            face (np.ndarray | Image.Image): The RGB face, as an array of shape (H, W, 3) or an image.
+
+        Returns:
+            np.ndarray: The uint8 pixels of shape (H', W', 3).
+        """
+        if isinstance(face, np.ndarray):
+            if face.shape[:2] == self.shape(*face.shape[:2]):
+                return face
+            face = Image.fromarray(face)
+        height, width = self.shape(face.height, face.width)
+        if face.size != (width, height):
+            face = face.resize((width, height), Image.BILINEAR)
+        return np.asarray(face)
+
+    def fill(self, faces: list) -> list[tuple[list[int], np.ndarray]]:
+        """
+        Resize and normalize faces into the buffer of the calling thread.
+
+        Args:
+            faces (list[np.ndarray | Image.Image]): The RGB faces.
+
+        Returns:
+            list[tuple[list[int], np.ndarray]]: For every resized shape, the indices of its faces
+                and a view of the buffer of shape (len(indices), 3, H', W') holding them.
+        """
+        resized = [self.resize(face) for face in faces]
+        groups = {}
+        for i, pixels in enumerate(resized):
+            groups.setdefault(pixels.shape[:2], []).append(i)
+
+        # The batches are consecutive slices of one buffer
+        buffer = self._buffer(sum(len(indices) * 3 * height * width
+                                  for (height, width), indices in groups.items()))
+        batches = []
+        offset = 0
+        for (height, width), indices in groups.items():
+            end = offset + len(indices) * 3 * height * width
+            batch = buffer[offset:end].reshape(len(indices), 3, height, width)
+            offset = end
+            for row, i in zip(batch, indices):
+                # (x / 255 - 0.5) / 0.5 without intermediate arrays
+                np.multiply(resized[i].transpose(2, 0, 1), np.float32(1 / 127.5),
+                            out=row, dtype=np.float32, casting='unsafe')
+                np.subtract(row, np.float32(1), out=row)
+            batches.append((indices, batch))
+        return batches
@@ -0,0 +1,125 @@
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+# Message shown to the examiner for every reason a photo is rejected
+REJECTION_MESSAGES = {
+    'decode_failed': "The image could not be read, please retake it again.",
+    'no_face': "No face detected in the image, please retake it again.",
+    'crop_mismatch': "The face crop does not match its declared crop format, please retake it again.",
+    'face_too_small': "The face is too small, please move closer and retake it.",
+    'low_confidence': "The face is not clearly visible, please retake it facing the camera.",
+    'too_blurry': "The image is blurry, please hold the camera still and retake it.",
+    'too_dark': "The image is too dark, please retake it with more light.",
+    'too_bright': "The image is overexposed, please retake it with less light.",
+    'inference_failed': "The image could not be processed, please retake it again.",
+}
+
+
+def sharpness(gray: np.ndarray) -> float:
+    """
+    Measure the sharpness of a grayscale image as the variance of its Laplacian.
+
+    Args:
+        gray (np.ndarray): The grayscale image of shape (H, W).
+
+    Returns:
+        float: The variance of the 4-neighbour Laplacian, low for blurry images.
+    """
+    gray = gray.astype(np.float32)
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def grayscale(face: np.ndarray, size: int = 160) -> np.ndarray:
+    """
+    Convert a face crop to a square grayscale image of a fixed size.
+
+    Args:
+        face (np.ndarray): The RGB face crop of shape (H, W, 3).
+        size (int): The side of the output image.
+
+    Returns:
+        np.ndarray: The grayscale face of shape (size, size).
+    """
+    return np.asarray(Image.fromarray(face).convert('L').resize((size, size), Image.BILINEAR))
+
+
+class QualityGate:
+    """
+    Cheap checks rejecting unusable face captures before FaceNet inference.
+
+    Attributes:
+        min_face_size (int): The smallest accepted side of the face box, in pixels.
+        min_confidence (float): The smallest accepted detector confidence.
+        min_sharpness (float): The smallest accepted Laplacian variance of the face.
+        min_brightness (float): The smallest accepted mean brightness of the face (0-255).
+        max_brightness (float): The largest accepted mean brightness of the face (0-255).
+    """
+
+    def __init__(self, min_face_size: int = 80, min_confidence: float = 0.9, min_sharpness: float = 40,
+                 min_brightness: float = 40, max_brightness: float = 220) -> None:
+        """
+        Args:
+            min_face_size (int): The smallest accepted side of the face box, in pixels.
+            min_confidence (float): The smallest accepted detector confidence.
+            min_sharpness (float): The smallest accepted Laplacian variance of the face.
+            min_brightness (float): The smallest accepted mean brightness of the face (0-255).
+            max_brightness (float): The largest accepted mean brightness of the face (0-255).
+        """
+        self.min_face_size = min_face_size
+        self.min_confidence = min_confidence
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Build the gate configured in the settings.
+
+        Returns:
+            QualityGate: The configured gate, or None if the gate is disabled.
+        """
+        if not settings.FACIAL_QUALITY_GATE:
+            return None
+        return cls(
+            min_face_size=settings.FACIAL_MIN_FACE_SIZE,
+            min_confidence=settings.FACIAL_MIN_DETECTION_CONFIDENCE,
+            min_sharpness=settings.FACIAL_MIN_SHARPNESS,
+            min_brightness=settings.FACIAL_MIN_BRIGHTNESS,
+            max_brightness=settings.FACIAL_MAX_BRIGHTNESS,
+        )
+
+    def check(self, face: np.ndarray, detection: dict, size: int = 160) -> str:
+        """
+        Check a detected face, running the cheapest checks first.
+
+        Sharpness and exposure are measured on the face resized to the FaceNet input size,
+        so the thresholds do not depend on the photo resolution.
+
+        Args:
+            face (np.ndarray): The RGB face crop of shape (H, W, 3).
+            detection (dict): The detection of the face, with its 'box' and 'confidence'.
+            size (int): The side the face is measured at.
+
+        Returns:
+            str: The rejection reason ('face_too_small', 'low_confidence', 'too_blurry',
+                 'too_dark' or 'too_bright'), or None if the face is usable.
+        """
+        _, _, width, height = detection['box']
+        if min(width, height) < self.min_face_size:
+            return 'face_too_small'
+        if detection.get('confidence', 1.0) < self.min_confidence:
+            return 'low_confidence'
+
+        gray = grayscale(face, size)
+        brightness = gray.mean()
+        if brightness < self.min_brightness:
+            return 'too_dark'
+        if brightness > self.max_brightness:
+            return 'too_bright'
+        if sharpness(gray) < self.min_sharpness:
+            return 'too_blurry'
+        return None
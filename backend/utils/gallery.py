@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from Management.models import CacheGeneration, Student, StudentEmbedding
+from facial import FacialRecognition
+from utils.embedding_models import model_version
+from utils.gallery_snapshot import get_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Generation of the room galleries, bumped in the database on every change of a room or a student
+GALLERY_GENERATION = 'room_galleries'
+
+
+def load_feature_lists(student_ids: list[str] = None) -> dict[str, list[dict]]:
+    """
+    Load the stored embeddings of students produced by the current model.
+
+    Vectors are decoded straight from the binary column without copying.
+
+    Args:
+        student_ids (list[str]): The students to load, or None to load every student.
+
+    Returns:
+        dict[str, list[dict]]: The {'side', 'features', 'weight'} entries keyed by student ID.
+    """
+    embeddings = StudentEmbedding.objects.filter(
+        MODEL_VERSION=model_version()).exclude(SIDE=StudentEmbedding.Side.FUSED)
+    if student_ids is not None:
+        embeddings = embeddings.filter(STUDENT_ID__in=student_ids)
+
+    feature_lists = {}
+    for student_id, side, vector, dtype, weight in embeddings.values_list(
+            'STUDENT_ID', 'SIDE', 'VECTOR', 'DTYPE', 'WEIGHT').iterator():
+        feature_lists.setdefault(student_id, []).append(
+            {'side': side, 'features': np.frombuffer(vector, dtype=dtype), 'weight': weight})
+    return feature_lists
+
+
+def load_templates(student_ids: list[str] = None) -> dict[str, np.ndarray]:
+    """
+    Load the fused templates of students produced by the current model.
+
+    Args:
+        student_ids (list[str]): The students to load, or None to load every student.
+
+    Returns:
+        dict[str, np.ndarray]: The fused template keyed by student ID.
+    """
+    embeddings = StudentEmbedding.objects.filter(
+        MODEL_VERSION=model_version(), SIDE=StudentEmbedding.Side.FUSED)
+    if student_ids is not None:
+        embeddings = embeddings.filter(STUDENT_ID__in=student_ids)
+
+    return {
+        student_id: np.frombuffer(vector, dtype=dtype)
+        for student_id, vector, dtype in embeddings.values_list(
+            'STUDENT_ID', 'VECTOR', 'DTYPE').iterator()
+    }
+
+
+class RoomGallery:
+    """
+    In-memory embedding gallery of every student seated in one exam room.
+
+    The fused template of every student, precomputed at enrollment, is held as a single
+    float32 matrix of shape (students, dim), so a probe embedding is scored against the
+    whole room with one matrix-vector product that gives the exact weighted average
+    similarity over all sides.
+
+    Attributes:
+        room_pk (int): Primary key of the room the gallery was built from.
+        student_ids (list[str]): Student IDs in gallery row order.
+        course_codes (list[str]): Course code each student sits for, in row order.
+        students (dict): Student instances keyed by student ID.
+        missing (list[str]): Student IDs from the roster that do not exist.
+        templates (np.ndarray): Fused templates, shape (N, D). Students without
+            embeddings have a zero template.
+        built_at (float): Monotonic time at which the gallery was built.
+        generation (int): The gallery generation the gallery was built at.
+    """
+
+    def __init__(self, room, generation: int = 0) -> None:
+        """
+        Load the roster of the given room once and pack its embeddings.
+
+        Args:
+            room (Room): The room whose STUDENT_LIST is loaded.
+            generation (int): The gallery generation read before loading the room.
+        """
+        self.room_pk = room.pk
+        self.generation = generation
+        roster = [
+            (str(student_id), entry["course_code"])
+            for entry in room.STUDENT_LIST
+            for student_id in entry.get("students", [])
+        ]
+        self.students = Student.objects.in_bulk([student_id for student_id, _ in roster])
+        self.missing = [
+            student_id for student_id, _ in roster if student_id not in self.students]
+        if self.missing:
+            logger.warning("Room %s at %s lists students that do not exist, matching without them: %s",
+                           room.ROOM_NO, room.EXAM_TIME, ", ".join(self.missing))
+
+        # Read the templates from the shared snapshot, and only the others from the database
+        snapshot = get_snapshot()
+        stored_templates = snapshot.templates_of(list(self.students)) if snapshot else {}
+        missing_templates = [student_id for student_id in self.students
+                             if student_id not in stored_templates]
+        if missing_templates:
+            stored_templates.update(load_templates(missing_templates))
+        dim = next((len(template) for template in stored_templates.values()), 0)
+
+        self.student_ids = []
+        self.course_codes = []
+        for student_id, course_code in roster:
+            if student_id in self.students:
+                self.student_ids.append(student_id)
+                self.course_codes.append(course_code)
+
+        self.templates = np.zeros((len(self.student_ids), dim), dtype=np.float32)
+        for row, student_id in enumerate(self.student_ids):
+            if student_id in stored_templates:
+                self.templates[row] = stored_templates[student_id]
+        self.built_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    def score(self, probe: np.ndarray) -> np.ndarray:
+        """
+        Compute the weighted cosine similarity of a probe against every student.
+
+        Args:
+            probe (np.ndarray): The probe embedding.
+
+        Returns:
+            np.ndarray: The weighted similarity per student, in gallery row order.
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return FacialRecognition.score_templates(probe, self.templates)
+
+    def match(self, probe: np.ndarray, threshold: float, margin: float = 0):
+        """
+        Find the best matching student of the room for a probe embedding.
+
+        Args:
+            probe (np.ndarray): The probe embedding.
+            threshold (float): The minimum weighted similarity of a match.
+            margin (float): The minimum lead of the best student over the runner-up.
+
+        Returns:
+            tuple[Student, str, float] | None: The matched student, the course code
+                they sit for and the similarity, or None if no student passes the threshold.
+        """
+        scores = self.score(probe)
+        if scores.size == 0:
+            return None
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        if margin and len(scores) > 1 and scores[best] - np.partition(scores, -2)[-2] < margin:
+            return None
+        student_id = self.student_ids[best]
+        return self.students[student_id], self.course_codes[best], float(scores[best])
+
+    def assign(self, probes: list[np.ndarray], threshold: float) -> list:
+        """
+        Match many probe embeddings of one photo, never matching a student twice.
+
+        Pairs are assigned greedily from the highest similarity down, so every probe gets
+        its best student that no more similar probe already took.
+
+        Args:
+            probes (list[np.ndarray]): The probe embeddings.
+            threshold (float): The minimum weighted similarity of a match.
+
+        Returns:
+            list[tuple[Student, str, float] | None]: The match of every probe, in the format
+                of `match`, or None if it was not matched.
+        """
+        matches = [None] * len(probes)
+        if len(self) == 0 or len(probes) == 0:
+            return matches
+
+        scores = FacialRecognition.score_templates(np.stack(probes), self.templates)
+        probe_rows, student_rows = np.nonzero(scores >= threshold)
+        order = np.argsort(-scores[probe_rows, student_rows], kind='stable')
+
+        matched_students = set()
+        for k in order:
+            probe_row, student_row = int(probe_rows[k]), int(student_rows[k])
+            student_id = self.student_ids[student_row]
+            if matches[probe_row] is not None or student_id in matched_students:
+                continue
+            matched_students.add(student_id)
+            matches[probe_row] = (self.students[student_id], self.course_codes[student_row],
+                                  float(scores[probe_row, student_row]))
+        return matches
+
+
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+
+def get_room_gallery(room) -> RoomGallery:
+    """
+    Return the cached gallery of a room, building it on first use.
+
+    Galleries are keyed by (ROOM_NO, EXAM_TIME) and rebuilt when the cached one was
+    built from another Room row, before a room or student changed in any worker, or is
+    older than FACIAL_GALLERY_TTL seconds.
+
+    Args:
+        room (Room): The room whose gallery is requested.
+
+    Returns:
+        RoomGallery: The gallery of the room.
+    """
+    key = (room.ROOM_NO, room.EXAM_TIME)
+    ttl = getattr(settings, "FACIAL_GALLERY_TTL", 300)
+    # Read before building, so a change made while the gallery loads rebuilds it next time
+    generation = CacheGeneration.current(GALLERY_GENERATION)
+
+    with _galleries_lock:
+        gallery = _galleries.get(key)
+    if (gallery is not None and gallery.room_pk == room.pk and gallery.generation == generation
+            and time.monotonic() - gallery.built_at < ttl):
+        return gallery
+
+    gallery = RoomGallery(room, generation)
+    with _galleries_lock:
+        _galleries[key] = gallery
+    return gallery
+
+
+def _bump_generation() -> None:
+    # Bumped once the change is committed, so other workers never rebuild from the old rows
+    transaction.on_commit(lambda: CacheGeneration.bump(GALLERY_GENERATION))
+
+
+def invalidate_room(room_no: str, exam_time: str) -> None:
+    """
+    Drop the cached gallery of a room, and have every other worker rebuild its galleries.
+
+    Args:
+        room_no (str): The room number.
+        exam_time (str): The exam time of the room.
+    """
+    with _galleries_lock:
+        _galleries.pop((room_no, exam_time), None)
+    _bump_generation()
+
+
+def invalidate_student(student_id: str) -> None:
+    """
+    Drop every cached gallery that holds the given student, and have every other worker
+    rebuild its galleries.
+
+    Args:
+        student_id (str): The ID of the student whose features changed.
+    """
+    student_id = str(student_id)
+    with _galleries_lock:
+        for key in [key for key, gallery in _galleries.items()
+                    if student_id in gallery.students or student_id in gallery.missing]:
+            del _galleries[key]
+    _bump_generation()
+
+
+def invalidate_all() -> None:
+    """
+    Drop every cached gallery, here and in every other worker.
+    """
+    with _galleries_lock:
+        _galleries.clear()
+    _bump_generation()
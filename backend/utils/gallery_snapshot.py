@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from datetime import datetime, timezone
+from django.conf import settings
+from Management.models import StudentEmbedding
+from utils.embedding_models import model_version
+
+# File naming the current snapshot directory
+POINTER = 'CURRENT'
+
+
+def _snapshot_root() -> str:
+    return str(getattr(settings, "FACIAL_SNAPSHOT_DIR",
+                       os.path.join(settings.BASE_DIR, 'index', 'snapshots')))
+
+
+def export_snapshot(keep: int = 2) -> str:
+    """
+    Export the fused templates of every enrolled student to a new versioned snapshot.
+
+    Fused templates score a probe exactly like the weighted sides, so they are all the
+    workers read. The snapshot is written to a temporary directory, renamed into place, and published
+    by atomically replacing the CURRENT pointer, so readers never see a partial snapshot.
+
+    Args:
+        keep (int): The number of snapshots kept on disk, the current one included.
+
+    Returns:
+        str: The directory of the new snapshot.
+    """
+    from utils.gallery import load_templates
+
+    # Changes committed after this instant may be missing from the snapshot
+    created_at = time.time()
+    templates = load_templates()
+
+    ids = sorted(templates)
+    dim = len(templates[ids[0]]) if ids else 0
+
+    root = _snapshot_root()
+    version = f"{time.strftime('%Y%m%d%H%M%S', time.localtime(created_at))}-{os.getpid()}"
+    temp_path = os.path.join(root, f".{version}.tmp")
+    os.makedirs(temp_path, exist_ok=True)
+
+    np.save(os.path.join(temp_path, 'ids.npy'), np.array(ids, dtype=str))
+    np.save(os.path.join(temp_path, 'templates.npy'),
+            np.stack([np.asarray(templates[student_id], dtype=np.float32) for student_id in ids])
+            if ids else np.zeros((0, dim), dtype=np.float32))
+    with open(os.path.join(temp_path, 'meta.json'), 'w') as meta:
+        json.dump({
+            'version': version,
+            'model_version': model_version(),
+            'created_at': created_at,
+            'students': len(ids),
+        }, meta)
+
+    path = os.path.join(root, version)
+    os.replace(temp_path, path)
+
+    pointer_path = os.path.join(root, POINTER)
+    with open(f"{pointer_path}.{os.getpid()}.tmp", 'w') as pointer:
+        pointer.write(version)
+    os.replace(f"{pointer_path}.{os.getpid()}.tmp", pointer_path)
+
+    # Workers still mapping a removed snapshot keep reading it until they switch
+    versions = sorted(name for name in os.listdir(root)
+                      if os.path.isdir(os.path.join(root, name)) and not name.startswith('.'))
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    return path
+
+
+class GallerySnapshot:
+    """
+    A read-only gallery snapshot whose templates are memory-mapped from disk.
+
+    Every worker mapping the same snapshot shares its pages through the page cache.
+
+    Attributes:
+        version (str): The version of the snapshot.
+        model_version (str): The model that produced the embeddings.
+        created_at (float): The time the export started.
+        ids (np.ndarray): Student IDs in row order.
+        templates (np.ndarray): Fused templates, shape (N, D).
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Map a snapshot directory.
+
+        Args:
+            path (str): The directory written by `export_snapshot`.
+        """
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        self.version = meta['version']
+        self.model_version = meta['model_version']
+        self.created_at = meta['created_at']
+        self.ids = np.load(os.path.join(path, 'ids.npy'))
+        self.templates = np.load(os.path.join(path, 'templates.npy'), mmap_mode='r')
+        self._rows = {student_id: row for row, student_id in enumerate(self.ids.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def templates_of(self, student_ids: list[str]) -> dict[str, np.ndarray]:
+        """
+        Look up the fused templates of students that are current in the snapshot.
+
+        Args:
+            student_ids (list[str]): The students to look up.
+
+        Returns:
+            dict[str, np.ndarray]: The template keyed by student ID, for the students present
+                in the snapshot and unchanged since it was exported.
+        """
+        rows = {student_id: self._rows[student_id] for student_id in map(str, student_ids)
+                if student_id in self._rows}
+        stale = changed_students(list(rows), self.model_version, self.created_at) if rows else set()
+        return {student_id: self.templates[row] for student_id, row in rows.items()
+                if student_id not in stale}
+
+
+def changed_students(student_ids: list[str], version: str, since: float) -> set[str]:
+    """
+    Find the students whose fused template was stored after an instant.
+
+    Args:
+        student_ids (list[str]): The students to check.
+        version (str): The model version of the templates.
+        since (float): The instant, as a Unix timestamp.
+
+    Returns:
+        set[str]: The IDs of the students changed at or after `since`.
+    """
+    return set(StudentEmbedding.objects.filter(
+        STUDENT_ID__in=student_ids, MODEL_VERSION=version, SIDE=StudentEmbedding.Side.FUSED,
+        UPDATED_AT__gte=datetime.fromtimestamp(since, tz=timezone.utc),
+    ).values_list('STUDENT_ID', flat=True))
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> GallerySnapshot:
+    """
+    Return the current gallery snapshot, switching to a newer one once it is published.
+
+    Returns:
+        GallerySnapshot: The current snapshot, or None if none was exported for the current model.
+    """
+    global _snapshot
+    root = _snapshot_root()
+    try:
+        with open(os.path.join(root, POINTER)) as pointer:
+            version = pointer.read().strip()
+    except FileNotFoundError:
+        return None
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            try:
+                _snapshot = GallerySnapshot(os.path.join(root, version))
+            except FileNotFoundError:
+                return None
+        snapshot = _snapshot
+
+    if snapshot.model_version != model_version():
+        return None
+    return snapshot
@@ -0,0 +1,325 @@
+import inspect
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client, Listener
+
+# The engine owned by the current pool worker process
+_worker_engine = None
+
+# Barrier shared by the workers of a pool, for tasks that must run once in every worker
+_worker_barrier = None
+
+
+def _create_facial_engine(**engine_kwargs):
+    from facial import FacialRecognition
+    return FacialRecognition(**engine_kwargs)
+
+
+def _load_engine(engine_factory, engine_kwargs: dict, barrier) -> None:
+    global _worker_engine, _worker_barrier
+    _worker_barrier = barrier
+    _worker_engine = engine_factory(**engine_kwargs)
+    # Every worker runs its warm-up passes before it takes its first task
+    warm_up = getattr(_worker_engine, 'warm_up', None)
+    if callable(warm_up):
+        warm_up()
+
+
+def _wait_for_workers() -> None:
+    # Blocks the worker until every worker of the pool runs this task, so no worker takes two
+    _worker_barrier.wait()
+
+
+def _call_engine(name: str, args: tuple, kwargs: dict):
+    attribute = getattr(_worker_engine, name)
+    if callable(attribute):
+        return attribute(*args, **kwargs)
+    return attribute
+
+
+class InferencePool:
+    """
+    A pool of worker processes that each load the FacialRecognition models once and run their
+    warm-up passes before taking any task.
+
+    A worker that dies (for instance killed by the out-of-memory killer) breaks the
+    executor; the calls running at that moment fail and the pool is restarted, so later
+    calls are served by fresh workers.
+
+    Attributes:
+        workers (int): The number of worker processes.
+        restarts (int): The number of times the pool was restarted after a worker died.
+    """
+
+    def __init__(self, workers: int, engine_kwargs: dict = None, engine_factory=None) -> None:
+        """
+        Start the worker processes.
+
+        Args:
+            workers (int): The number of worker processes.
+            engine_kwargs (dict): Keyword arguments of the engine built in every worker.
+            engine_factory (callable): Builds the engine of a worker from `engine_kwargs`.
+                It must be importable by the workers. Defaults to FacialRecognition.
+        """
+        self.workers = workers
+        self.restarts = 0
+        self._engine_kwargs = engine_kwargs or {}
+        self._engine_factory = engine_factory or _create_facial_engine
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context('spawn')
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_load_engine,
+            initargs=(self._engine_factory, self._engine_kwargs, context.Barrier(self.workers)),
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        with self._lock:
+            # Concurrent failures of the same executor restart it once. A broken executor has
+            # already terminated its workers, and shutting it down from a done callback would
+            # deadlock on its internal lock.
+            if self._executor is broken:
+                self._executor = self._start()
+                self.restarts += 1
+            return self._executor
+
+    def call(self, name: str, *args, **kwargs):
+        """
+        Run an engine method in one of the workers and wait for its result.
+
+        Args:
+            name (str): The name of the FacialRecognition method or attribute.
+            *args: Positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+
+        Returns:
+            The value returned by the method, or the attribute value.
+        """
+        return self.submit(name, *args, **kwargs).result()
+
+    def submit(self, name: str, *args, **kwargs) -> Future:
+        """
+        Schedule an engine method in one of the workers without waiting for it.
+
+        Args:
+            name (str): The name of the FacialRecognition method or attribute.
+            *args: Positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+
+        Returns:
+            Future: The pending result of the method.
+        """
+        return self._submit(_call_engine, name, args, kwargs)
+
+    def _submit(self, function, *args) -> Future:
+        executor = self._executor
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            executor = self._restart(executor)
+            future = executor.submit(function, *args)
+
+        def restart_if_broken(done: Future) -> None:
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                self._restart(executor)
+
+        future.add_done_callback(restart_if_broken)
+        return future
+
+    def warm_up(self) -> None:
+        """
+        Start every worker process and wait until each has loaded its models and run its
+        warm-up passes.
+
+        One task per worker waits on a barrier that only opens once all workers run one, so
+        the tasks cannot pile up on the workers that started first.
+        """
+        futures = [self._submit(_wait_for_workers) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        self._executor.shutdown()
+
+
+def parse_address(address: str):
+    """
+    Parse the address of the inference server.
+
+    Args:
+        address (str): 'host:port' for TCP, or the path of a Unix socket.
+
+    Returns:
+        The address in the form expected by multiprocessing.connection.
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class InferenceServer:
+    """
+    Serve an InferencePool to the web workers of the machine over a local socket.
+
+    All web workers share the same pool, so the number of model copies is set by the size
+    of the pool alone. Every connection is handled by its own thread, and each request on
+    it is a (name, args, kwargs) engine call answered with ('ok', result) or ('error', exception).
+    """
+
+    def __init__(self, pool: InferencePool, address: str, authkey: bytes) -> None:
+        """
+        Args:
+            pool (InferencePool): The pool running the engines.
+            address (str): 'host:port' or the path of a Unix socket to listen on.
+            authkey (bytes): The key clients must authenticate with.
+        """
+        self.pool = pool
+        self.listener = Listener(parse_address(address), authkey=authkey)
+
+    def serve_forever(self) -> None:
+        """Accept connections until the server is closed."""
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                # Closed by `close`
+                return
+            except multiprocessing.AuthenticationError:
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection) -> None:
+        with connection:
+            while True:
+                try:
+                    name, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if name == 'warm_up':
+                        # Warming up the server means warming up every worker of the pool
+                        self.pool.warm_up()
+                        reply = ('ok', None)
+                    else:
+                        reply = ('ok', self.pool.call(name, *args, **kwargs))
+                except Exception as error:
+                    reply = ('error', error)
+                try:
+                    connection.send(reply)
+                except (EOFError, OSError):
+                    return
+                except Exception as error:
+                    # The result or the exception cannot be pickled, nothing was sent yet
+                    connection.send(('error', RuntimeError(f"{name} returned an unsendable value: {error}")))
+
+    def close(self) -> None:
+        """Stop accepting connections."""
+        self.listener.close()
+
+
+class InferenceServerClient:
+    """
+    Client of an InferenceServer, with the `call` and `warm_up` API of InferencePool.
+
+    Connections are opened on demand and reused, one per concurrent caller.
+    """
+
+    def __init__(self, address: str, authkey: bytes) -> None:
+        """
+        Args:
+            address (str): 'host:port' or the path of the Unix socket of the server.
+            authkey (bytes): The key of the server.
+        """
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return Client(self.address, authkey=self.authkey), False
+
+    def call(self, name: str, *args, **kwargs):
+        """
+        Run an engine method in the server and wait for its result.
+
+        Args:
+            name (str): The name of the FacialRecognition method or attribute.
+            *args: Positional arguments of the method.
+            **kwargs: Keyword arguments of the method.
+
+        Returns:
+            The value returned by the method, or the attribute value.
+        """
+        connection, reused = self._connection()
+        try:
+            connection.send((name, args, kwargs))
+        except OSError:
+            connection.close()
+            if not reused:
+                raise
+            # The server closed an idle connection, for instance when it restarted
+            connection, _ = Client(self.address, authkey=self.authkey), False
+            connection.send((name, args, kwargs))
+
+        try:
+            outcome, value = connection.recv()
+        except (EOFError, OSError) as error:
+            connection.close()
+            raise ConnectionError(f"The inference server closed the connection: {error}") from error
+
+        with self._lock:
+            self._idle.append(connection)
+        if outcome == 'error':
+            raise value
+        return value
+
+    def warm_up(self) -> None:
+        """Wait until every worker of the server has loaded its models."""
+        self.call('warm_up')
+
+
+class FacialRecognitionClient:
+    """
+    Drop-in stand-in for FacialRecognition that runs inference in an InferencePool or
+    an InferenceServer.
+
+    Engine methods are executed in a worker process, static methods and class constants
+    are served locally, and instance attributes such as `threshold` are fetched from a
+    worker once and cached.
+    """
+
+    def __init__(self, pool) -> None:
+        """
+        Args:
+            pool (InferencePool | InferenceServerClient): Runs the engine calls.
+        """
+        self.pool = pool
+        self._attributes = {}
+
+    def __getattr__(self, name: str):
+        from facial import FacialRecognition
+
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        static = inspect.getattr_static(FacialRecognition, name, None)
+        if static is not None and not inspect.isfunction(static):
+            # Static methods and class constants need no model
+            return getattr(FacialRecognition, name)
+        if static is not None:
+            return lambda *args, **kwargs: self.pool.call(name, *args, **kwargs)
+
+        if name not in self._attributes:
+            self._attributes[name] = self.pool.call(name)
+        return self._attributes[name]
@@ -0,0 +1,237 @@
+import queue
+import threading
+import time
+
+
+class _Request:
+    """A single item waiting in the scheduler queue."""
+
+    def __init__(self, item) -> None:
+        self.item = item
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Collect items submitted by concurrent callers and process them in batches.
+
+    The first queued item opens a window of `window_ms` milliseconds; every item that
+    arrives within the window, up to `max_batch_size`, is handed to `run_batch` in one
+    call and each caller gets its own result back. A wider window trades latency of
+    lone requests for larger batches under load.
+
+    Attributes:
+        run_batch (callable): Processes a list of items and returns a list of results.
+        window_ms (float): How long a batch waits for more items, in milliseconds.
+        max_batch_size (int): The largest number of items processed in one call.
+    """
+
+    def __init__(self, run_batch, window_ms: float = 10, max_batch_size: int = 16) -> None:
+        """
+        Initialize the scheduler; its worker thread starts on the first submission.
+
+        Args:
+            run_batch (callable): Processes a list of items and returns a list of results.
+            window_ms (float): How long a batch waits for more items, in milliseconds.
+            max_batch_size (int): The largest number of items processed in one call.
+        """
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+        self._total_wait = 0.0
+        self._longest_wait = 0.0
+
+    def submit(self, item):
+        """
+        Queue an item and block until its batch has been processed.
+
+        Args:
+            item: The item to process.
+
+        Returns:
+            The result of `run_batch` for this item.
+        """
+        self._ensure_worker()
+        request = _Request(item)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self) -> dict:
+        """
+        Report batch size and queue wait counters.
+
+        Returns:
+            dict: The number of batches and items processed, the mean and largest batch
+                  size, and the mean and longest queue wait in milliseconds.
+        """
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "largest_batch_size": self._largest_batch,
+                "mean_queue_wait_ms": 1000 * self._total_wait / self._items if self._items else 0.0,
+                "longest_queue_wait_ms": 1000 * self._longest_wait,
+            }
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="facial-micro-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> list[_Request]:
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.window_ms / 1000
+        while len(batch) < self.max_batch_size:
+            # Items that already queued up behind a running batch are taken without waiting
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started_at = time.monotonic()
+            waits = [started_at - request.enqueued_at for request in batch]
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._total_wait += sum(waits)
+                self._longest_wait = max(self._longest_wait, max(waits))
+
+            try:
+                results = self.run_batch([request.item for request in batch])
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+class InferenceLimiter:
+    """
+    Bound the number of inferences running at once in a process and queue the others.
+
+    Used as a context manager around every detector and model pass. Under contention a few
+    inferences at a time, each with enough threads, finish more requests per second than
+    every request thread competing for the cores at once.
+
+    Attributes:
+        max_concurrent (int): The largest number of inferences run at once. 0 runs them all.
+    """
+
+    def __init__(self, max_concurrent: int = 0) -> None:
+        """
+        Args:
+            max_concurrent (int): The largest number of inferences run at once. 0 runs them all.
+        """
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._lock = threading.Lock()
+
+        self._inferences = 0
+        self._running = 0
+        self._waiting = 0
+        self._total_wait = 0.0
+        self._longest_wait = 0.0
+
+    def __enter__(self) -> "InferenceLimiter":
+        started_at = time.monotonic()
+        if self._semaphore is not None:
+            with self._lock:
+                self._waiting += 1
+            try:
+                self._semaphore.acquire()
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+
+        wait = time.monotonic() - started_at
+        with self._lock:
+            self._inferences += 1
+            self._running += 1
+            self._total_wait += wait
+            self._longest_wait = max(self._longest_wait, wait)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with self._lock:
+            self._running -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """
+        Report concurrency and queue wait counters.
+
+        Returns:
+            dict: The limit, the number of inferences started, running and waiting, and the
+                  mean and longest wait for a slot in milliseconds.
+        """
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "inferences": self._inferences,
+                "running": self._running,
+                "waiting": self._waiting,
+                "mean_queue_wait_ms": 1000 * self._total_wait / self._inferences if self._inferences else 0.0,
+                "longest_queue_wait_ms": 1000 * self._longest_wait,
+            }
+
+
+def configure_threads(intra_op: int = 0, inter_op: int = 0, tensorflow: bool = False) -> None:
+    """
+    Set the number of threads torch, and optionally TensorFlow, use in this process.
+
+    Both libraries default to one thread per core, so several processes on the same machine
+    oversubscribe it. Inter-op threads can only be set before the library first uses them;
+    later calls keep the threads already in use.
+
+    Args:
+        intra_op (int): Threads parallelizing a single operation. 0 keeps the library default.
+        inter_op (int): Threads running independent operations concurrently. 0 keeps the default.
+        tensorflow (bool): Also configure TensorFlow, used by the 'mtcnn' face detector.
+    """
+    import torch
+
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            pass
+
+    if tensorflow and (intra_op > 0 or inter_op > 0):
+        import tensorflow as tf
+
+        try:
+            if intra_op > 0:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+            if inter_op > 0:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        except RuntimeError:
+            pass
@@ -0,0 +1,78 @@
+import numpy as np
+
+# Storage types of the compact gallery representations
+QUANTIZATIONS = ('none', 'float16', 'int8')
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encode float32 vectors into a compact representation.
+
+    int8 codes are scaled per vector so the largest component maps to 127.
+
+    Args:
+        vectors (np.ndarray): The vectors of shape (N, D).
+        quantization (str): 'none', 'float16' or 'int8'.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The codes of shape (N, D) and the scale of every
+            vector of shape (N,), by which the codes are multiplied to decode them.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {', '.join(QUANTIZATIONS)}")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.ones(len(vectors), dtype=np.float32)
+    if quantization == 'none':
+        return np.ascontiguousarray(vectors), scales
+    if quantization == 'float16':
+        return vectors.astype(np.float16), scales
+
+    peaks = np.abs(vectors).max(axis=1) if vectors.size else np.zeros(len(vectors), dtype=np.float32)
+    scales = np.where(peaks > 0, peaks / 127, 1).astype(np.float32)
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """
+    Decode compact vectors back to approximate float32 vectors.
+
+    Args:
+        codes (np.ndarray): The codes of shape (N, D).
+        scales (np.ndarray): The scale of every vector of shape (N,).
+
+    Returns:
+        np.ndarray: The float32 vectors of shape (N, D).
+    """
+    if codes.dtype == np.float32:
+        return codes
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def score_quantized(codes: np.ndarray, scales: np.ndarray, probe: np.ndarray,
+                    block_size: int = 4096) -> np.ndarray:
+    """
+    Compute the dot products of compact vectors with a float32 probe.
+
+    Codes are widened to float32 one block at a time, so the full-precision copy of the
+    gallery never exists in memory.
+
+    Args:
+        codes (np.ndarray): The codes of shape (N, D).
+        scales (np.ndarray): The scale of every vector of shape (N,).
+        probe (np.ndarray): The probe of shape (D,).
+        block_size (int): The number of vectors widened at once.
+
+    Returns:
+        np.ndarray: The float32 scores of shape (N,).
+    """
+    probe = np.asarray(probe, dtype=np.float32)
+    if codes.dtype == np.float32:
+        return codes @ probe
+
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), block_size):
+        block = codes[start:start + block_size].astype(np.float32)
+        scores[start:start + block_size] = block @ probe
+    return scores * scales
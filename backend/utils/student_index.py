@@ -0,0 +1,556 @@
+import os
+import struct
+import threading
+import numpy as np
+from django.conf import settings
+from filelock import FileLock
+from Management.models import Student
+from facial import FacialRecognition
+from utils.gallery import load_templates
+from utils.embedding_models import FaceNetModel, model_version
+from utils.quantization import dequantize, quantize, score_quantized
+
+
+def fused_templates(feature_lists: list[list[dict]]) -> np.ndarray:
+    """
+    Fuse the stored sides of each student into one template.
+
+    The weighted average cosine similarity of a probe against a student equals the dot
+    product of the normalized probe with the weighted sum of the student's normalized
+    side embeddings, so the fused template scores a student exactly with one dot product.
+
+    Args:
+        feature_lists (list[list[dict]]): The {'side', 'features'} entries per student.
+
+    Returns:
+        np.ndarray: The fused templates of shape (students, dim).
+    """
+    gallery, weights = FacialRecognition.pack_gallery(feature_lists)
+    totals = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+    return np.einsum('nsd,ns->nd', gallery, weights)
+
+
+class StudentIndex:
+    """
+    Inverted-file (IVF) nearest-neighbour index over the fused templates of every student.
+
+    Templates are clustered with spherical k-means; a query only visits the `nprobe`
+    lists whose centroids are closest to the probe and scores their members exactly.
+    Small indexes keep a single list, which makes the search exhaustive.
+
+    Templates can be held as float16 or per-vector-scaled int8 codes, in which case the
+    candidates are scored on the codes and the best `rerank` of them are re-scored
+    exactly against their float32 templates fetched with `fetch_templates`.
+
+    Attributes:
+        ids (np.ndarray): Student IDs in row order.
+        templates (np.ndarray): Fused templates or their codes, shape (N, D).
+        scales (np.ndarray): The scale of the codes of every row, shape (N,).
+        quantization (str): The representation of the templates ('none', 'float16' or 'int8').
+        assignments (np.ndarray): The list each row belongs to, shape (N,).
+        centroids (np.ndarray): The normalized list centroids, shape (L, D).
+        trained_size (int): The number of rows the centroids were trained on.
+        model_version (str): The model that produced the templates.
+    """
+
+    def __init__(self, dim: int = 512, quantization: str = 'none', fetch_templates=None,
+                 model_version: str = FaceNetModel.version) -> None:
+        """
+        Create an empty index.
+
+        Args:
+            dim (int): The dimension of the templates.
+            quantization (str): The representation of the templates ('none', 'float16' or 'int8').
+            fetch_templates (callable): Returns the float32 templates of a list of student
+                IDs as a dict, used to re-rank quantized candidates. Defaults to the database.
+            model_version (str): The model that produced the templates.
+        """
+        self.ids = np.array([], dtype=str)
+        self.quantization = quantization
+        self.templates, self.scales = quantize(np.zeros((0, dim), dtype=np.float32), quantization)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.trained_size = 0
+        self.model_version = model_version
+        self.fetch_templates = fetch_templates or load_templates
+        self.lock = threading.RLock()
+        self._rows = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _reindex_rows(self) -> None:
+        self._rows = {student_id: row for row, student_id in enumerate(self.ids.tolist())}
+
+    def build(self, ids: list[str], templates: np.ndarray) -> None:
+        """
+        Replace the content of the index and train its lists.
+
+        Args:
+            ids (list[str]): The student IDs.
+            templates (np.ndarray): The fused templates, shape (N, D).
+        """
+        with self.lock:
+            self.ids = np.array(ids, dtype=str)
+            self.templates, self.scales = quantize(templates, self.quantization)
+            self._reindex_rows()
+            self.train()
+
+    def train(self, iterations: int = 10, seed: int = 0) -> None:
+        """
+        Cluster the templates into inverted lists with spherical k-means.
+
+        Args:
+            iterations (int): The number of k-means iterations.
+            seed (int): The seed of the centroid initialisation.
+        """
+        with self.lock:
+            count = len(self.ids)
+            min_train = getattr(settings, "FACIAL_INDEX_MIN_TRAIN", 1000)
+            lists = int(np.sqrt(count)) if count >= min_train else 1
+
+            if lists <= 1:
+                self.centroids = np.zeros((1, self.templates.shape[1]), dtype=np.float32)
+                self.assignments = np.zeros(count, dtype=np.int32)
+                self.trained_size = count
+                return
+
+            rng = np.random.default_rng(seed)
+            data = dequantize(self.templates, self.scales)
+            data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+            centroids = data[rng.choice(count, lists, replace=False)]
+
+            for _ in range(iterations):
+                assignments = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, data)
+                sizes = np.bincount(assignments, minlength=lists)
+                # Reseed empty lists with random members
+                empty = sizes == 0
+                sums[empty] = data[rng.choice(count, int(empty.sum()))]
+                centroids = sums / np.maximum(
+                    np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+            self.centroids = centroids.astype(np.float32)
+            self.assignments = np.argmax(data @ self.centroids.T, axis=1).astype(np.int32)
+            self.trained_size = count
+
+    def _assign(self, template: np.ndarray) -> int:
+        if len(self.centroids) == 1:
+            return 0
+        return int(np.argmax(self.centroids @ template))
+
+    def upsert(self, student_id: str, template: np.ndarray) -> None:
+        """
+        Add a student to the index or replace its template.
+
+        Args:
+            student_id (str): The student ID.
+            template (np.ndarray): The fused template of the student.
+        """
+        student_id = str(student_id)
+        template = np.asarray(template, dtype=np.float32)
+        codes, code_scales = quantize(template[None, :], self.quantization)
+        with self.lock:
+            row = self._rows.get(student_id)
+            if row is not None:
+                # New arrays are swapped in, searches keep scoring the ones they started with
+                templates, scales, assignments = (
+                    self.templates.copy(), self.scales.copy(), self.assignments.copy())
+                templates[row] = codes[0]
+                scales[row] = code_scales[0]
+                assignments[row] = self._assign(template)
+                self.templates, self.scales, self.assignments = templates, scales, assignments
+                return
+
+            self.ids = np.append(self.ids, student_id)
+            self.templates = np.vstack([self.templates, codes])
+            self.scales = np.append(self.scales, code_scales)
+            self.assignments = np.append(self.assignments, self._assign(template)).astype(np.int32)
+            self._rows[student_id] = len(self.ids) - 1
+
+            # Retrain once the index has doubled since the lists were built
+            if len(self.ids) >= 2 * max(self.trained_size, 1):
+                self.train()
+
+    def remove(self, student_id: str) -> None:
+        """
+        Remove a student from the index.
+
+        Args:
+            student_id (str): The student ID.
+        """
+        with self.lock:
+            row = self._rows.get(str(student_id))
+            if row is None:
+                return
+            keep = np.arange(len(self.ids)) != row
+            self.ids = self.ids[keep]
+            self.templates = self.templates[keep]
+            self.scales = self.scales[keep]
+            self.assignments = self.assignments[keep]
+            self._reindex_rows()
+
+    def search(self, probe: np.ndarray, k: int = 5, nprobe: int = None,
+               rerank: int = None) -> list[tuple[str, float]]:
+        """
+        Find the students whose templates score highest against a probe.
+
+        Args:
+            probe (np.ndarray): The probe embedding.
+            k (int): The number of candidates to return.
+            nprobe (int): The number of inverted lists to visit.
+            rerank (int): The number of quantized candidates re-scored in float32.
+
+        Returns:
+            list[tuple[str, float]]: Up to k (student ID, weighted similarity) pairs,
+                                     best first.
+        """
+        if nprobe is None:
+            nprobe = getattr(settings, "FACIAL_INDEX_NPROBE", 16)
+        if rerank is None:
+            rerank = getattr(settings, "FACIAL_INDEX_RERANK", 32)
+        probe = np.asarray(probe, dtype=np.float32)
+        probe = probe / np.linalg.norm(probe)
+
+        with self.lock:
+            ids, templates, scales, assignments, centroids = (
+                self.ids, self.templates, self.scales, self.assignments, self.centroids)
+
+        if len(ids) == 0:
+            return []
+
+        if len(centroids) > nprobe:
+            lists = np.argpartition(-(centroids @ probe), nprobe)[:nprobe]
+            rows = np.flatnonzero(np.isin(assignments, lists))
+        else:
+            rows = np.arange(len(ids))
+        if len(rows) == 0:
+            return []
+
+        # Exact scoring of the candidates of the visited lists, on the codes when quantized
+        scores = score_quantized(templates[rows], scales[rows], probe)
+        if self.quantization != 'none':
+            shortlist = min(max(rerank, k), len(rows))
+            top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            rows = rows[top]
+            exact = self.fetch_templates(ids[rows].tolist())
+            scores = np.array([
+                float(np.asarray(exact[student_id], dtype=np.float32) @ probe)
+                if student_id in exact else float(scores[i])
+                for i, student_id in zip(top, ids[rows].tolist())], dtype=np.float32)
+
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(str(ids[rows[i]]), float(scores[i])) for i in top]
+
+    def save(self, path: str) -> None:
+        """
+        Atomically write the index to disk.
+
+        Args:
+            path (str): The destination .npz file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with self.lock:
+            with open(temp_path, 'wb') as file:
+                np.savez(file, ids=self.ids, templates=self.templates, scales=self.scales,
+                         quantization=self.quantization, assignments=self.assignments,
+                         centroids=self.centroids, trained_size=self.trained_size,
+                         model_version=self.model_version)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, fetch_templates=None) -> "StudentIndex":
+        """
+        Read an index written by `save`.
+
+        Args:
+            path (str): The .npz file.
+            fetch_templates (callable): Returns the float32 templates of student IDs.
+
+        Returns:
+            StudentIndex: The loaded index.
+        """
+        with np.load(path) as data:
+            quantization = str(data['quantization']) if 'quantization' in data else 'none'
+            # Indexes saved before model tiers only held FaceNet templates
+            version = str(data['model_version']) if 'model_version' in data else FaceNetModel.version
+            index = cls(dim=data['templates'].shape[1], quantization=quantization,
+                        fetch_templates=fetch_templates, model_version=version)
+            index.ids = data['ids']
+            index.templates = data['templates']
+            index.scales = data['scales'] if 'scales' in data else np.ones(
+                len(index.ids), dtype=np.float32)
+            index.assignments = data['assignments']
+            index.centroids = data['centroids']
+            index.trained_size = int(data['trained_size'])
+        index._reindex_rows()
+        return index
+
+
+_index = None
+_index_stamp = None
+_index_lock = threading.Lock()
+
+# Changes saved after the index, as records appended to '<index>.delta'. The index of this
+# process has applied the delta file of inode `_delta_inode` up to `_delta_offset`, which
+# holds `_delta_records` records.
+_delta_inode = None
+_delta_offset = 0
+_delta_records = 0
+
+# Record header: operation, length of the student ID, length of the template
+_DELTA_HEADER = struct.Struct('<BHI')
+_UPSERT = 1
+_REMOVE = 2
+
+
+def _index_path() -> str:
+    return str(getattr(settings, "FACIAL_INDEX_PATH",
+                       os.path.join(settings.BASE_DIR, 'index', 'students.npz')))
+
+
+def _delta_path(path: str) -> str:
+    return f"{path}.delta"
+
+
+def build_student_index() -> StudentIndex:
+    """
+    Build the index from every enrolled student in the database.
+
+    Returns:
+        StudentIndex: The freshly trained index.
+    """
+    stored_templates = load_templates()
+
+    index = StudentIndex(quantization=getattr(settings, "FACIAL_INDEX_QUANTIZATION", 'none'),
+                         model_version=model_version())
+    if stored_templates:
+        index.build(list(stored_templates), np.stack(list(stored_templates.values())))
+    return index
+
+
+def _file_stamp(path: str):
+    # Every save replaces the file, so a new inode tells a rewrite apart even within one mtime tick
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _delta_state(path: str) -> tuple:
+    # The delta only grows until it is replaced, so its inode and size tell what changed
+    try:
+        stat = os.stat(_delta_path(path))
+    except FileNotFoundError:
+        return None, 0
+    return stat.st_ino, stat.st_size
+
+
+def _index_file_lock(path: str) -> FileLock:
+    # Writers of every process serialize on the lock file, loading the index saved by the
+    # previous writer before changing it. One reentrant lock object per file and process.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return FileLock(f"{path}.lock", is_singleton=True)
+
+
+def _is_current(index: StudentIndex) -> bool:
+    return (index.quantization == getattr(settings, "FACIAL_INDEX_QUANTIZATION", 'none')
+            and index.model_version == model_version())
+
+
+def _save_index(index: StudentIndex, path: str) -> StudentIndex:
+    global _index, _index_stamp, _delta_inode, _delta_offset, _delta_records
+    index.save(path)
+    # The saved index holds every change, so the delta starts over. Replaying the old one after
+    # a crash between both steps would only repeat changes the index already holds.
+    temp_path = f"{_delta_path(path)}.{os.getpid()}.tmp"
+    open(temp_path, 'wb').close()
+    os.replace(temp_path, _delta_path(path))
+    _index = index
+    _index_stamp = _file_stamp(path)
+    _delta_inode, _delta_offset = _delta_state(path)
+    _delta_records = 0
+    return index
+
+
+def _apply_delta(index: StudentIndex, path: str, offset: int) -> tuple[int, int]:
+    """
+    Replay the records appended to the delta of an index since an offset.
+
+    Returns:
+        tuple[int, int]: The offset after the last complete record, and the number of records.
+    """
+    with open(_delta_path(path), 'rb') as delta:
+        delta.seek(offset)
+        data = delta.read()
+
+    position = 0
+    records = 0
+    while position + _DELTA_HEADER.size <= len(data):
+        operation, id_length, dim = _DELTA_HEADER.unpack_from(data, position)
+        start = position + _DELTA_HEADER.size + id_length
+        end = start + 4 * dim
+        if end > len(data):
+            # A record still being written
+            break
+        student_id = data[start - id_length:start].decode()
+        if operation == _UPSERT:
+            index.upsert(student_id, np.frombuffer(data, dtype=np.float32, count=dim, offset=start))
+        else:
+            index.remove(student_id)
+        position = end
+        records += 1
+    return offset + position, records
+
+
+def _append_delta(path: str, student_id: str, template: np.ndarray = None) -> None:
+    """
+    Append a change the index of this process already holds to the delta.
+
+    The caller holds `_index_lock` and the file lock of the index.
+    """
+    global _delta_inode, _delta_offset, _delta_records
+    encoded_id = str(student_id).encode()
+    template = np.asarray(template if template is not None else [], dtype=np.float32)
+    with open(_delta_path(path), 'ab') as delta:
+        delta.write(_DELTA_HEADER.pack(_UPSERT if template.size else _REMOVE, len(encoded_id), template.size))
+        delta.write(encoded_id)
+        delta.write(template.tobytes())
+    _delta_inode, _delta_offset = _delta_state(path)
+    _delta_records += 1
+
+
+def _latest_index(path: str) -> StudentIndex:
+    """
+    Return the index last saved by any process with the changes appended since, building it
+    when it is missing or stale.
+
+    The caller holds `_index_lock` and the file lock of the index.
+    """
+    global _index, _index_stamp, _delta_inode, _delta_offset, _delta_records
+    stamp = _file_stamp(path)
+    if stamp is None:
+        return _save_index(_index if _index is not None else build_student_index(), path)
+
+    inode, size = _delta_state(path)
+    if (_index is None or stamp != _index_stamp
+            or (_delta_inode is not None and inode != _delta_inode)):
+        _index = StudentIndex.load(path)
+        _index_stamp = stamp
+        _delta_offset = 0
+        _delta_records = 0
+    _delta_inode = inode
+
+    # Rebuild an index saved with another representation or model than the configured ones
+    if not _is_current(_index):
+        return _save_index(build_student_index(), path)
+
+    if size > _delta_offset:
+        _delta_offset, records = _apply_delta(_index, path, _delta_offset)
+        _delta_records += records
+    return _index
+
+
+def get_student_index() -> StudentIndex:
+    """
+    Return the process-wide student index.
+
+    The index is read from FACIAL_INDEX_PATH, or built from the database and saved there
+    when the file does not exist, holds another representation than
+    FACIAL_INDEX_QUANTIZATION or templates of another model than the configured tier.
+    It is reloaded whenever another process rewrites the file, and the changes other
+    processes append to its delta are applied as they come.
+
+    Returns:
+        StudentIndex: The student index.
+    """
+    path = _index_path()
+
+    with _index_lock:
+        if (_index is not None and _file_stamp(path) == _index_stamp
+                and _delta_state(path) == (_delta_inode, _delta_offset) and _is_current(_index)):
+            return _index
+
+        with _index_file_lock(path):
+            return _latest_index(path)
+
+
+def rebuild_student_index() -> StudentIndex:
+    """
+    Rebuild the index from the database and replace the saved one.
+
+    Used after writes that bypass model signals, such as bulk enrollment.
+
+    Returns:
+        StudentIndex: The rebuilt index.
+    """
+    path = _index_path()
+    with _index_lock, _index_file_lock(path):
+        return _save_index(build_student_index(), path)
+
+
+def merge_student_index() -> StudentIndex:
+    """
+    Save the index with the changes of its delta, and start a new delta.
+
+    Returns:
+        StudentIndex: The merged index.
+    """
+    path = _index_path()
+    with _index_lock, _index_file_lock(path):
+        return _save_index(_latest_index(path), path)
+
+
+def _merge_due() -> bool:
+    return _delta_records >= getattr(settings, "FACIAL_INDEX_DELTA_MAX", 500)
+
+
+def update_student(student: Student) -> bool:
+    """
+    Insert, refresh or drop a student in the index after its features changed.
+
+    Only the change is appended to the delta of the saved index.
+
+    Args:
+        student (Student): The student whose embeddings changed.
+
+    Returns:
+        bool: Whether the delta reached FACIAL_INDEX_DELTA_MAX records and should be merged.
+    """
+    path = _index_path()
+    with _index_lock, _index_file_lock(path):
+        index = _latest_index(path)
+        # Read under the lock, so the last writer also records the latest embeddings
+        template = load_templates([student.STUDENT_ID]).get(student.STUDENT_ID)
+        if template is not None:
+            index.upsert(student.STUDENT_ID, template)
+        else:
+            index.remove(student.STUDENT_ID)
+        _append_delta(path, student.STUDENT_ID, template)
+        return _merge_due()
+
+
+def remove_student(student_id: str) -> bool:
+    """
+    Drop a deleted student from the index.
+
+    Only the change is appended to the delta of the saved index.
+
+    Args:
+        student_id (str): The ID of the deleted student.
+
+    Returns:
+        bool: Whether the delta reached FACIAL_INDEX_DELTA_MAX records and should be merged.
+    """
+    path = _index_path()
+    with _index_lock, _index_file_lock(path):
+        index = _latest_index(path)
+        index.remove(student_id)
+        _append_delta(path, student_id)
+        return _merge_due()